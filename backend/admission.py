@@ -0,0 +1,218 @@
+# backend/admission.py
+#
+# Admission control for the expensive endpoints (PDF parsing, embedding, LLM
+# analysis, retraining). Each admitted request holds `cost` units of a global
+# capacity until it finishes. Requests that do not fit wait in a per-user FIFO
+# and users are served round-robin, so one user's batch upload cannot starve
+# everyone else. A full queue, or a wait longer than ADMISSION_MAX_WAIT_SECONDS,
+# is answered with 429 and a Retry-After estimate. Chat is never queued here:
+# capping the heavy work keeps CPU and LLM headroom for it, and llm_client.py
+# reserves LLM slots for interactive calls on top of that.
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Optional
+
+from fastapi import Depends, HTTPException, status
+
+import auth, metrics, models
+from config import settings
+
+# Relative cost of one request, in capacity units.
+ENDPOINT_COSTS = {
+    "find_precedents": 4,
+    "summarize": 2,
+    "analyze_contradictions": 3,
+    "retrain": 8,
+    "vector_maintenance": 8,
+}
+# At most one request per user may be queued or running for these.
+EXCLUSIVE_ENDPOINTS = {"retrain", "vector_maintenance"}
+# Starting guess for service time, until requests have been measured.
+DEFAULT_SERVICE_SECONDS = 10.0
+SERVICE_EWMA_WEIGHT = 0.2
+MAX_RETRY_AFTER_SECONDS = 120
+
+
+@dataclass
+class Ticket:
+    user_id: int
+    endpoint: str
+    cost: int
+    enqueued_at: float
+    admitted_at: float = 0.0
+    future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+
+class AdmissionController:
+    """Weighted, per-user fair admission. Runs on the event loop only, so it needs no lock."""
+
+    def __init__(self, capacity: int, per_user_capacity: int, max_queue_per_user: int, max_queue: int,
+                 max_wait_seconds: float, queue_slo_seconds: float):
+        self.capacity = capacity
+        self.per_user_capacity = per_user_capacity
+        self.max_queue_per_user = max_queue_per_user
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.queue_slo_seconds = queue_slo_seconds
+        self._in_use = 0
+        self._user_in_use: Dict[int, int] = defaultdict(int)
+        # Users with waiters, in round-robin order.
+        self._queues: "OrderedDict[int, Deque[Ticket]]" = OrderedDict()
+        self._queued = 0
+        self._queued_cost = 0
+        self._pending: Dict[tuple, int] = defaultdict(int)
+        self._service_seconds: Dict[str, float] = {}
+
+    def cost_of(self, endpoint: str) -> int:
+        return min(ENDPOINT_COSTS.get(endpoint, 1), self.capacity)
+
+    def _fits(self, user_id: int, cost: int) -> bool:
+        if self._in_use + cost > self.capacity:
+            return False
+        # A user's first request always fits their share, whatever its cost.
+        in_use = self._user_in_use[user_id]
+        return in_use == 0 or in_use + cost <= self.per_user_capacity
+
+    def retry_after(self, endpoint: str) -> int:
+        """Seconds until the current backlog has likely drained."""
+        service = self._service_seconds.get(endpoint, DEFAULT_SERVICE_SECONDS)
+        waves = (self._queued_cost + self._in_use) / self.capacity
+        return max(1, min(MAX_RETRY_AFTER_SECONDS, math.ceil(waves * service)))
+
+    def _reject(self, endpoint: str, reason: str, detail: str):
+        metrics.ADMISSION_REQUESTS.inc(endpoint=endpoint, outcome=reason)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(self.retry_after(endpoint))},
+        )
+
+    def check(self, user_id: int, endpoint: str) -> None:
+        """Raises 429 if a request for `endpoint` would be refused right now."""
+        if endpoint in EXCLUSIVE_ENDPOINTS and self._pending[(user_id, endpoint)]:
+            self._reject(endpoint, "duplicate", "This operation is already queued or running for your account.")
+        queue = self._queues.get(user_id)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            self._reject(endpoint, "user_queue_full", "Too many of your requests are waiting. Please retry shortly.")
+        if self._queued >= self.max_queue:
+            self._reject(endpoint, "queue_full", "The server is busy. Please retry shortly.")
+
+    # --- Acquire / Release ---
+    def _admit(self, ticket: Ticket) -> None:
+        self._in_use += ticket.cost
+        self._user_in_use[ticket.user_id] += ticket.cost
+        ticket.admitted_at = time.perf_counter()
+        waited = ticket.admitted_at - ticket.enqueued_at
+        metrics.ADMISSION_QUEUE_SECONDS.observe(waited, endpoint=ticket.endpoint)
+        metrics.ADMISSION_REQUESTS.inc(endpoint=ticket.endpoint, outcome="admitted")
+        if waited > self.queue_slo_seconds:
+            metrics.ADMISSION_SLO_MISSES.inc(endpoint=ticket.endpoint)
+
+    def _dequeue(self, ticket: Ticket) -> None:
+        queue = self._queues.get(ticket.user_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[ticket.user_id]
+        self._queued -= 1
+        self._queued_cost -= ticket.cost
+
+    def _unpend(self, user_id: int, endpoint: str) -> None:
+        key = (user_id, endpoint)
+        self._pending[key] -= 1
+        if not self._pending[key]:
+            del self._pending[key]
+
+    def _dispatch(self) -> None:
+        """Admits waiters round-robin across users, head of each user's queue first."""
+        while self._queues:
+            for user_id, queue in self._queues.items():
+                ticket = queue[0]
+                if self._in_use + ticket.cost > self.capacity:
+                    # Keep the turn: smaller requests from later users must not starve this one.
+                    return
+                if self._fits(user_id, ticket.cost):
+                    break
+            else:
+                return  # Everyone waiting is at their per-user share.
+            self._dequeue(ticket)
+            if user_id in self._queues:
+                self._queues.move_to_end(user_id)
+            if not ticket.future.done():
+                self._admit(ticket)
+                ticket.future.set_result(None)
+
+    async def acquire(self, user_id: int, endpoint: str, bounded_wait: bool = True) -> Ticket:
+        """Waits for capacity; raises 429 if the queues are full or the wait runs out."""
+        self.check(user_id, endpoint)
+        ticket = Ticket(user_id, endpoint, self.cost_of(endpoint), time.perf_counter())
+        if not self._queues and self._fits(user_id, ticket.cost):
+            self._admit(ticket)
+            self._pending[(user_id, endpoint)] += 1
+            return ticket
+
+        ticket.future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        self._queued += 1
+        self._queued_cost += ticket.cost
+        self._pending[(user_id, endpoint)] += 1
+        self._dispatch()
+        try:
+            await asyncio.wait_for(ticket.future, self.max_wait_seconds if bounded_wait else None)
+        except BaseException as e:
+            if ticket.future.done() and not ticket.future.cancelled():
+                self.release(ticket)
+            else:
+                self._dequeue(ticket)
+                self._unpend(user_id, endpoint)
+                self._dispatch()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(endpoint, "timeout", "The server is busy and your request waited too long. Please retry.")
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        self._in_use -= ticket.cost
+        self._user_in_use[ticket.user_id] -= ticket.cost
+        if not self._user_in_use[ticket.user_id]:
+            del self._user_in_use[ticket.user_id]
+        self._unpend(ticket.user_id, ticket.endpoint)
+        elapsed = time.perf_counter() - ticket.admitted_at
+        previous = self._service_seconds.get(ticket.endpoint, elapsed)
+        self._service_seconds[ticket.endpoint] = previous + SERVICE_EWMA_WEIGHT * (elapsed - previous)
+        self._dispatch()
+
+    def snapshot(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self._in_use,
+            "queued": self._queued,
+            "queued_users": len(self._queues),
+            "service_seconds": {k: round(v, 3) for k, v in self._service_seconds.items()},
+        }
+
+
+controller = AdmissionController(
+    capacity=settings.ADMISSION_CAPACITY,
+    per_user_capacity=settings.ADMISSION_PER_USER_CAPACITY,
+    max_queue_per_user=settings.ADMISSION_MAX_QUEUE_PER_USER,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_wait_seconds=settings.ADMISSION_MAX_WAIT_SECONDS,
+    queue_slo_seconds=settings.ADMISSION_QUEUE_SLO_SECONDS,
+)
+
+
+def admit(endpoint: str):
+    """FastAPI dependency that holds an admission ticket for the rest of the request."""
+    async def dependency(current_user: models.User = Depends(auth.get_current_user)):
+        ticket = await controller.acquire(current_user.id, endpoint)
+        try:
+            yield ticket
+        finally:
+            controller.release(ticket)
+    return dependency
@@ -0,0 +1,156 @@
+# backend/analysis_results.py
+#
+# Persisted analysis results. The payload returned by /summarize or
+# /find_precedents is stored per CaseFile, keyed by the content hash of the
+# analyzed document and the version of the pipeline that produced it, and
+# served by GET /users/me/files/{id}/analysis. Responses carry a strong ETag
+# (a revisit with If-None-Match is a 304 after one indexed lookup) and are
+# compressed with brotli when installed, gzip otherwise. Each content-coding
+# is a different representation, so compressed bodies get a suffixed ETag
+# ("<tag>-br", "<tag>-gzip").
+
+import gzip
+import hashlib
+import json
+from typing import Any, Dict, Mapping, Optional
+
+from fastapi import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+import models
+from cache import TTLCache
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available.
+    brotli = None
+
+# Bump when prompts, chunking or response shapes change so old results are not served.
+PIPELINE_REVISION = 1
+COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+_compressed_bodies = TTLCache(maxsize=512, ttl=600, name="compressed_results")
+
+
+def pipeline_version() -> str:
+    """Identifies everything that shapes a result besides the document itself."""
+    mode = "combined" if settings.COMBINED_DOCUMENT_ANALYSIS else "separate"
+    return f"r{PIPELINE_REVISION}/{settings.LLM_MODEL_NAME}/{mode}"
+
+
+def _etag(*parts: str) -> str:
+    digest = hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+# --- Storage ---
+async def save_result(
+    db: AsyncSession,
+    case_file_id: int,
+    user_id: int,
+    document_sha256: str,
+    kind: str,
+    payload: Dict[str, Any],
+) -> str:
+    """Stores an endpoint's payload for a case file and returns its ETag."""
+    result = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+    version = pipeline_version()
+    etag = _etag(kind, document_sha256, version, result)
+    db.add(models.AnalysisResult(
+        case_file_id=case_file_id, owner_id=user_id, kind=kind, document_sha256=document_sha256,
+        pipeline_version=version, etag=etag, result=result,
+    ))
+    await db.commit()
+    return etag
+
+
+async def get_current_result(db: AsyncSession, case_file_id: int, user_id: int) -> Optional[models.AnalysisResult]:
+    """The newest result for a user's case file made by the current pipeline version."""
+    result = await db.execute(
+        select(models.AnalysisResult)
+        .filter(
+            models.AnalysisResult.case_file_id == case_file_id,
+            models.AnalysisResult.owner_id == user_id,
+            models.AnalysisResult.pipeline_version == pipeline_version(),
+        )
+        .order_by(models.AnalysisResult.id.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+# --- HTTP ---
+ENCODINGS = ("br", "gzip")
+
+
+def representation_etag(etag: str, encoding: Optional[str]) -> str:
+    """The stored (identity) ETag, suffixed with the content-coding of a compressed body."""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if the client holds any coding of the stored result."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    current = {etag} | {representation_etag(etag, encoding) for encoding in ENCODINGS}
+    # Weak comparison, as If-None-Match requires.
+    return "*" in candidates or any(tag.removeprefix("W/") in current for tag in candidates)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Picks br or gzip from an Accept-Encoding header (honouring q=0), or None for identity."""
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str, etag: str) -> bytes:
+    key = (etag, encoding)
+    compressed = _compressed_bodies.get(key)
+    if compressed is None:
+        if encoding == "br":
+            compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+        else:
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        _compressed_bodies.set(key, compressed)
+    return compressed
+
+
+def result_response(stored: models.AnalysisResult, headers: Mapping[str, str]) -> Response:
+    """200 with the (compressed) result, or 304 when the client's copy is current."""
+    body = (
+        f'{{"case_file_id":{stored.case_file_id},"kind":{json.dumps(stored.kind)},'
+        f'"document_sha256":{json.dumps(stored.document_sha256)},"pipeline_version":{json.dumps(stored.pipeline_version)},'
+        f'"created_at":{json.dumps(stored.created_at.isoformat() if stored.created_at else None)},"result":{stored.result}}}'
+    ).encode("utf-8")
+    encoding = negotiate_encoding(headers.get("accept-encoding")) if len(body) >= COMPRESSION_MIN_BYTES else None
+    cache_headers = {
+        "ETag": representation_etag(stored.etag, encoding),
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding, Authorization",
+    }
+    if etag_matches(headers.get("if-none-match"), stored.etag):
+        return Response(status_code=304, headers=cache_headers)
+    if encoding:
+        body = _compress(body, encoding, stored.etag)
+        cache_headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=cache_headers)
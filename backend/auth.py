@@ -2,12 +2,18 @@
 
 import schemas
 import crud
-from database import SessionLocal
+import models
+from database import get_db
+from cache import principal_cache
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from jose import JWTError, jwt
 import bcrypt 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
 # --- UPDATED: Import the single settings object ---
@@ -22,11 +28,52 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password_bytes, hashed_password_bytes)
 
 def get_password_hash(password: str) -> str:
-    """Hashes a plain password using bcrypt."""
+    """Hashes a plain password using bcrypt with the configured work factor."""
     password_bytes = password.encode('utf-8')
-    hashed_bytes = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+    hashed_bytes = bcrypt.hashpw(password_bytes, bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS))
     return hashed_bytes.decode('utf-8')
 
+def needs_rehash(hashed_password: str) -> bool:
+    """True if a bcrypt hash was made with a different work factor than the configured one."""
+    try:
+        # Hashes look like "$2b$12$<salt+hash>"; the third field is the cost.
+        return int(hashed_password.split('$')[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+# --- Password Hashing Pool ---
+# bcrypt is deliberately slow and releases the GIL, so hashing runs on a small
+# dedicated pool instead of the event loop. Jobs beyond the queue limit are
+# rejected with a 503 rather than piling up behind each other.
+_hash_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_pending_hash_jobs = 0
+
+async def _run_hash_job(func, *args):
+    global _pending_hash_jobs
+    if _pending_hash_jobs >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_MAX_QUEUE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The server is busy processing logins. Please try again shortly.",
+            headers={"Retry-After": "1"},
+        )
+    _pending_hash_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _pending_hash_jobs -= 1
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Runs verify_password on the hashing pool."""
+    return await _run_hash_job(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Runs get_password_hash on the hashing pool."""
+    return await _run_hash_job(get_password_hash, password)
+
+def shutdown_hash_executor() -> None:
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+
 def create_access_token(data: dict):
     """Creates a new JWT access token."""
     to_encode = data.copy()
@@ -41,8 +88,21 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    """Decodes a JWT token and retrieves the user from the database."""
+def _snapshot_user(user: models.User) -> dict:
+    """Copies a user's column values so they can outlive the session."""
+    return {column.key: getattr(user, column.key) for column in models.User.__table__.columns}
+
+async def _user_from_snapshot(db: AsyncSession, snapshot: dict) -> models.User:
+    """Attaches a cached user to the request's session without querying the database."""
+    user = models.User(**snapshot)
+    make_transient_to_detached(user)
+    return await db.merge(user, load=False)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    """
+    Decodes a JWT token and returns the user, bound to the request's session.
+    Users are served from a short-lived principal cache when possible.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -57,9 +117,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         token_data = schemas.TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    
-    async with SessionLocal() as db:
-        user = await crud.get_user_by_username(db, username=token_data.username)
-        if user is None:
-            raise credentials_exception
-        return user
\ No newline at end of file
+
+    snapshot = principal_cache.get(token_data.username)
+    if snapshot is not None:
+        return await _user_from_snapshot(db, snapshot)
+
+    user = await crud.get_user_by_username(db, username=token_data.username)
+    if user is None:
+        raise credentials_exception
+    principal_cache.set(token_data.username, _snapshot_user(user))
+    return user
+
+async def get_current_admin(current_user: models.User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """The current user if they hold an AdminGrant (see manage_admins.py); 403 otherwise."""
+    if await db.get(models.AdminGrant, current_user.id) is None:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required.")
+    return current_user
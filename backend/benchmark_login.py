@@ -0,0 +1,89 @@
+# backend/benchmark_login.py
+#
+# Measures password-verification throughput and event-loop responsiveness
+# for the login path, with bcrypt run inline (old behaviour) or on the
+# hashing pool (auth.verify_password_async).
+#
+# Usage: python benchmark_login.py [--logins 200] [--concurrency 50] [--rounds 12]
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import bcrypt
+from fastapi import HTTPException
+
+import auth
+from config import settings
+
+
+async def _measure_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Returns the worst delay seen between scheduled ticks of the event loop."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def _run(mode: str, hashed: str, logins: int, concurrency: int) -> dict:
+    gate = asyncio.Semaphore(concurrency)
+    latencies = []
+    rejected = 0
+
+    async def one_login():
+        nonlocal rejected
+        async with gate:
+            start = time.perf_counter()
+            try:
+                if mode == "inline":
+                    ok = auth.verify_password("benchmark-password", hashed)
+                else:
+                    ok = await auth.verify_password_async("benchmark-password", hashed)
+                assert ok
+            except HTTPException:
+                rejected += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(_measure_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one_login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    worst_lag = await lag_task
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "logins_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        "rejected_503": rejected,
+        "max_loop_lag_ms": worst_lag * 1000,
+    }
+
+
+async def main(logins: int, concurrency: int, rounds: int):
+    settings.BCRYPT_ROUNDS = rounds
+    hashed = bcrypt.hashpw(b"benchmark-password", bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+    print(f"bcrypt rounds={rounds}, pool workers={settings.PASSWORD_HASH_WORKERS}, "
+          f"queue limit={settings.PASSWORD_HASH_MAX_QUEUE}, logins={logins}, concurrency={concurrency}")
+    for mode in ("inline", "pool"):
+        result = await _run(mode, hashed, logins, concurrency)
+        print(f"{result['mode']:>6}: {result['logins_per_sec']:8.1f} logins/s  "
+              f"p50 {result['p50_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+              f"max loop lag {result['max_loop_lag_ms']:7.1f} ms  503s {result['rejected_503']}")
+    auth.shutdown_hash_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark login password verification.")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=settings.BCRYPT_ROUNDS)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.rounds))
@@ -0,0 +1,389 @@
+# backend/benchmark_suite.py
+#
+# Offline end-to-end benchmarks. Everything runs locally against a synthetic
+# legal corpus (synthetic_corpus.py) and the stub LLM backend, in a scratch
+# directory, so results are comparable between runs and branches:
+#
+#   pdf    PDF text extraction, pages/sec
+#   chunk  chunking + embedding, docs/sec
+#   chunkers  legal_chunker vs. the old RecursiveCharacterTextSplitter:
+#          docs/sec, chunk token lengths, mid-paragraph cuts and
+#          same-topic retrieval precision@5/MRR
+#   query  collection.query p50/p99 at several index sizes
+#   http   /find_precedents latency with N concurrent users, through the
+#          ASGI app in-process (no network, no Gemini)
+#
+# The embedding model must already be in the local Hugging Face cache.
+#
+# Usage: python benchmark_suite.py [--sections pdf,chunk,query,http] [--output report.json]
+#                                  [--baseline previous.json] [--fail-on-regression]
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SECTIONS = ("pdf", "chunk", "chunkers", "query", "http")
+MODEL_MAX_TOKENS = 256
+EMBEDDING_DIM = 384
+CHROMA_MAX_BATCH = 5000
+
+
+def _latency_summary(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean of samples given in seconds, reported in milliseconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    return {
+        "p50_ms": round(pick(0.50), 3),
+        "p95_ms": round(pick(0.95), 3),
+        "p99_ms": round(pick(0.99), 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def _configure_environment(args, workdir: str) -> None:
+    """Points settings, the database and the stub LLM at the scratch directory (before app imports)."""
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ["LLM_STUB_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["LLM_REQUESTS_PER_MINUTE"] = str(args.llm_rpm)
+    os.environ["LLM_BURST"] = str(args.llm_rpm)
+    os.environ["WARMUP_CHROMA_STORES"] = "0"
+
+
+# --- Sections ---
+def bench_pdf(args, workdir: str) -> Dict:
+    import uploads
+    from synthetic_corpus import generate_corpus, render_pdf
+
+    paths, pages = [], 0
+    for case in generate_corpus(args.pdf_docs, seed=args.seed, paragraphs=30):
+        pdf = render_pdf(case.text)
+        pages += pdf.count(b"/Type /Page ")
+        path = os.path.join(workdir, case.filename.replace(".txt", ".pdf"))
+        with open(path, "wb") as f:
+            f.write(pdf)
+        paths.append(path)
+
+    start = time.perf_counter()
+    extracted = sum(len(uploads.extract_text_from_path(path, "application/pdf")) for path in paths)
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": len(paths),
+        "pages": pages,
+        "pages_per_sec": round(pages / elapsed, 2),
+        "chars_extracted": extracted,
+    }
+
+
+def bench_chunk_embed(args) -> Dict:
+    import legal_chunker, startup
+    from synthetic_corpus import generate_corpus
+
+    corpus = generate_corpus(args.embed_docs, seed=args.seed)
+    splitter = legal_chunker.get_chunker()
+    model = startup.sentence_transformer_cls()("all-MiniLM-L6-v2")
+    model.encode(["warm-up"])
+
+    start = time.perf_counter()
+    chunks_per_doc = [splitter.split_text(case.text) for case in corpus]
+    chunk_seconds = time.perf_counter() - start
+    all_chunks = [chunk for chunks in chunks_per_doc for chunk in chunks]
+    start = time.perf_counter()
+    model.encode(all_chunks, batch_size=64)
+    embed_seconds = time.perf_counter() - start
+    return {
+        "documents": len(corpus),
+        "chunks": len(all_chunks),
+        "chunk_docs_per_sec": round(len(corpus) / chunk_seconds, 2),
+        "embed_chunks_per_sec": round(len(all_chunks) / embed_seconds, 2),
+        "docs_per_sec": round(len(corpus) / (chunk_seconds + embed_seconds), 2),
+    }
+
+
+def _chunk_spans(text: str, chunks: List[str]) -> List[Tuple[int, int]]:
+    """Offsets of splitter output in the source text (the LangChain splitter does not report them)."""
+    spans, cursor = [], 0
+    for chunk in chunks:
+        start = text.find(chunk, max(cursor - len(chunk), 0))
+        start = start if start >= 0 else cursor
+        spans.append((start, start + len(chunk)))
+        cursor = start + len(chunk)
+    return spans
+
+
+def bench_chunkers(args) -> Dict:
+    import numpy as np
+    import legal_chunker, startup
+    from synthetic_corpus import generate_case, generate_corpus
+
+    corpus = generate_corpus(args.embed_docs, seed=args.seed, paragraphs=30)
+    rng = random.Random(args.seed + 1)
+    queries = [generate_case(rng, 900_000 + i) for i in range(args.chunker_queries)]
+    model = startup.sentence_transformer_cls()("all-MiniLM-L6-v2")
+    count_tokens = legal_chunker.tokenizer_counter(model.tokenizer)
+    query_embeddings = model.encode([q.text for q in queries], batch_size=64, normalize_embeddings=True)
+
+    chunkers = {
+        "recursive_1500_200": startup.text_splitter_cls()(chunk_size=1500, chunk_overlap=200, length_function=len).split_text,
+        "legal": legal_chunker.get_chunker().split_text,
+    }
+    results = {}
+    for name, split_text in chunkers.items():
+        start = time.perf_counter()
+        chunks_per_doc = [split_text(case.text) for case in corpus]
+        elapsed = time.perf_counter() - start
+
+        chunk_texts, chunk_topics, chunk_files, token_counts, mid_paragraph = [], [], [], [], 0
+        for case, chunks in zip(corpus, chunks_per_doc):
+            for chunk_start, _ in _chunk_spans(case.text, chunks):
+                mid_paragraph += chunk_start > 0 and case.text[chunk_start - 1] != "\n"
+            for chunk in chunks:
+                chunk_texts.append(chunk)
+                chunk_files.append(case.filename)
+                chunk_topics.append(case.topic)
+                token_counts.append(count_tokens(chunk))
+
+        embeddings = model.encode(chunk_texts, batch_size=64, normalize_embeddings=True)
+        precision, reciprocal_ranks = 0.0, 0.0
+        for query, embedding in zip(queries, query_embeddings):
+            ranked, seen = [], set()
+            for row in np.argsort(-(embeddings @ embedding)):
+                if chunk_files[row] not in seen:
+                    seen.add(chunk_files[row])
+                    ranked.append(chunk_topics[row])
+                    if len(ranked) == 10:
+                        break
+            precision += sum(topic == query.topic for topic in ranked[:5]) / 5
+            first = next((i for i, topic in enumerate(ranked) if topic == query.topic), None)
+            reciprocal_ranks += 0.0 if first is None else 1 / (first + 1)
+
+        results[name] = {
+            "chunk_docs_per_sec": round(len(corpus) / elapsed, 2),
+            "chunks": len(chunk_texts),
+            "mean_tokens": round(statistics.fmean(token_counts), 1),
+            "total_tokens": sum(token_counts),
+            "chunks_over_model_limit": sum(count > MODEL_MAX_TOKENS - 2 for count in token_counts),
+            "chunks_starting_mid_paragraph": mid_paragraph,
+            "precision_at_5": round(precision / len(queries), 4),
+            "mrr": round(reciprocal_ranks / len(queries), 4),
+        }
+    return results
+
+
+def bench_query(args, workdir: str) -> Dict:
+    import numpy as np
+    import startup
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for size in args.index_sizes:
+        client = startup.chromadb().PersistentClient(path=os.path.join(workdir, f"chroma_{size}"))
+        collection = client.get_or_create_collection(name=f"bench_{size}", embedding_function=None)
+        vectors = rng.standard_normal((size, EMBEDDING_DIM)).astype("float32")
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        start = time.perf_counter()
+        for offset in range(0, size, CHROMA_MAX_BATCH):
+            batch = vectors[offset:offset + CHROMA_MAX_BATCH]
+            collection.add(
+                ids=[f"doc{(offset + i) // 10}-chunk-{(offset + i) % 10}" for i in range(len(batch))],
+                embeddings=batch.tolist(),
+                metadatas=[{"filename": f"doc{(offset + i) // 10}"} for i in range(len(batch))],
+            )
+        build_seconds = time.perf_counter() - start
+
+        queries = rng.standard_normal((args.queries, EMBEDDING_DIM)).astype("float32")
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            collection.query(query_embeddings=[query.tolist()], n_results=10)
+            latencies.append(time.perf_counter() - start)
+        results[str(size)] = {"chunks": size, "build_chunks_per_sec": round(size / build_seconds, 2), **_latency_summary(latencies)}
+    return results
+
+
+async def _signup_and_login(client, username: str) -> str:
+    password = "benchmark-password"
+    await client.post("/signup", json={"username": username, "full_name": "Benchmark User", "age": 30, "password": password})
+    response = await client.post("/login", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def _upload(client, token: str, case) -> Tuple[int, float]:
+    start = time.perf_counter()
+    response = await client.post(
+        "/find_precedents",
+        headers={"Authorization": f"Bearer {token}"},
+        files={"file": (case.filename, case.text.encode("utf-8"), "text/plain")},
+    )
+    return response.status_code, time.perf_counter() - start
+
+
+async def _bench_http(args, workdir: str) -> Dict:
+    import httpx
+    import global_corpus, main, storage
+    from synthetic_corpus import generate_case
+
+    storage.DOCUMENTS_PATH = main.DOCUMENTS_PATH = os.path.join(workdir, "case_documents")
+    storage.BLOBS_PATH = os.path.join(storage.DOCUMENTS_PATH, "blobs")
+    main.USER_CHROMA_PATH = os.path.join(workdir, "user_chroma_dbs")
+    global_corpus.GLOBAL_CORPUS_PATH = os.path.join(workdir, "global_corpus")
+
+    rng = random.Random(args.seed)
+    async with main.app.router.lifespan_context(main.app):
+        await main._warmup_task
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=600) as client:
+            tokens = [await _signup_and_login(client, f"bench_user_{i}") for i in range(args.users)]
+            # Give every user a small library to retrieve precedents from.
+            for user_index, token in enumerate(tokens):
+                for doc_index in range(args.seed_docs):
+                    await _upload(client, token, generate_case(rng, user_index * 1000 + doc_index))
+
+            latencies, statuses = [], {}
+
+            async def user_session(user_index: int, token: str):
+                for request_index in range(args.requests_per_user):
+                    case = generate_case(rng, 500_000 + user_index * 1000 + request_index)
+                    status_code, elapsed = await _upload(client, token, case)
+                    statuses[str(status_code)] = statuses.get(str(status_code), 0) + 1
+                    if status_code == 200:
+                        latencies.append(elapsed)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(user_session(i, token) for i, token in enumerate(tokens)))
+            elapsed = time.perf_counter() - start
+    return {
+        "concurrent_users": args.users,
+        "requests": sum(statuses.values()),
+        "status_codes": statuses,
+        "requests_per_sec": round(sum(statuses.values()) / elapsed, 3),
+        "llm_stub_latency_ms": args.llm_latency_ms,
+        **_latency_summary(latencies),
+    }
+
+
+# --- Report ---
+def _metadata(args) -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+    }
+
+
+def _flatten(data: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare_reports(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Prints per-metric changes; returns the metrics that regressed by more than `threshold`."""
+    now, before = _flatten(current["results"]), _flatten(baseline.get("results", {}))
+    regressions = []
+    print(f"\n{'metric':55} {'baseline':>12} {'current':>12} {'change':>9}")
+    for key in sorted(set(now) & set(before)):
+        if key.endswith("_per_sec"):
+            higher_is_better = True
+        elif key.endswith("_ms"):
+            higher_is_better = False
+        else:
+            continue
+        old, new = before[key], now[key]
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        if flag:
+            regressions.append(key)
+        print(f"{key:55} {old:12.2f} {new:12.2f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for ingestion, retrieval and request latency.")
+    parser.add_argument("--sections", default=",".join(SECTIONS), help=f"Comma-separated subset of {', '.join(SECTIONS)}.")
+    parser.add_argument("--output", default="benchmark_report.json")
+    parser.add_argument("--baseline", help="Previous report to diff against.")
+    parser.add_argument("--regression-threshold", type=float, default=0.10)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--pdf-docs", type=int, default=50)
+    parser.add_argument("--embed-docs", type=int, default=100)
+    parser.add_argument("--chunker-queries", type=int, default=60)
+    parser.add_argument("--index-sizes", type=lambda s: [int(x) for x in s.split(",")], default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--seed-docs", type=int, default=5)
+    parser.add_argument("--requests-per-user", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=int, default=300)
+    parser.add_argument("--llm-rpm", type=int, default=60000)
+    args = parser.parse_args()
+
+    sections = [s.strip() for s in args.sections.split(",") if s.strip()]
+    unknown = set(sections) - set(SECTIONS)
+    if unknown:
+        parser.error(f"unknown sections: {', '.join(sorted(unknown))}")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="nyay-bench-") as workdir:
+        _configure_environment(args, workdir)
+        if "pdf" in sections:
+            print("Benchmarking PDF extraction...")
+            results["pdf_extraction"] = bench_pdf(args, workdir)
+        if "chunk" in sections:
+            print("Benchmarking chunking + embedding...")
+            results["chunk_embed"] = bench_chunk_embed(args)
+        if "chunkers" in sections:
+            print("Comparing chunkers...")
+            results["chunkers"] = bench_chunkers(args)
+        if "query" in sections:
+            print("Benchmarking collection.query...")
+            results["vector_query"] = bench_query(args, workdir)
+        if "http" in sections:
+            print(f"Benchmarking /find_precedents with {args.users} concurrent users...")
+            results["find_precedents"] = asyncio.run(_bench_http(args, workdir))
+
+    report = {"meta": _metadata(args), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_reports(report, json.load(f), args.regression_threshold)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed by more than {args.regression_threshold:.0%}.")
+            if args.fail_on_regression:
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# backend/cache.py
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import metrics
+
+class TTLCache:
+    """
+    A small, thread-safe, in-memory cache with a per-entry time-to-live
+    and a maximum size. The least recently used entry is evicted first.
+    Lookups are counted in metrics.CACHE_REQUESTS under `name`.
+    """
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0, name: str = "default"):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] < time.monotonic():
+                del self._data[key]
+                item = None
+            if item is not None:
+                self._data.move_to_end(key)
+        metrics.CACHE_REQUESTS.inc(cache=self.name, result="miss" if item is None else "hit")
+        return default if item is None else item[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+# --- Shared cache instances ---
+# Authenticated users keyed by JWT subject (username). Entries are column
+# snapshots, so they must be dropped whenever a user's row changes.
+PRINCIPAL_CACHE_TTL_SECONDS = 60
+principal_cache = TTLCache(maxsize=10000, ttl=PRINCIPAL_CACHE_TTL_SECONDS, name="principals")
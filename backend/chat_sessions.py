@@ -0,0 +1,103 @@
+# backend/chat_sessions.py
+#
+# Server-side chat sessions. History lives here instead of being re-sent by
+# the client on every turn; once it grows past a token budget the oldest turns
+# are folded into a rolling summary so the prompt size per turn stays bounded.
+
+import asyncio
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cache import TTLCache
+
+SESSION_TTL_SECONDS = 30 * 60
+MAX_SESSIONS = 5000
+HISTORY_TOKEN_BUDGET = 2000
+KEEP_RECENT_MESSAGES = 6
+
+# Sent once as the model's system instruction (see main.lifespan), never per turn.
+SYSTEM_INSTRUCTION = """
+You are Nyay AI, an expert legal assistant. Your primary goal is to determine the user's intent and respond in a specific JSON format.
+When providing answers, use Markdown formatting (like lists, bolding with **, italics with *) to improve readability.
+
+1. If the user's intent is to **"navigate"** to a feature, you MUST identify the correct page from the list below.
+   Match the user's request (even with typos) to the closest feature.
+   - User wants to summarize, get a brief, or an overview -> "page": "/summarize"
+   - User wants to find precedents, similar cases, or historical cases -> "page": "/precedents"
+   - User wants to analyze evidence, find contradictions, or see conflicts -> "page": "/evidence"
+   - User wants to personalize, retrain, or update the AI -> "page": "/personalize"
+   - User wants to see their dashboard or home page -> "page": "/"
+
+   Your JSON response for navigation MUST be:
+   {"response_type": "navigate", "page": "/path/to/page", "answer": "A helpful confirmation message."}
+   Example: {"response_type": "navigate", "page": "/precedents", "answer": "Certainly, I'll take you to the Precedent Analysis page."}
+
+2. If the user's intent is to **"answer"** a general question or a question about the provided document context, provide a direct answer.
+   Your JSON response for answering MUST be:
+   {"response_type": "answer", "answer": "Your detailed answer goes here."}
+
+**IMPORTANT**: If the user's request is ambiguous or does not clearly match a navigation feature, you MUST default to the "answer" intent. Do not guess a page.
+Always respond with a single, raw JSON object and nothing else.
+"""
+
+Summarizer = Callable[[str, List[Dict]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class ChatSession:
+    session_id: str
+    user_id: int
+    case_file_id: Optional[int] = None
+    summary: str = ""
+    messages: List[Dict] = field(default_factory=list)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+    def history_tokens(self) -> int:
+        return estimate_tokens(self.summary) + sum(
+            estimate_tokens(part) for msg in self.messages for part in msg["parts"]
+        )
+
+    def add_turn(self, question: str, reply: str) -> None:
+        self.messages.append({"role": "user", "parts": [question]})
+        self.messages.append({"role": "model", "parts": [reply]})
+
+    async def compact(self, summarizer: Summarizer) -> None:
+        """Folds all but the most recent messages into the rolling summary if over budget."""
+        if self.history_tokens() <= HISTORY_TOKEN_BUDGET or len(self.messages) <= KEEP_RECENT_MESSAGES:
+            return
+        older, recent = self.messages[:-KEEP_RECENT_MESSAGES], self.messages[-KEEP_RECENT_MESSAGES:]
+        try:
+            self.summary = await summarizer(self.summary, older)
+        except Exception as e:
+            print(f"Chat history summarization failed, keeping a truncated digest instead: {e}")
+            digest = " ".join(f"{msg['role']}: {' '.join(msg['parts'])[:200]}" for msg in older)
+            self.summary = (self.summary + " " + digest)[-HISTORY_TOKEN_BUDGET * 2:]
+        self.messages = recent
+
+
+class ChatSessionStore:
+    """Per-user chat sessions with TTL eviction; each access refreshes the TTL."""
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, maxsize: int = MAX_SESSIONS):
+        self._sessions = TTLCache(maxsize=maxsize, ttl=ttl, name="chat_sessions")
+
+    def get_or_create(self, user_id: int, session_id: Optional[str], case_file_id: Optional[int]) -> ChatSession:
+        session = self._sessions.get((user_id, session_id)) if session_id else None
+        if session is None or session.case_file_id != case_file_id:
+            session = ChatSession(session_id=uuid.uuid4().hex, user_id=user_id, case_file_id=case_file_id)
+        self.touch(session)
+        return session
+
+    def touch(self, session: ChatSession) -> None:
+        self._sessions.set((session.user_id, session.session_id), session)
+
+    def delete(self, user_id: int, session_id: str) -> None:
+        self._sessions.pop((user_id, session_id))
+
+
+chat_sessions = ChatSessionStore()
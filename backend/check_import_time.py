@@ -0,0 +1,90 @@
+# backend/check_import_time.py
+#
+# Import-time budget check for CI. Imports `main` in fresh interpreters,
+# fails if the median wall time exceeds the budget or if any of the heavy
+# libraries in startup.HEAVY_MODULES were pulled in eagerly, and prints the
+# slowest imports (from `python -X importtime`) to help find regressions.
+#
+# Usage: python check_import_time.py [--budget-ms 1500] [--runs 5]
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from startup import HEAVY_MODULES
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUDGET_MS = 1500
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+heavy = [name for name in json.loads(sys.argv[1]) if name in sys.modules]
+print(json.dumps({"elapsed_ms": elapsed * 1000, "heavy": heavy}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    # Settings only needs a signing key to import; no real secrets are used.
+    env.setdefault("SECRET_KEY", "import-time-check")
+    return env
+
+
+def measure_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, json.dumps(HEAVY_MODULES)],
+        cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit: int = 10):
+    """Returns (cumulative_ms, module) for the slowest imports of `main`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=_env(), capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+)\s+\|\s+(.+)$", line)
+        if match:
+            rows.append((int(match.group(1)) / 1000, match.group(2).strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail if importing main.py is too slow or too heavy.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    median_ms = statistics.median(sample["elapsed_ms"] for sample in samples)
+    heavy = sorted({name for sample in samples for name in sample["heavy"]})
+
+    print(f"import main: median {median_ms:.0f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    print("Slowest imports (cumulative ms):")
+    for cumulative_ms, module in slowest_imports():
+        print(f"  {cumulative_ms:8.1f}  {module}")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: heavy modules imported eagerly: {', '.join(heavy)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: import time {median_ms:.0f} ms exceeds the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,8 +12,62 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
 
-    # API Keys from the .env file
-    GEMINI_API_KEY: str
+    # Password hashing: bcrypt work factor and the size of the hashing pool.
+    # Changing BCRYPT_ROUNDS rehashes existing passwords on their next login.
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # Uploads larger than this are rejected while they are being streamed to disk.
+    MAX_UPLOAD_MB: int = 50
+
+    # Shared LLM client: "gemini", or "stub" for offline load tests (canned answers).
+    LLM_BACKEND: str = "gemini"
+    LLM_MODEL_NAME: str = "gemini-flash-latest"
+    LLM_REQUESTS_PER_MINUTE: float = 60
+    LLM_BURST: int = 10
+    LLM_MAX_CONCURRENCY: int = 8
+    LLM_PER_USER_CONCURRENCY: int = 2
+    LLM_MAX_RETRIES: int = 4
+    # A second, identical request is sent if the first has not answered by then (0 disables).
+    LLM_HEDGE_AFTER_SECONDS: float = 20.0
+    LLM_STUB_LATENCY_MS: int = 200
+    # LLM slots only interactive calls (chat) may use, so ingestion cannot take them all.
+    LLM_INTERACTIVE_RESERVE: int = 2
+
+    # Admission control for /summarize, /find_precedents, /analyze_contradictions
+    # and retraining (see admission.py). Capacity is in cost units.
+    ADMISSION_CAPACITY: int = 8
+    ADMISSION_PER_USER_CAPACITY: int = 4
+    ADMISSION_MAX_QUEUE_PER_USER: int = 10
+    ADMISSION_MAX_QUEUE: int = 100
+    ADMISSION_MAX_WAIT_SECONDS: float = 60.0
+    ADMISSION_QUEUE_SLO_SECONDS: float = 5.0
+
+    # One LLM call per upload for brief, entities, search queries and suggested
+    # questions; False falls back to a separate call for each.
+    COMBINED_DOCUMENT_ANALYSIS: bool = True
+
+    # Query-time re-ranking from precedent feedback (feedback_adapter.py), applied
+    # on top of the base or fine-tuned embeddings.
+    FEEDBACK_RERANKING: bool = True
+
+    # Profiling (admin-only /admin/profiling endpoints; admins are granted with
+    # manage_admins.py). A stall threshold of 0 disables the watchdog;
+    # 0 slow-request profiles disables per-request sampling.
+    # No longer grants anything (a bare username match let anyone who signed up
+    # with a listed name in); only accepted so existing .env files still load.
+    ADMIN_USERNAMES: str = ""
+    LOOP_STALL_THRESHOLD_MS: int = 100
+    SLOW_REQUEST_PROFILES: int = 5
+    SLOW_REQUEST_SAMPLE_MS: int = 20
+
+    # Number of recently active users whose vector stores are opened at startup.
+    WARMUP_CHROMA_STORES: int = 5
+
+    # API Keys from the .env file. Without a Gemini key the server still starts
+    # (e.g. for tests or benchmarks), but AI features report as not configured.
+    GEMINI_API_KEY: Optional[str] = None
     HF_API_TOKEN: Optional[str] = None # Making this optional as it's not used yet
 
     # Pydantic-settings configuration
@@ -3,9 +3,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func
+from sqlalchemy import func, and_, or_, literal, String, delete
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+import base64
+import json
 import models
 import schemas
+import stats
+from cache import principal_cache
 
 async def get_user_by_username(db: AsyncSession, username: str):
     """
@@ -44,17 +50,165 @@ async def get_user_files(db: AsyncSession, user_id: int):
     return result.scalars().all()
 
 
-async def create_user_case_file(db: AsyncSession, filename: str, user_id: int):
+# --- Keyset pagination for case file listings ---
+CASE_FILE_FIELDS = ("id", "filename", "upload_date", "owner_id")
+
+def encode_file_cursor(upload_date: datetime, file_id: int) -> str:
+    """Encodes the (upload_date, id) of the last row on a page as an opaque cursor."""
+    raw = json.dumps({"d": upload_date.isoformat(), "i": file_id})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_file_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decodes a cursor produced by encode_file_cursor. Raises ValueError if malformed."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(data["d"]), int(data["i"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+def _upload_date_bound(db: AsyncSession, upload_date: datetime):
+    """
+    SQLite stores server_default timestamps as 'YYYY-MM-DD HH:MM:SS' text, while
+    SQLAlchemy binds datetimes with microseconds. Bind the exact stored form so
+    equal timestamps compare equal and the id tie-breaker works.
+    """
+    if db.bind is not None and db.bind.dialect.name == "sqlite":
+        fmt = "%Y-%m-%d %H:%M:%S.%f" if upload_date.microsecond else "%Y-%m-%d %H:%M:%S"
+        return literal(upload_date.strftime(fmt), String)
+    return upload_date
+
+async def get_user_files_page(
+    db: AsyncSession,
+    user_id: int,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    search: Optional[str] = None,
+    fields: Optional[Sequence[str]] = None,
+):
+    """
+    Fetches one page of a user's case files, newest first, using keyset
+    pagination on (upload_date, id). Only the requested columns are loaded.
+    Returns (rows as dicts, next_cursor or None).
+    """
+    fields = list(fields) if fields else list(CASE_FILE_FIELDS)
+    # id and upload_date are always needed to build the next cursor.
+    columns = {name: getattr(models.CaseFile, name) for name in dict.fromkeys(["id", "upload_date", *fields])}
+
+    query = select(*columns.values()).filter(models.CaseFile.owner_id == user_id)
+    if search:
+        escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(models.CaseFile.filename.ilike(f"%{escaped}%", escape="\\"))
+    if cursor:
+        last_date, last_id = decode_file_cursor(cursor)
+        bound = _upload_date_bound(db, last_date)
+        query = query.filter(or_(
+            models.CaseFile.upload_date < bound,
+            and_(models.CaseFile.upload_date == bound, models.CaseFile.id < last_id),
+        ))
+    query = query.order_by(models.CaseFile.upload_date.desc(), models.CaseFile.id.desc()).limit(limit + 1)
+
+    result = await db.execute(query)
+    rows = result.mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_file_cursor(rows[-1]["upload_date"], rows[-1]["id"])
+    items = [{name: row[name] for name in fields} for row in rows]
+    return items, next_cursor
+
+
+async def get_recently_active_user_ids(db: AsyncSession, limit: int):
+    """
+    Returns the ids of the users who uploaded case files most recently.
+    """
+    query = (
+        select(models.CaseFile.owner_id)
+        .group_by(models.CaseFile.owner_id)
+        .order_by(func.max(models.CaseFile.upload_date).desc())
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return [owner_id for owner_id in result.scalars().all() if owner_id is not None]
+
+
+async def get_user_case_file(db: AsyncSession, case_file_id: int, user_id: int):
+    """
+    Fetches a single case file, only if it belongs to the given user.
+    """
+    result = await db.execute(
+        select(models.CaseFile)
+        .filter(models.CaseFile.id == case_file_id, models.CaseFile.owner_id == user_id)
+    )
+    return result.scalars().first()
+
+
+async def create_user_case_file(db: AsyncSession, filename: str, user_id: int,
+                                analysis: Optional[schemas.DocumentAnalysisOutput] = None):
     """
-    Creates a new case file record linked to a user.
+    Creates a new case file record linked to a user, with its document analysis if given.
     """
     db_case_file = models.CaseFile(filename=filename, owner_id=user_id)
     db.add(db_case_file)
+    await db.flush()
+    if analysis is not None:
+        db.add(models.CaseFileAnalysis(
+            case_file_id=db_case_file.id, owner_id=user_id, filename=filename, result=analysis.model_dump_json()
+        ))
+    await stats.increment_counter(db, user_id, "cases_analyzed")
     await db.commit()
+    stats.invalidate(user_id)
     await db.refresh(db_case_file)
     return db_case_file
 
 
+async def delete_user_case_file(db: AsyncSession, case_file: models.CaseFile, user_id: int) -> bool:
+    """
+    Deletes a case file with its stored analyses. Returns True if the user
+    still has another case file with the same filename.
+    """
+    await db.execute(delete(models.AnalysisResult).where(models.AnalysisResult.case_file_id == case_file.id))
+    await db.execute(delete(models.CaseFileAnalysis).where(models.CaseFileAnalysis.case_file_id == case_file.id))
+    filename = case_file.filename
+    await db.delete(case_file)
+    await db.flush()
+    await stats.increment_counter(db, user_id, "cases_analyzed", -1)
+    remaining = await db.execute(
+        select(models.CaseFile.id)
+        .filter(models.CaseFile.owner_id == user_id, models.CaseFile.filename == filename)
+        .limit(1)
+    )
+    still_used = remaining.first() is not None
+    await db.commit()
+    stats.invalidate(user_id)
+    return still_used
+
+async def get_case_file_analysis(db: AsyncSession, case_file_id: int, user_id: int) -> Optional[schemas.DocumentAnalysisOutput]:
+    """
+    Fetches the stored analysis of one of the user's case files.
+    """
+    result = await db.execute(
+        select(models.CaseFileAnalysis.result)
+        .filter(models.CaseFileAnalysis.case_file_id == case_file_id, models.CaseFileAnalysis.owner_id == user_id)
+    )
+    stored = result.scalar_one_or_none()
+    return schemas.DocumentAnalysisOutput.model_validate_json(stored) if stored else None
+
+
+async def get_latest_analysis_for_filename(db: AsyncSession, user_id: int, filename: str) -> Optional[schemas.DocumentAnalysisOutput]:
+    """
+    Fetches the analysis of the user's most recent upload under this filename.
+    """
+    result = await db.execute(
+        select(models.CaseFileAnalysis.result)
+        .filter(models.CaseFileAnalysis.owner_id == user_id, models.CaseFileAnalysis.filename == filename)
+        .order_by(models.CaseFileAnalysis.case_file_id.desc())
+        .limit(1)
+    )
+    stored = result.scalar_one_or_none()
+    return schemas.DocumentAnalysisOutput.model_validate_json(stored) if stored else None
+
+
 async def create_feedback(db: AsyncSession, feedback: schemas.FeedbackCreate, user_id: int):
     """
     Creates a new feedback record linked to a user.
@@ -66,7 +220,10 @@ async def create_feedback(db: AsyncSession, feedback: schemas.FeedbackCreate, us
         user_id=user_id
     )
     db.add(db_feedback)
+    await db.flush()
+    await stats.increment_counter(db, user_id, "precedents_found")
     await db.commit()
+    stats.invalidate(user_id)
     await db.refresh(db_feedback)
     return db_feedback
 
@@ -88,16 +245,33 @@ async def update_user(db: AsyncSession, user: models.User, update_data: schemas.
     for key, value in update_data.dict(exclude_unset=True).items():
         setattr(db_user, key, value)
     
+    username = db_user.username
     await db.commit()
+    principal_cache.pop(username)
     await db.refresh(db_user)
     return db_user
 
+
+async def update_user_password(db: AsyncSession, user: models.User, hashed_password: str):
+    """
+    Stores a new password hash for a user.
+    """
+    username = user.username
+    user.hashed_password = hashed_password
+    db.add(user)
+    await db.commit()
+    principal_cache.pop(username)
+    return user
+
 # --- NEW: Contradiction CRUD functions ---
 async def create_contradiction(db: AsyncSession, contradiction: schemas.ContradictionCreate, user_id: int):
     """Saves a new contradiction report to the database."""
     db_contradiction = models.Contradiction(**contradiction.dict(), user_id=user_id)
     db.add(db_contradiction)
+    await db.flush()
+    await stats.increment_counter(db, user_id, "contradictions_flagged")
     await db.commit()
+    stats.invalidate(user_id)
     await db.refresh(db_contradiction)
     return db_contradiction
 
@@ -9,7 +9,8 @@ BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Define the path for the single, main database file.
 DATABASE_FILE_PATH = os.path.join(BACKEND_DIR, "nyay_ai_main.db")
-DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_FILE_PATH}"
+# DATABASE_URL may be overridden (e.g. benchmarks point it at a scratch file).
+DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite+aiosqlite:///{DATABASE_FILE_PATH}")
 
 # Create the async engine. The connect_args are recommended for SQLite
 # to ensure that the same connection is not shared across different threads.
@@ -0,0 +1,294 @@
+# backend/evaluate_retrieval.py
+#
+# Offline retrieval evaluation and tuning from Feedback labels. For each user,
+# every document marked relevant to a query document is a label; the query
+# documents are replayed against an index of the user's case files and scored
+# with recall@k, MRR and query latency. A sweep then tries other HNSW settings
+# (M, ef_construction, ef_search), chunk sizes/overlaps and RRF constants,
+# and --apply stores the best configuration for the user's collection in
+# `retrieval_settings`, which /summarize and /find_precedents read.
+#
+# Only the standard (whole-document embedding) retrieval list is replayed:
+# the semantic-query list needs the LLM and is left out so runs are cheap and
+# repeatable. RRF still matters because several chunks of one file can hit.
+#
+# Usage: python evaluate_retrieval.py [--user-id N] [--sweep none|quick|full] [--k 3]
+#                                     [--max-p50-ms 50] [--apply [--rebuild]] [--output report.json]
+#
+# --rebuild re-creates the live collection with the new HNSW/chunk settings;
+# stop the server first, since it caches open collections per process.
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy.future import select
+
+import models, retrieval_settings, storage, uploads
+from database import SessionLocal, Base, engine
+from retrieval_settings import RetrievalParams
+
+N_RESULTS = 10
+RECALL_CUTOFFS = (1, 3, 5, 10)
+CHROMA_MAX_BATCH = 5000
+
+SWEEPS = {
+    "quick": {
+        "hnsw_m": [16, 32],
+        "hnsw_construction_ef": [100, 200],
+        "hnsw_search_ef": [50, 100],
+        "chunks": [(128, 20), (250, 40)],
+        "rrf_k": [20, 60],
+    },
+    "full": {
+        "hnsw_m": [8, 16, 32, 48],
+        "hnsw_construction_ef": [100, 200, 400],
+        "hnsw_search_ef": [20, 50, 100, 200],
+        "chunks": [(96, 0), (128, 20), (192, 30), (250, 40)],
+        "rrf_k": [10, 30, 60, 100],
+    },
+}
+
+
+# --- Labels & Documents ---
+async def load_labels(db, user_id: int = None) -> Dict[int, Dict[str, Set[str]]]:
+    """{user_id: {query filename: {relevant precedent filenames}}} from Feedback."""
+    query = select(models.Feedback.user_id, models.Feedback.query_case_filename, models.Feedback.precedent_case_filename).where(
+        models.Feedback.is_relevant == True
+    )
+    if user_id is not None:
+        query = query.where(models.Feedback.user_id == user_id)
+    labels: Dict[int, Dict[str, Set[str]]] = defaultdict(lambda: defaultdict(set))
+    for owner, query_file, precedent_file in (await db.execute(query)).all():
+        if query_file != precedent_file:
+            labels[owner][query_file].add(precedent_file)
+    return labels
+
+
+async def load_documents(db, user_id: int) -> Dict[str, str]:
+    """Text of every stored case file of a user, keyed by filename."""
+    result = await db.execute(select(models.CaseFile.filename).where(models.CaseFile.owner_id == user_id).distinct())
+    texts = {}
+    for (filename,) in result.all():
+        path = await storage.resolve_document_path(db, user_id, filename)
+        if path is None:
+            print(f"Warning: File not found for {filename}")
+            continue
+        text = uploads.extract_text_from_path(path, uploads.content_type_for(filename))
+        if text.strip():
+            texts[filename] = text
+    return texts
+
+
+# --- Scoring ---
+def rank_filenames(hit_filenames: List[str], k: int) -> List[str]:
+    """Same scoring as main.reciprocal_rank_fusion for one result list, without the logging."""
+    scores: Dict[str, float] = defaultdict(float)
+    for rank, filename in enumerate(hit_filenames):
+        scores[filename] += 1 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
+
+def score_rankings(rankings: Dict[str, List[str]], labels: Dict[str, Set[str]], cutoffs: Iterable[int] = RECALL_CUTOFFS) -> Dict[str, float]:
+    """Mean recall@cutoff and MRR over the labelled queries."""
+    recalls = {cutoff: 0.0 for cutoff in cutoffs}
+    reciprocal_ranks = 0.0
+    for query_file, ranking in rankings.items():
+        relevant = labels[query_file]
+        for cutoff in recalls:
+            recalls[cutoff] += len(relevant.intersection(ranking[:cutoff])) / len(relevant)
+        first_hit = next((i for i, filename in enumerate(ranking) if filename in relevant), None)
+        reciprocal_ranks += 0.0 if first_hit is None else 1 / (first_hit + 1)
+    count = max(len(rankings), 1)
+    scores = {f"recall@{cutoff}": round(total / count, 4) for cutoff, total in recalls.items()}
+    scores["mrr"] = round(reciprocal_ranks / count, 4)
+    return scores
+
+
+def _percentile_ms(samples: List[float], q: float) -> float:
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3) if ordered else 0.0
+
+
+# --- Sweep ---
+def candidate_params(current: RetrievalParams, sweep: str) -> List[RetrievalParams]:
+    """The current parameters first, then every combination in the sweep grid."""
+    candidates = [current]
+    grid = SWEEPS.get(sweep)
+    if grid:
+        for m, construction_ef, search_ef, (size, overlap), rrf_k in itertools.product(
+            grid["hnsw_m"], grid["hnsw_construction_ef"], grid["hnsw_search_ef"], grid["chunks"], grid["rrf_k"]
+        ):
+            params = RetrievalParams(m, construction_ef, search_ef, size, overlap, rrf_k)
+            if params not in candidates:
+                candidates.append(params)
+    return candidates
+
+
+def _index_key(params: RetrievalParams) -> Tuple:
+    """Parameters that need a separate index; rrf_k only changes the fusion step."""
+    return (params.hnsw_m, params.hnsw_construction_ef, params.hnsw_search_ef, params.chunk_size, params.chunk_overlap)
+
+
+def evaluate_user(user_id: int, labels: Dict[str, Set[str]], texts: Dict[str, str],
+                  candidates: List[RetrievalParams], eval_k: int) -> List[Dict]:
+    """Scores every candidate for one user; chunk embeddings are computed once per chunk configuration."""
+    import legal_chunker, main, startup
+
+    queries = {query_file: relevant & texts.keys() for query_file, relevant in labels.items() if query_file in texts}
+    queries = {query_file: relevant for query_file, relevant in queries.items() if relevant}
+    if not queries:
+        return []
+    query_model = main.load_model_for_user(user_id)
+    query_files = sorted(queries)
+    query_embeddings = query_model.encode([texts[f] for f in query_files]).tolist()
+    # The live collection embeds chunks with the base model (its embedding function).
+    chunk_model = main.get_base_model()
+    chunk_cache: Dict[Tuple[int, int], Tuple[List[str], List[List[float]], List[Dict]]] = {}
+    client = startup.chromadb().EphemeralClient()
+
+    by_index: Dict[Tuple, List[RetrievalParams]] = defaultdict(list)
+    for params in candidates:
+        by_index[_index_key(params)].append(params)
+
+    trials = []
+    for index_params in by_index.values():
+        params = index_params[0]
+        chunk_key = (params.chunk_size, params.chunk_overlap)
+        if chunk_key not in chunk_cache:
+            splitter = legal_chunker.get_chunker(params.chunk_size, params.chunk_overlap)
+            ids, chunks, metadatas = [], [], []
+            for filename, text in texts.items():
+                for i, chunk in enumerate(splitter.split_text(text)):
+                    ids.append(f"{filename}-chunk-{i}")
+                    chunks.append(chunk)
+                    metadatas.append({"filename": filename})
+            chunk_cache[chunk_key] = (ids, chunk_model.encode(chunks, batch_size=64).tolist(), metadatas)
+        ids, embeddings, metadatas = chunk_cache[chunk_key]
+
+        collection = client.create_collection(name=f"eval_{uuid.uuid4().hex}", embedding_function=None, metadata=params.collection_metadata())
+        start = time.perf_counter()
+        for offset in range(0, len(ids), CHROMA_MAX_BATCH):
+            collection.add(ids=ids[offset:offset + CHROMA_MAX_BATCH], embeddings=embeddings[offset:offset + CHROMA_MAX_BATCH],
+                           metadatas=metadatas[offset:offset + CHROMA_MAX_BATCH])
+        build_seconds = time.perf_counter() - start
+
+        hits, latencies = {}, []
+        for query_file, embedding in zip(query_files, query_embeddings):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[embedding], n_results=min(N_RESULTS, len(ids)))
+            latencies.append(time.perf_counter() - start)
+            hits[query_file] = [meta["filename"] for meta in result.get("metadatas", [[]])[0]]
+        client.delete_collection(collection.name)
+
+        for params in index_params:
+            rankings = {
+                query_file: [f for f in rank_filenames(hit_list, params.rrf_k) if f != query_file]
+                for query_file, hit_list in hits.items()
+            }
+            scores = score_rankings(rankings, queries, sorted({*RECALL_CUTOFFS, eval_k}))
+            trials.append({
+                "params": params.as_dict(),
+                **scores,
+                "recall_at_k": scores[f"recall@{eval_k}"],
+                "p50_ms": _percentile_ms(latencies, 0.50),
+                "p99_ms": _percentile_ms(latencies, 0.99),
+                "chunks": len(ids),
+                "build_seconds": round(build_seconds, 3),
+            })
+    return trials
+
+
+def pick_best(trials: Iterable[Dict], max_p50_ms: float = None) -> Dict:
+    """Highest recall@k, then MRR, then lowest p50 latency; trials over the latency budget are skipped."""
+    eligible = [t for t in trials if max_p50_ms is None or t["p50_ms"] <= max_p50_ms]
+    return max(eligible, key=lambda t: (t["recall_at_k"], t["mrr"], -t["p50_ms"]), default=None)
+
+
+# --- Applying ---
+def rebuild_collection(user_id: int, params: RetrievalParams, texts: Dict[str, str]) -> None:
+    """Re-creates the user's live collection with `params` and re-adds every document."""
+    import main
+
+    user_db_path = os.path.join(main.USER_CHROMA_PATH, f"user_{user_id}")
+    main._user_collections.pop(user_id, None)
+    if os.path.exists(user_db_path):
+        shutil.rmtree(user_db_path)
+    for filename, text in texts.items():
+        main.add_document_to_vector_store(user_id, text, filename, params)
+    print(f"Rebuilt collection for user {user_id} with {len(texts)} documents.")
+
+
+# --- Main ---
+async def run(args) -> Dict:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    report = {"sweep": args.sweep, "k": args.k, "users": {}}
+    async with SessionLocal() as db:
+        labels_by_user = await load_labels(db, args.user_id)
+        for user_id, labels in sorted(labels_by_user.items()):
+            texts = await load_documents(db, user_id)
+            current = await retrieval_settings.get_params(db, user_id)
+            trials = evaluate_user(user_id, labels, texts, candidate_params(current, args.sweep), args.k)
+            if not trials:
+                print(f"User {user_id}: no labelled queries with stored documents; skipped.")
+                continue
+            baseline, best = trials[0], pick_best(trials, args.max_p50_ms)
+            labelled = sum(1 for query_file in labels if query_file in texts)
+            report["users"][str(user_id)] = {
+                "labeled_queries": labelled,
+                "documents": len(texts),
+                "current": baseline,
+                "best": best,
+                "trials": trials if args.all_trials else len(trials),
+            }
+            print(f"User {user_id}: {labelled} queries, {len(texts)} documents")
+            print(f"  current  recall@{args.k}={baseline['recall_at_k']:.3f} mrr={baseline['mrr']:.3f} p50={baseline['p50_ms']}ms  {baseline['params']}")
+            if best is None:
+                print(f"  no configuration within {args.max_p50_ms}ms p50")
+                continue
+            print(f"  best     recall@{args.k}={best['recall_at_k']:.3f} mrr={best['mrr']:.3f} p50={best['p50_ms']}ms  {best['params']}")
+
+            if args.apply:
+                if labelled < args.min_queries:
+                    print(f"  not applied: fewer than {args.min_queries} labelled queries")
+                    continue
+                params = RetrievalParams(**best["params"])
+                await retrieval_settings.save_params(db, user_id, f"precedents_user_{user_id}", params, {
+                    "k": args.k, "recall_at_k": best["recall_at_k"], "mrr": best["mrr"],
+                    "p50_ms": best["p50_ms"], "labeled_queries": labelled,
+                })
+                print(f"  saved settings for precedents_user_{user_id}")
+                if args.rebuild and _index_key(params) != _index_key(current):
+                    rebuild_collection(user_id, params, texts)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate and tune retrieval per user from Feedback labels.")
+    parser.add_argument("--user-id", type=int, help="Only evaluate this user.")
+    parser.add_argument("--sweep", choices=["none", *SWEEPS], default="none", help="Parameter grid to try besides the current settings.")
+    parser.add_argument("--k", type=int, default=3, help="Cutoff for the recall@k used to pick the best configuration.")
+    parser.add_argument("--max-p50-ms", type=float, help="Ignore configurations slower than this median query latency.")
+    parser.add_argument("--min-queries", type=int, default=5, help="Labelled queries required before --apply saves anything.")
+    parser.add_argument("--apply", action="store_true", help="Persist the best configuration per collection.")
+    parser.add_argument("--rebuild", action="store_true", help="With --apply, re-create collections whose index/chunk settings changed.")
+    parser.add_argument("--all-trials", action="store_true", help="Include every trial in the report, not just the count.")
+    parser.add_argument("--output", default="retrieval_eval_report.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
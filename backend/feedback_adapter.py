@@ -0,0 +1,190 @@
+# backend/feedback_adapter.py
+#
+# Query-time personalization from precedent feedback, without retraining.
+# Each user gets a Rocchio-style adapter over the base embedding space: query
+# embeddings are moved towards the centroid of precedents the user marked
+# relevant and away from those marked irrelevant, and precedents labelled for
+# the same query document are promoted or dropped from the fused ranking.
+# The state is a handful of NumPy vectors, built from Feedback rows on first
+# use and updated in place on each /feedback POST. fine_tune_model.py remains
+# the heavyweight option.
+
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+import models
+from cache import TTLCache
+
+# Rocchio weights: original query, relevant centroid, irrelevant centroid.
+ALPHA = 1.0
+BETA = 0.4
+GAMMA = 0.15
+# Damps the shift while feedback is sparse: a centroid built from n labels gets weight n / (n + PRIOR_COUNT).
+PRIOR_COUNT = 5
+MAX_FEEDBACK_ROWS = 1000
+# Adapters are per worker; the TTL bounds how long another worker's new labels go unseen.
+ADAPTER_TTL_SECONDS = 900
+
+_adapters = TTLCache(maxsize=1000, ttl=ADAPTER_TTL_SECONDS, name="feedback_adapters")
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
+
+
+class RerankAdapter:
+    """One user's feedback, reduced to label counts and summed document vectors."""
+
+    def __init__(self):
+        self._labels: Dict[Tuple[str, str], bool] = {}
+        # Labels whose precedent vector is counted in _sums; a label given before its vector was known is not.
+        self._applied: Set[Tuple[str, str]] = set()
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._sums: Dict[bool, Optional[np.ndarray]] = {True: None, False: None}
+        self._counts: Dict[bool, int] = {True: 0, False: 0}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def has_vector(self, filename: str) -> bool:
+        return filename in self._vectors
+
+    def _apply(self, filename: str, is_relevant: bool, sign: int) -> bool:
+        vector = self._vectors.get(filename)
+        if vector is None:
+            return False
+        if self._sums[is_relevant] is None:
+            self._sums[is_relevant] = np.zeros_like(vector)
+        self._sums[is_relevant] += sign * vector
+        self._counts[is_relevant] += sign
+        return True
+
+    def update(self, query_filename: str, precedent_filename: str, is_relevant: bool,
+               vector: Optional[np.ndarray] = None) -> None:
+        """Records a label; a repeated (query, precedent) pair replaces its earlier label."""
+        with self._lock:
+            if vector is not None and precedent_filename not in self._vectors:
+                dims = {v.shape for v in self._vectors.values()}
+                if not dims or vector.shape in dims:
+                    self._vectors[precedent_filename] = _unit(np.asarray(vector, dtype=np.float32))
+            key = (query_filename, precedent_filename)
+            previous = self._labels.get(key)
+            if key in self._applied:
+                self._apply(precedent_filename, previous, -1)
+                self._applied.discard(key)
+            self._labels[key] = is_relevant
+            if self._apply(precedent_filename, is_relevant, +1):
+                self._applied.add(key)
+
+    def forget(self, filename: str) -> None:
+        """Drops every label involving a document, e.g. when the user deletes it."""
+        with self._lock:
+            for key in [k for k in self._labels if filename in k]:
+                if key in self._applied:
+                    self._apply(key[1], self._labels[key], -1)
+                    self._applied.discard(key)
+                del self._labels[key]
+            self._vectors.pop(filename, None)
+
+    def _shift(self, dim: int) -> Optional[np.ndarray]:
+        shift = np.zeros(dim, dtype=np.float32)
+        for is_relevant, weight in ((True, BETA), (False, -GAMMA)):
+            total, count = self._sums[is_relevant], self._counts[is_relevant]
+            if count > 0 and total is not None and total.shape == (dim,):
+                shift += weight * (count / (count + PRIOR_COUNT)) * _unit(total / count)
+        return shift if shift.any() else None
+
+    def adjust(self, query_embeddings) -> np.ndarray:
+        """Rocchio-adjusted, unit-length query embedding(s), in the shape given."""
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        with self._lock:
+            shift = self._shift(queries.shape[-1])
+        if shift is None:
+            return queries
+        batch = np.atleast_2d(queries)
+        norms = np.linalg.norm(batch, axis=1, keepdims=True)
+        adjusted = ALPHA * batch / np.where(norms == 0, 1, norms) + shift
+        adjusted /= np.maximum(np.linalg.norm(adjusted, axis=1, keepdims=True), 1e-12)
+        return adjusted.reshape(queries.shape)
+
+    def rerank(self, query_filename: str, filenames: Iterable[str]) -> List[str]:
+        """
+        Precedents marked relevant for this query first, those marked irrelevant removed.
+        Only documents that still have a vector (i.e. are still indexed) are promoted.
+        """
+        with self._lock:
+            labels = {p: rel for (q, p), rel in self._labels.items() if q == query_filename}
+            promoted = [p for p, rel in labels.items() if rel and p in self._vectors]
+        return promoted + [f for f in filenames if f not in labels]
+
+
+def document_vectors(filenames: Iterable[str], collection=None, corpus=None) -> Dict[str, np.ndarray]:
+    """Mean chunk embedding per document; the user's own chunks win over the global corpus."""
+    names = sorted(set(filenames))
+    vectors: Dict[str, np.ndarray] = {}
+    if names and collection is not None and collection.count() > 0:
+        results = collection.get(where={"filename": {"$in": names}}, include=["embeddings", "metadatas"])
+        embeddings = results.get("embeddings")
+        grouped = defaultdict(list)
+        for meta, embedding in zip(results.get("metadatas") or [], [] if embeddings is None else embeddings):
+            grouped[meta["filename"]].append(embedding)
+        for filename, rows in grouped.items():
+            vectors[filename] = np.asarray(rows, dtype=np.float32).mean(axis=0)
+    if corpus is not None:
+        for filename in names:
+            if filename not in vectors:
+                vector = corpus.document_embedding(filename)
+                if vector is not None:
+                    vectors[filename] = vector
+    return vectors
+
+
+async def get_adapter(db: AsyncSession, user_id: int, collection=None, corpus=None) -> RerankAdapter:
+    """The user's adapter, built from their most recent Feedback rows on first use."""
+    adapter = _adapters.get(user_id)
+    if adapter is not None:
+        return adapter
+    result = await db.execute(
+        select(models.Feedback.query_case_filename, models.Feedback.precedent_case_filename, models.Feedback.is_relevant)
+        .filter(models.Feedback.user_id == user_id)
+        .order_by(models.Feedback.id.desc())
+        .limit(MAX_FEEDBACK_ROWS)
+    )
+    rows = list(reversed(result.all()))
+    vectors = await run_in_threadpool(document_vectors, {row[1] for row in rows}, collection, corpus) if rows else {}
+    adapter = RerankAdapter()
+    for query_filename, precedent_filename, is_relevant in rows:
+        adapter.update(query_filename, precedent_filename, bool(is_relevant), vectors.get(precedent_filename))
+    _adapters.set(user_id, adapter)
+    return adapter
+
+
+async def record_feedback(user_id: int, feedback, open_collection: Callable[[], Any], corpus=None) -> None:
+    """
+    Folds a new label into the user's cached adapter; uncached adapters pick it up when built.
+    `open_collection` is only called (in the threadpool) when the precedent's vector is needed.
+    """
+    adapter = _adapters.get(user_id)
+    if adapter is None:
+        return
+    filename = feedback.precedent_case_filename
+    vector = None
+    if not adapter.has_vector(filename):
+        vectors = await run_in_threadpool(lambda: document_vectors([filename], open_collection(), corpus))
+        vector = vectors.get(filename)
+    adapter.update(feedback.query_case_filename, filename, feedback.is_relevant, vector)
+
+
+def forget_document(user_id: int, filename: str) -> None:
+    """Removes a deleted document from the user's cached adapter; a rebuilt adapter finds no vector for it."""
+    adapter = _adapters.get(user_id)
+    if adapter is not None:
+        adapter.forget(filename)
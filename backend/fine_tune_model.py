@@ -2,45 +2,32 @@
 
 import os
 import sys
-import io
 import shutil
 import asyncio
 from sentence_transformers import SentenceTransformer, InputExample, losses
 from torch.utils.data import DataLoader
-import pypdf
 
 # --- NEW: SQLAlchemy imports for async database access ---
 from sqlalchemy.future import select
 from database import SessionLocal, Base, engine
-import models
+import models, storage, uploads, global_corpus
 
 # --- Path and Model Configuration ---
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
-DOCUMENTS_PATH = os.path.join(BACKEND_DIR, "case_documents")
 BASE_MODEL_NAME = "all-MiniLM-L6-v2"
 
-def get_document_text(filename: str) -> str:
-    """Helper function to read text from a file."""
-    filepath = os.path.join(DOCUMENTS_PATH, filename)
-    if not os.path.exists(filepath):
-        print(f"Warning: File not found at {filepath}")
-        return ""
-    
-    with open(filepath, 'rb') as f:
-        file_content = f.read()
-    
-    text = ""
-    if filename.lower().endswith('.pdf'):
-        try:
-            pdf_reader = pypdf.PdfReader(io.BytesIO(file_content))
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-        except Exception as e:
-            print(f"Warning: Could not read PDF {filename}. Error: {e}")
-            return ""
-    elif filename.lower().endswith('.txt'):
-        text = file_content.decode('utf-8', errors='ignore')
-    return text
+async def get_document_text(user_id: int, filename: str) -> str:
+    """Helper function to read text from a user's stored document."""
+    async with SessionLocal() as db:
+        filepath = await storage.resolve_document_path(db, user_id, filename)
+    if filepath is None:
+        # Precedents found in the shared corpus are not stored per user.
+        corpus = global_corpus.get_global_corpus()
+        text = corpus.document_text(filename) if corpus else None
+        if text is None:
+            print(f"Warning: File not found for {filename}")
+        return text or ""
+    return uploads.extract_text_from_path(filepath, uploads.content_type_for(filename))
 
 # --- UPDATED: Async function to load data via SQLAlchemy ---
 async def load_feedback_data(user_id: int):
@@ -63,13 +50,13 @@ async def load_feedback_data(user_id: int):
     print(f"Found {len(feedback_pairs)} relevant feedback entries for user {user_id}.")
     return feedback_pairs
 
-def create_training_examples(feedback_pairs):
+async def create_training_examples(user_id: int, feedback_pairs):
     """Creates training examples for the sentence-transformer model."""
     print("Creating training examples...")
     train_examples = []
     for query_file, precedent_file in feedback_pairs:
-        query_text = get_document_text(query_file)
-        precedent_text = get_document_text(precedent_file)
+        query_text = await get_document_text(user_id, query_file)
+        precedent_text = await get_document_text(user_id, precedent_file)
         
         if query_text and precedent_text:
             train_examples.append(InputExample(texts=[query_text, precedent_text], label=1.0))
@@ -85,7 +72,7 @@ async def main(user_id: int):
         print("No relevant feedback data found for this user to train on. Exiting.")
         return
 
-    train_examples = create_training_examples(feedback_data)
+    train_examples = await create_training_examples(user_id, feedback_data)
     if not train_examples:
         print("Could not create any valid training examples. Exiting.")
         return
@@ -0,0 +1,285 @@
+# backend/global_corpus.py
+#
+# Shared, read-mostly index of public judgments. The corpus is chunked and
+# embedded once (base model, normalised) by the `build` command below and
+# stored as flat NumPy/UTF-8 files that every worker memory-maps read-only,
+# so all processes share one copy through the OS page cache. Each user's
+# Chroma collection then only holds an overlay of their private documents:
+# uploads whose bytes match a corpus document are not re-indexed per user.
+#
+# Layout of global_corpus/:
+#   manifest.json       model, chunking, filenames, source sha256 per document
+#   embeddings.npy      (chunks x dim) float32, L2-normalised
+#   doc_chunks.npy      first chunk row of each document (+ total at the end)
+#   chunk_offsets.npy   byte offsets of each chunk in chunks.bin (+ end)
+#   chunks.bin          chunk texts, UTF-8, concatenated
+#
+# Usage: python global_corpus.py build <source_dir> [--chunk-size 250 --chunk-overlap 40]
+#        python global_corpus.py info
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import legal_chunker
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+GLOBAL_CORPUS_PATH = os.path.join(BACKEND_DIR, "global_corpus")
+BASE_MODEL_NAME = "all-MiniLM-L6-v2"
+MANIFEST_FILE = "manifest.json"
+# Rows scored per matrix product, bounding the temporary score matrix.
+SEARCH_BLOCK_ROWS = 65536
+
+
+class GlobalCorpus:
+    """A built corpus opened read-only; arrays and chunk texts are memory-mapped."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.path = path
+        self.filenames: List[str] = self.manifest["filenames"]
+        self.embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        self.doc_chunks = np.load(os.path.join(path, "doc_chunks.npy"), mmap_mode="r")
+        self.chunk_offsets = np.load(os.path.join(path, "chunk_offsets.npy"), mmap_mode="r")
+        chunks_path = os.path.join(path, "chunks.bin")
+        self._chunk_bytes = np.memmap(chunks_path, dtype=np.uint8, mode="r") if os.path.getsize(chunks_path) else np.zeros(0, np.uint8)
+        # Chunk row -> document index, derived from the per-document row ranges.
+        self._chunk_docs = np.repeat(np.arange(len(self.filenames)), np.diff(self.doc_chunks))
+        self._file_index = {filename: i for i, filename in enumerate(self.filenames)}
+        self._by_sha256 = {sha: self.filenames[i] for i, sha in enumerate(self.manifest["sha256"])}
+
+    def __len__(self) -> int:
+        return len(self.filenames)
+
+    @property
+    def chunk_count(self) -> int:
+        return int(self.embeddings.shape[0])
+
+    def filename_for_sha256(self, sha256: Optional[str]) -> Optional[str]:
+        """The corpus document with exactly this content (by source file hash), if any."""
+        return self._by_sha256.get(sha256) if sha256 else None
+
+    def chunk_text(self, row: int) -> str:
+        start, end = int(self.chunk_offsets[row]), int(self.chunk_offsets[row + 1])
+        return bytes(self._chunk_bytes[start:end]).decode("utf-8")
+
+    def chunk_id(self, row: int) -> str:
+        doc = int(self._chunk_docs[row])
+        return f"{self.filenames[doc]}-chunk-{row - int(self.doc_chunks[doc])}"
+
+    def document_text(self, filename: str) -> Optional[str]:
+        """Chunks of a document joined back together (overlaps included)."""
+        doc = self._file_index.get(filename)
+        if doc is None:
+            return None
+        return "\n".join(self.chunk_text(row) for row in range(int(self.doc_chunks[doc]), int(self.doc_chunks[doc + 1])))
+
+    def document_embedding(self, filename: str) -> Optional[np.ndarray]:
+        """Mean of a document's chunk embeddings, or None if it is not in the corpus."""
+        doc = self._file_index.get(filename)
+        if doc is None or self.doc_chunks[doc + 1] == self.doc_chunks[doc]:
+            return None
+        return np.asarray(self.embeddings[int(self.doc_chunks[doc]):int(self.doc_chunks[doc + 1])], dtype=np.float32).mean(axis=0)
+
+    @staticmethod
+    def _normalise(query_embeddings) -> np.ndarray:
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        return queries / np.where(norms == 0, 1, norms)
+
+    def _top_rows(self, queries: np.ndarray, n_results: int, rows: Optional[Tuple[int, int]] = None) -> List[List[int]]:
+        """Exact cosine top-n chunk rows per query, scanning the mapped matrix in blocks."""
+        first, last = rows or (0, self.chunk_count)
+        n_results = min(n_results, last - first)
+        if n_results <= 0:
+            return [[] for _ in queries]
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(first, last, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, last)
+            scores = queries @ self.embeddings[start:stop].T
+            keep = min(n_results, stop - start)
+            top = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > n_results:
+                top = np.argpartition(-best_scores, n_results - 1, axis=1)[:, :n_results]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_rows, order, axis=1).tolist()
+
+    def search(self, query_embeddings, n_results: int) -> List[List[str]]:
+        """Filenames of the top-n chunks per query, best first (like Chroma's metadata lists)."""
+        return [[self.filenames[int(self._chunk_docs[row])] for row in rows]
+                for rows in self._top_rows(self._normalise(query_embeddings), n_results)]
+
+    def query_document(self, filename: str, query_embedding, n_results: int) -> Tuple[List[str], List[str]]:
+        """(chunk ids, chunk texts) of one document, most similar to the query first."""
+        doc = self._file_index.get(filename)
+        if doc is None:
+            return [], []
+        rows = self._top_rows(self._normalise(query_embedding), n_results, (int(self.doc_chunks[doc]), int(self.doc_chunks[doc + 1])))[0]
+        return [self.chunk_id(row) for row in rows], [self.chunk_text(row) for row in rows]
+
+
+# --- Process-wide Handle ---
+_corpus: Optional[GlobalCorpus] = None
+_corpus_mtime: Optional[int] = None
+_corpus_lock = threading.Lock()
+
+
+def get_global_corpus() -> Optional[GlobalCorpus]:
+    """The mapped corpus, reopened when a rebuild replaces it; None if no corpus is built."""
+    global _corpus, _corpus_mtime
+    try:
+        mtime = os.stat(os.path.join(GLOBAL_CORPUS_PATH, MANIFEST_FILE)).st_mtime_ns
+    except OSError:
+        return _corpus
+    if _corpus is not None and mtime == _corpus_mtime:
+        return _corpus
+    with _corpus_lock:
+        if _corpus is None or mtime != _corpus_mtime:
+            try:
+                _corpus = GlobalCorpus(GLOBAL_CORPUS_PATH)
+                _corpus_mtime = mtime
+                print(f"Opened global corpus: {len(_corpus)} documents, {_corpus.chunk_count} chunks.")
+            except (OSError, ValueError, KeyError) as e:
+                # A rebuild may be mid-swap; keep serving the previous corpus.
+                print(f"Could not open global corpus: {e}")
+        return _corpus
+
+
+# --- Building ---
+def _iter_source_files(source_dir: str):
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if name.lower().endswith((".pdf", ".txt")):
+                yield os.path.join(root, name)
+
+
+def _file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def build(source_dir: str, chunk_size: int = legal_chunker.DEFAULT_MAX_TOKENS,
+          chunk_overlap: int = legal_chunker.DEFAULT_OVERLAP_TOKENS, batch_size: int = 64) -> Dict:
+    """
+    (Re)builds the corpus from every .pdf/.txt under `source_dir`. Documents
+    already in the current corpus with the same content and chunking reuse
+    their embeddings. The new corpus replaces the old one in a single swap.
+    """
+    import startup, uploads
+
+    previous = get_global_corpus()
+    reusable = (
+        previous is not None
+        and previous.manifest.get("model") == BASE_MODEL_NAME
+        and previous.manifest.get("chunker") == "legal"
+        and previous.manifest.get("chunk_size") == chunk_size
+        and previous.manifest.get("chunk_overlap") == chunk_overlap
+    )
+    splitter = legal_chunker.get_chunker(chunk_size, chunk_overlap)
+    model = None
+
+    filenames, hashes, seen, seen_names = [], [], set(), set()
+    embedding_parts: List[np.ndarray] = []
+    chunk_texts: List[str] = []
+    doc_chunks = [0]
+    reused = 0
+    for path in _iter_source_files(source_dir):
+        filename, sha256 = os.path.basename(path), _file_sha256(path)
+        if sha256 in seen or filename in seen_names:
+            print(f"Skipping duplicate: {path}")
+            continue
+        old_name = previous.filename_for_sha256(sha256) if reusable else None
+        if old_name is not None:
+            old_doc = previous._file_index[old_name]
+            rows = range(int(previous.doc_chunks[old_doc]), int(previous.doc_chunks[old_doc + 1]))
+            chunks = [previous.chunk_text(row) for row in rows]
+            embeddings = np.array(previous.embeddings[rows.start:rows.stop])
+            reused += 1
+        else:
+            text = uploads.extract_text_from_path(path, uploads.content_type_for(path))
+            chunks = splitter.split_text(text) if text.strip() else []
+            if not chunks:
+                print(f"Skipping empty document: {path}")
+                continue
+            if model is None:
+                model = startup.sentence_transformer_cls()(BASE_MODEL_NAME)
+            embeddings = model.encode(chunks, batch_size=batch_size, normalize_embeddings=True).astype(np.float32)
+        seen.add(sha256)
+        seen_names.add(filename)
+        filenames.append(filename)
+        hashes.append(sha256)
+        embedding_parts.append(embeddings)
+        chunk_texts.extend(chunks)
+        doc_chunks.append(doc_chunks[-1] + len(chunks))
+
+    encoded = [chunk.encode("utf-8") for chunk in chunk_texts]
+    building = GLOBAL_CORPUS_PATH + ".building"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    dim = embedding_parts[0].shape[1] if embedding_parts else 384
+    np.save(os.path.join(building, "embeddings.npy"),
+            np.concatenate(embedding_parts) if embedding_parts else np.zeros((0, dim), np.float32))
+    np.save(os.path.join(building, "doc_chunks.npy"), np.array(doc_chunks, dtype=np.int64))
+    np.save(os.path.join(building, "chunk_offsets.npy"), np.concatenate([[0], np.cumsum([len(b) for b in encoded], dtype=np.int64)]))
+    with open(os.path.join(building, "chunks.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    manifest = {
+        "model": BASE_MODEL_NAME,
+        "dim": int(dim),
+        "chunker": "legal",
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "built_at": time.time(),
+        "filenames": filenames,
+        "sha256": hashes,
+    }
+    # The manifest is written last: a directory without one is never opened.
+    with open(os.path.join(building, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    retired = GLOBAL_CORPUS_PATH + ".previous"
+    shutil.rmtree(retired, ignore_errors=True)
+    if os.path.exists(GLOBAL_CORPUS_PATH):
+        os.rename(GLOBAL_CORPUS_PATH, retired)
+    os.rename(building, GLOBAL_CORPUS_PATH)
+    # Workers still mapping the old files keep them alive until they reopen.
+    shutil.rmtree(retired, ignore_errors=True)
+    return {"documents": len(filenames), "chunks": len(chunk_texts), "reused_documents": reused}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared precedent corpus maintenance.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    build_parser = subcommands.add_parser("build", help="Build or refresh the corpus from a directory of judgments.")
+    build_parser.add_argument("source_dir")
+    build_parser.add_argument("--chunk-size", type=int, default=legal_chunker.DEFAULT_MAX_TOKENS, help="Tokens per chunk.")
+    build_parser.add_argument("--chunk-overlap", type=int, default=legal_chunker.DEFAULT_OVERLAP_TOKENS)
+    subcommands.add_parser("info", help="Show what the current corpus contains.")
+    args = parser.parse_args()
+    if args.command == "build":
+        report = build(args.source_dir, args.chunk_size, args.chunk_overlap)
+        print(f"Global corpus built: {report['documents']} documents ({report['reused_documents']} reused), {report['chunks']} chunks.")
+    elif args.command == "info":
+        corpus = get_global_corpus()
+        if corpus is None:
+            print("No global corpus has been built.")
+        else:
+            size = sum(os.path.getsize(os.path.join(corpus.path, name)) for name in os.listdir(corpus.path))
+            print(f"{len(corpus)} documents, {corpus.chunk_count} chunks, {size / 1e6:.1f} MB, "
+                  f"model {corpus.manifest['model']}, chunk size {corpus.manifest['chunk_size']}.")
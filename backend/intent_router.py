@@ -0,0 +1,156 @@
+# backend/intent_router.py
+#
+# Local fast path for chat messages that only ask to open a page
+# ("take me to precedents", "open my dashbord"). Those are answered here in
+# milliseconds; anything uncertain falls through to the LLM.
+
+import difflib
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MAX_ROUTABLE_WORDS = 12
+EMBEDDING_THRESHOLD = 0.72
+EMBEDDING_MARGIN = 0.08
+FUZZY_CUTOFF = 0.8
+
+# The same five destinations the chat system instruction knows about.
+ROUTES: Dict[str, Dict] = {
+    "/summarize": {
+        "answer": "Sure, taking you to the Case Summarizer.",
+        "keywords": ["summarize", "summarise", "summary", "summarizer", "brief", "overview"],
+        "examples": [
+            "take me to the summarizer", "open summarize", "I want to summarize a case",
+            "go to the brief page", "summarize a new document", "get an overview of a case file",
+        ],
+    },
+    "/precedents": {
+        "answer": "Certainly, I'll take you to the Precedent Analysis page.",
+        "keywords": ["precedent", "precedents", "similar", "historical", "judgments"],
+        "examples": [
+            "take me to precedents", "find similar cases", "open precedent search",
+            "go to historical cases", "I want to search for precedents", "show me the precedent page",
+        ],
+    },
+    "/evidence": {
+        "answer": "Opening Evidentiary Cross-Verification for you.",
+        "keywords": ["evidence", "contradiction", "contradictions", "conflicts", "verification"],
+        "examples": [
+            "take me to evidence analysis", "find contradictions", "open the evidence page",
+            "check for conflicts in documents", "go to cross verification", "analyze evidence",
+        ],
+    },
+    "/personalize": {
+        "answer": "Taking you to Personalize AI.",
+        "keywords": ["personalize", "personalise", "personalization", "retrain", "train", "finetune"],
+        "examples": [
+            "take me to personalize", "retrain my model", "open personalization",
+            "update the AI with my feedback", "go to personalize ai", "train my model",
+        ],
+    },
+    "/": {
+        "answer": "Sure, here's your dashboard.",
+        "keywords": ["dashboard", "home", "homepage"],
+        "examples": [
+            "open my dashboard", "go home", "take me to the dashboard",
+            "show my home page", "back to the main page", "go to dashboard",
+        ],
+    },
+}
+
+NAV_CUES = ["take", "go", "open", "navigate", "show", "bring", "switch", "back", "goto", "visit", "launch"]
+FILLER_WORDS = {"me", "to", "the", "my", "a", "an", "i", "want", "page", "please", "lets", "let", "us", "now", "can", "you", "tab", "section", "search", "analysis"}
+# Keyword matches only count when almost nothing else is said, so
+# "show me the evidence about the weapon" still goes to the LLM.
+MAX_UNEXPLAINED_WORDS = 1
+QUESTION_WORDS = {"what", "why", "how", "who", "when", "which", "does", "did", "is", "are", "can", "could", "should", "explain"}
+
+
+@dataclass
+class Intent:
+    page: str
+    answer: str
+    confidence: float
+    method: str
+
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z]+", text.lower())
+
+
+def _fuzzy_in(token: str, vocabulary: List[str]) -> bool:
+    # Short words are too easy to confuse ("how" ~ "show"), so they must match exactly.
+    if len(token) <= 3:
+        return token in vocabulary
+    return bool(difflib.get_close_matches(token, vocabulary, n=1, cutoff=FUZZY_CUTOFF))
+
+
+class IntentRouter:
+    """Classifies short navigation requests with fuzzy keywords and example embeddings."""
+    def __init__(self, routes: Dict[str, Dict] = ROUTES):
+        self.routes = routes
+        self._example_pages: List[str] = [page for page, spec in routes.items() for _ in spec["examples"]]
+        self._example_matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+
+    def _keyword_page(self, tokens: List[str]) -> Optional[str]:
+        hits = {
+            page for page, spec in self.routes.items()
+            if any(_fuzzy_in(token, spec["keywords"]) for token in tokens)
+        }
+        return hits.pop() if len(hits) == 1 else None
+
+    def _unexplained_words(self, tokens: List[str], page: str) -> int:
+        keywords = self.routes[page]["keywords"]
+        return sum(
+            1 for token in tokens
+            if token not in FILLER_WORDS and not _fuzzy_in(token, NAV_CUES) and not _fuzzy_in(token, keywords)
+        )
+
+    def _examples(self, model) -> np.ndarray:
+        with self._lock:
+            if self._example_matrix is None:
+                examples = [example for spec in self.routes.values() for example in spec["examples"]]
+                self._example_matrix = np.asarray(model.encode(examples, normalize_embeddings=True))
+            return self._example_matrix
+
+    def _embedding_page(self, message: str, model):
+        """Returns (page, score, margin) of the closest route by best-matching example."""
+        query = np.asarray(model.encode([message], normalize_embeddings=True))[0]
+        similarities = self._examples(model) @ query
+        best_per_page: Dict[str, float] = {}
+        for page, score in zip(self._example_pages, similarities):
+            best_per_page[page] = max(best_per_page.get(page, -1.0), float(score))
+        ranked = sorted(best_per_page.items(), key=lambda item: item[1], reverse=True)
+        margin = ranked[0][1] - ranked[1][1] if len(ranked) > 1 else ranked[0][1]
+        return ranked[0][0], ranked[0][1], margin
+
+    def route(self, message: str, model=None) -> Optional[Intent]:
+        """
+        Returns a navigation Intent when confident, else None.
+        `model` is an already-loaded SentenceTransformer; without it only keywords are used.
+        """
+        tokens = _tokens(message)
+        if not tokens or len(tokens) > MAX_ROUTABLE_WORDS:
+            return None
+        has_cue = any(_fuzzy_in(token, NAV_CUES) for token in tokens)
+        is_question = message.strip().endswith("?") or tokens[0] in QUESTION_WORDS
+        if is_question and not has_cue:
+            return None
+
+        keyword_page = self._keyword_page(tokens)
+        if has_cue and keyword_page and self._unexplained_words(tokens, keyword_page) <= MAX_UNEXPLAINED_WORDS:
+            return Intent(keyword_page, self.routes[keyword_page]["answer"], 0.9, "keywords")
+
+        if model is None:
+            return None
+        page, score, margin = self._embedding_page(message, model)
+        if score >= EMBEDDING_THRESHOLD and margin >= EMBEDDING_MARGIN and (has_cue or keyword_page == page):
+            return Intent(page, self.routes[page]["answer"], score, "embedding")
+        return None
+
+
+intent_router = IntentRouter()
@@ -0,0 +1,234 @@
+# backend/legal_chunker.py
+#
+# Single-pass chunker for judgments and other legal documents. Instead of
+# cutting every N characters, it walks the text once, splits it into
+# structural blocks (headings such as JUDGMENT/HELD, numbered paragraphs,
+# plain paragraphs) and packs whole blocks into chunks sized in embedding
+# model tokens. Only a block too long for one chunk is split, at sentence
+# boundaries that do not break citations ("Sec. 302", "(2010) 5 SCC 600",
+# "v.", "i.e."), and only then does the next chunk repeat a sentence of
+# overlap. Every chunk records its character offsets, pages (form feeds in
+# the extracted text, see uploads.extract_text_from_path) and section.
+
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+# all-MiniLM-L6-v2 truncates input at 256 word pieces, [CLS]/[SEP] included.
+DEFAULT_MAX_TOKENS = 250
+DEFAULT_OVERLAP_TOKENS = 40
+PAGE_BREAK = "\f"
+
+SECTION_HEADINGS = {
+    "JUDGMENT", "JUDGEMENT", "COMMON JUDGMENT", "ORDER", "FINAL ORDER", "HELD", "HEADNOTE", "FACTS",
+    "FACTS OF THE CASE", "BRIEF FACTS", "ISSUES", "POINTS FOR CONSIDERATION", "ANALYSIS", "DISCUSSION",
+    "FINDINGS", "REASONS", "CONCLUSION", "DECISION", "RESULT", "PRAYER",
+}
+ABBREVIATIONS = {
+    "no", "nos", "sec", "secs", "s", "ss", "art", "arts", "cl", "r", "rr", "o", "v", "vs", "cr", "crl", "p.c",
+    "i.e", "e.g", "viz", "cf", "etc", "ibid", "supra", "para", "paras", "pg", "p", "pp", "vol", "ch", "mr",
+    "mrs", "ms", "dr", "smt", "sri", "shri", "hon'ble", "ltd", "pvt", "co", "corpn", "ors", "anr", "govt",
+    "j", "jj", "c.j", "dt", "dtd", "w.e.f", "u/s", "rs", "sr", "st",
+}
+
+_WORD = re.compile(r"\w+|[^\w\s]")
+_LONG_WORD = re.compile(r"\w{9,}")
+_PARAGRAPH_NUMBER = re.compile(r"^\s*\(?(\d{1,3}(?:\.\d{1,2})?)[.)]\s+(?=\S)")
+_HEADING = re.compile(r"^[^a-z]*[A-Z][^a-z]*$")
+_SENTENCE_END = re.compile(r"[.?!][\"')\]]*\s+")
+_TRAILING_WORD = re.compile(r"([\w.'/]+)[.?!][\"')\]]*$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate word-piece count: words and punctuation, plus one for each long word."""
+    return len(_WORD.findall(text)) + len(_LONG_WORD.findall(text))
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """The longest prefix of `text`, cut before a word, whose estimate_tokens() fits `budget`."""
+    used = 0
+    for match in _WORD.finditer(text):
+        word = match.group()
+        used += 2 if len(word) >= 9 and _LONG_WORD.fullmatch(word) else 1
+        if used > budget:
+            return text[:match.start()].rstrip()
+    return text
+
+
+def tokenizer_counter(tokenizer) -> Callable[[str], int]:
+    """Exact counts from a Hugging Face tokenizer (e.g. SentenceTransformer(...).tokenizer)."""
+    return lambda text: len(tokenizer.tokenize(text))
+
+
+@dataclass
+class Chunk:
+    text: str
+    start: int
+    end: int
+    page_start: int
+    page_end: int
+    section: Optional[str]
+    paragraph: Optional[str]
+    tokens: int
+
+    def metadata(self) -> Dict:
+        """Chroma-compatible metadata (no None values)."""
+        meta = {"start": self.start, "end": self.end, "page_start": self.page_start, "page_end": self.page_end}
+        if self.section:
+            meta["section"] = self.section
+        if self.paragraph:
+            meta["paragraph"] = self.paragraph
+        return meta
+
+
+@dataclass
+class _Unit:
+    """A span packed as a whole: a block, or one sentence of a block too long for a chunk."""
+    start: int
+    end: int
+    tokens: int
+    block: int
+    heading: bool
+    section: Optional[str]
+    paragraph: Optional[str]
+
+
+class LegalChunker:
+    """Reusable and stateless between calls; see get_chunker for shared instances."""
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS,
+                 count_tokens: Callable[[str], int] = estimate_tokens):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens
+
+    # --- Structure ---
+    @staticmethod
+    def _section_of(line: str) -> Optional[str]:
+        name = re.sub(r"[^A-Z ]", "", line.upper()).strip()
+        return name if name in SECTION_HEADINGS else None
+
+    def _blocks(self, text: str) -> List[Tuple[int, int, bool, Optional[str], Optional[str]]]:
+        """(start, end, is_heading, section, paragraph number) of each structural block, in one scan."""
+        blocks = []
+        section = None
+        block_start = block_end = None
+        block_paragraph = None
+        position = 0
+        while position <= len(text):
+            newline = text.find("\n", position)
+            line_end = len(text) if newline < 0 else newline
+            raw = text[position:line_end]
+            line = raw.strip(" \t\r" + PAGE_BREAK)
+            line_start = position + (len(raw) - len(raw.lstrip(" \t\r" + PAGE_BREAK)))
+            paragraph_match = _PARAGRAPH_NUMBER.match(line) if line else None
+            is_heading = bool(line) and len(line.split()) <= 10 and bool(_HEADING.match(line)) and not paragraph_match
+            if block_start is not None and (not line or is_heading or paragraph_match):
+                blocks.append((block_start, block_end, False, section, block_paragraph))
+                block_start = None
+            if is_heading:
+                section = self._section_of(line) or section
+                blocks.append((line_start, line_start + len(line), True, section, None))
+            elif line:
+                if block_start is None:
+                    block_start, block_paragraph = line_start, paragraph_match.group(1) if paragraph_match else None
+                block_end = line_start + len(line)
+            if newline < 0:
+                break
+            position = newline + 1
+        if block_start is not None:
+            blocks.append((block_start, block_end, False, section, block_paragraph))
+        return blocks
+
+    def _sentences(self, text: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Sentence spans within [start, end), not splitting after abbreviations or initials."""
+        spans, sentence_start = [], start
+        for match in _SENTENCE_END.finditer(text, start, end):
+            word = _TRAILING_WORD.search(text, sentence_start, match.start() + 1)
+            previous = word.group(1).lower() if word else ""
+            following = text[match.end():match.end() + 1]
+            if previous in ABBREVIATIONS or len(previous) == 1 or (following and not (following.isupper() or following in "(\"'")):
+                continue
+            spans.append((sentence_start, match.start() + 1))
+            sentence_start = match.end()
+        if sentence_start < end:
+            spans.append((sentence_start, end))
+        return spans
+
+    def _split_words(self, text: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Last resort for a single sentence longer than a chunk: whole words up to the limit."""
+        spans, piece_start, piece_end, used = [], start, start, 0
+        for match in re.finditer(r"\S+", text[start:end]):
+            cost = self.count_tokens(match.group())
+            if used and used + cost > self.max_tokens:
+                spans.append((piece_start, piece_end))
+                piece_start, used = start + match.start(), 0
+            piece_end = start + match.end()
+            used += cost
+        spans.append((piece_start, piece_end))
+        return spans
+
+    def _units(self, text: str) -> List[_Unit]:
+        units = []
+        for index, (start, end, heading, section, paragraph) in enumerate(self._blocks(text)):
+            tokens = self.count_tokens(text[start:end])
+            if tokens <= self.max_tokens:
+                units.append(_Unit(start, end, tokens, index, heading, section, paragraph))
+                continue
+            for sentence_start, sentence_end in self._sentences(text, start, end):
+                pieces = [(sentence_start, sentence_end)]
+                if self.count_tokens(text[sentence_start:sentence_end]) > self.max_tokens:
+                    pieces = self._split_words(text, sentence_start, sentence_end)
+                for piece_start, piece_end in pieces:
+                    units.append(_Unit(piece_start, piece_end, self.count_tokens(text[piece_start:piece_end]),
+                                       index, False, section, paragraph))
+        return units
+
+    # --- Packing ---
+    def split(self, text: str) -> List[Chunk]:
+        """Chunks of `text` of up to about max_tokens each (a carried heading may add a few)."""
+        page_breaks = [i for i, ch in enumerate(text) if ch == PAGE_BREAK]
+        page_of = lambda offset: bisect_right(page_breaks, offset) + 1
+        chunks: List[Chunk] = []
+        current: List[_Unit] = []
+
+        def emit(final: bool = False):
+            # A heading belongs with the content after it, never at the end of a chunk;
+            # headings that end the document have nothing after them and are kept.
+            trailing = []
+            while not final and current and current[-1].heading:
+                trailing.insert(0, current.pop())
+            if current:
+                start, end = current[0].start, current[-1].end
+                paragraph = next((u.paragraph for u in current if u.paragraph), None)
+                section = next((u.section for u in current if not u.heading and u.section), current[0].section)
+                chunks.append(Chunk(text[start:end], start, end, page_of(start), page_of(end - 1), section,
+                                    paragraph, sum(u.tokens for u in current)))
+            return trailing
+
+        for unit in self._units(text):
+            used = sum(u.tokens for u in current)
+            starts_section = unit.heading and self._section_of(text[unit.start:unit.end]) is not None
+            if current and (used + unit.tokens > self.max_tokens or (starts_section and not current[-1].heading)):
+                previous = current[-1]
+                carried = emit()
+                # Repeat the end of a block that continues into the next chunk.
+                if not carried and previous.block == unit.block and previous.tokens <= self.overlap_tokens \
+                        and previous.tokens + unit.tokens <= self.max_tokens:
+                    carried = [previous]
+                current[:] = carried
+            current.append(unit)
+        emit(final=True)
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        """Chunk texts only (same shape as a LangChain splitter's split_text)."""
+        return [chunk.text for chunk in self.split(text)]
+
+
+@lru_cache(maxsize=32)
+def get_chunker(max_tokens: int = DEFAULT_MAX_TOKENS, overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> LegalChunker:
+    """Shared chunker per configuration, instead of building a splitter for every document."""
+    return LegalChunker(max_tokens, overlap_tokens)
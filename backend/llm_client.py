@@ -0,0 +1,292 @@
+# backend/llm_client.py
+#
+# One shared async client for every LLM call. It smooths bursts with a token
+# bucket, caps concurrency globally and per user (keeping a few slots free
+# for interactive chat), retries 429/5xx responses
+# with jittered exponential backoff, and can hedge slow calls with a second
+# request. The backend is pluggable: Gemini in production, or a local stub
+# that returns canned responses so the whole pipeline can be load-tested
+# offline (LLM_BACKEND=stub).
+
+import asyncio
+import contextlib
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Operations a user is actively waiting on; they may use the reserved slots.
+INTERACTIVE_OPERATIONS = frozenset({"chat", "chat_summary", "suggested_questions"})
+# structured_output.py re-asks a failed parse as "<operation>_reask".
+REASK_SUFFIX = "_reask"
+
+
+def is_interactive(operation: str) -> bool:
+    """Whether a user is waiting on the call; re-asks count as their base operation."""
+    return operation.removesuffix(REASK_SUFFIX) in INTERACTIVE_OPERATIONS
+
+
+class LLMError(Exception):
+    """An LLM call failed; `status_code` is the upstream HTTP status when known."""
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LLMRateLimitedError(LLMError):
+    """The provider kept answering 429 after all retries."""
+    def __init__(self, message: str):
+        super().__init__(message, status_code=429)
+
+
+def status_code_of(error: BaseException) -> Optional[int]:
+    """Best-effort HTTP status of a provider exception (google.api_core errors carry `.code`)."""
+    for attr in ("status_code", "code"):
+        code = getattr(error, attr, None)
+        if isinstance(code, int):
+            return code
+    # Some SDK errors only carry the status in their message.
+    if metrics.is_rate_limit_error(error):
+        return 429
+    match = re.search(r"\b(50[0234])\b", str(error))
+    return int(match.group(1)) if match else None
+
+
+# --- Rate Limiting ---
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `capacity`."""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# --- Backends ---
+class GeminiBackend:
+    """Calls Gemini through google.generativeai (imported lazily via `startup`)."""
+    def __init__(self, api_key: str, model_name: str, chat_system_instruction: Optional[str] = None):
+        import startup
+        genai = startup.genai()
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        self.chat_model = genai.GenerativeModel(model_name, system_instruction=chat_system_instruction)
+
+    async def generate(self, operation: str, prompt: str, history: Optional[List[Dict]] = None,
+                       generation_config: Optional[Dict[str, Any]] = None):
+        if history is not None:
+            # Chat turns use the model configured with the chat system instruction.
+            chat = self.chat_model.start_chat(history=history)
+            return await chat.send_message_async(prompt, generation_config=generation_config)
+        return await self.model.generate_content_async(prompt, generation_config=generation_config)
+
+
+@dataclass
+class StubResponse:
+    text: str
+    usage_metadata: Any = None
+
+
+class StubBackend:
+    """Offline backend: answers each operation with a small, well-formed canned response."""
+    def __init__(self, latency_seconds: float = 0.2):
+        self.latency_seconds = latency_seconds
+
+    def _canned(self, operation: str, prompt: str) -> Any:
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", prompt) if len(s.strip()) > 40]
+        if operation == "brief":
+            return {
+                "one_sentence_summary": sentences[0][:200] if sentences else "Stub summary.",
+                "detailed_summary": " ".join(sentences[:3])[:1000] or "Stub detailed summary.",
+                "key_arguments": ["Stub argument one.", "Stub argument two."],
+                "involved_parties": ["Petitioner", "Respondent"],
+            }
+        if operation == "ner":
+            return {
+                "people": sorted(set(re.findall(r"\b[A-Z][a-z]+ [A-Z][a-z]+\b", prompt)))[:5],
+                "dates": sorted(set(re.findall(r"\b\d{1,2} [A-Z][a-z]+ \d{4}\b", prompt)))[:5],
+                "locations": [], "organizations": [],
+                "laws_articles": sorted(set(re.findall(r"\bSection \d+[A-Z]?\b", prompt)))[:5],
+            }
+        if operation == "semantic_queries":
+            return {"queries": [s[:200] for s in sentences[:3]] or ["stub legal query"]}
+        if operation == "precedent_analysis":
+            count = prompt.count("--- PRECEDENT CASE:")
+            return {
+                "precedent_analyses": [{"facts": "Stub facts.", "holding": "Stub holding.", "relevance": "Stub relevance."}] * count,
+                "overall_relevance": "Stub overall relevance.",
+            }
+        if operation == "contradictions":
+            return {"contradiction_report": ["No direct contradictions were found."]}
+        if operation == "chat":
+            return {"response_type": "answer", "answer": "This is a stub answer."}
+        if operation == "suggested_questions":
+            return {"questions": ["What is the main issue?", "Who are the parties?", "What was held?"]}
+        if operation == "document_analysis":
+            return {
+                "brief": self._canned("brief", prompt),
+                "entities": self._canned("ner", prompt),
+                "search_queries": self._canned("semantic_queries", prompt)["queries"],
+                "suggested_questions": self._canned("suggested_questions", prompt)["questions"],
+            }
+        return "Stub response."
+
+    async def generate(self, operation: str, prompt: str, history: Optional[List[Dict]] = None,
+                       generation_config: Optional[Dict[str, Any]] = None):
+        await asyncio.sleep(self.latency_seconds * random.uniform(0.5, 1.5))
+        canned = self._canned(operation, prompt)
+        return StubResponse(text=canned if isinstance(canned, str) else json.dumps(canned))
+
+
+# --- Client ---
+class LLMClient:
+    """Rate-limited, concurrency-capped, retrying front door to an LLM backend."""
+    def __init__(
+        self,
+        backend,
+        requests_per_minute: float = 60,
+        burst: int = 10,
+        max_concurrency: int = 8,
+        per_user_concurrency: int = 2,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        hedge_after_seconds: float = 0.0,
+        interactive_reserve: int = 0,
+    ):
+        self.backend = backend
+        self.bucket = TokenBucket(rate=requests_per_minute / 60.0, capacity=burst)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_after_seconds = hedge_after_seconds
+        self.per_user_concurrency = per_user_concurrency
+        self._global_slots = asyncio.Semaphore(max_concurrency)
+        # Batch operations share fewer slots, leaving `interactive_reserve` free for chat.
+        self._batch_slots = asyncio.Semaphore(max(1, max_concurrency - interactive_reserve))
+        # Per user, a semaphore and the number of calls holding or waiting on it;
+        # the entry is dropped when that reaches zero, so idle users cost nothing.
+        self._user_slots: Dict[int, List] = {}
+
+    @contextlib.asynccontextmanager
+    async def _user_slot(self, user_id: Optional[int]):
+        if user_id is None:
+            yield
+            return
+        entry = self._user_slots.setdefault(user_id, [asyncio.Semaphore(self.per_user_concurrency), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._user_slots[user_id]
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": spreads retries out so callers don't retry in lockstep.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _attempt(self, operation: str, prompt: str, history, generation_config):
+        await self.bucket.acquire()
+        call = lambda: self.backend.generate(operation, prompt, history=history, generation_config=generation_config)
+        if self.hedge_after_seconds <= 0:
+            return await call()
+
+        tasks = [asyncio.ensure_future(call())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after_seconds)
+            # Only hedge when it fits in the rate budget; otherwise keep waiting on the primary.
+            if done or not self.bucket.try_acquire():
+                return await tasks[0]
+            metrics.LLM_HEDGES.inc(operation=operation)
+            tasks.append(asyncio.ensure_future(call()))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def generate(self, operation: str, prompt: str, user_id: Optional[int] = None,
+                       history: Optional[List[Dict]] = None, generation_config: Optional[Dict[str, Any]] = None):
+        """
+        Runs one LLM call. Retries 429/5xx up to `max_retries` times, then raises
+        LLMRateLimitedError (persistent 429) or LLMError (anything else).
+        """
+        batch_slots = None if is_interactive(operation) else self._batch_slots
+        queued_at = time.perf_counter()
+        async with contextlib.AsyncExitStack() as slots:
+            await slots.enter_async_context(self._user_slot(user_id))
+            for semaphore in (batch_slots, self._global_slots):
+                if semaphore is not None:
+                    await slots.enter_async_context(semaphore)
+            metrics.LLM_QUEUE_SECONDS.observe(time.perf_counter() - queued_at, operation=operation)
+            with metrics.track_llm(operation):
+                response = await self._generate_with_retries(operation, prompt, history, generation_config)
+            metrics.record_llm_usage(operation, response)
+            return response
+
+    async def _generate_with_retries(self, operation: str, prompt: str, history, generation_config):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._attempt(operation, prompt, history, generation_config)
+            except Exception as e:
+                status_code = status_code_of(e)
+                if status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                    if status_code == 429:
+                        raise LLMRateLimitedError(f"LLM quota exceeded for '{operation}': {e}") from e
+                    raise LLMError(f"LLM call '{operation}' failed: {e}", status_code=status_code) from e
+                delay = self._backoff(attempt)
+                metrics.LLM_RETRIES.inc(operation=operation, status=status_code)
+                print(f"LLM call '{operation}' got {status_code}; retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries}).")
+                await asyncio.sleep(delay)
+
+
+def create_llm_client(settings, chat_system_instruction: Optional[str] = None) -> Optional[LLMClient]:
+    """Builds the shared client from settings; returns None when no backend is configured."""
+    if settings.LLM_BACKEND == "stub":
+        backend = StubBackend(latency_seconds=settings.LLM_STUB_LATENCY_MS / 1000)
+    elif settings.GEMINI_API_KEY:
+        backend = GeminiBackend(settings.GEMINI_API_KEY, settings.LLM_MODEL_NAME, chat_system_instruction)
+    else:
+        return None
+    return LLMClient(
+        backend,
+        requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE,
+        burst=settings.LLM_BURST,
+        max_concurrency=settings.LLM_MAX_CONCURRENCY,
+        per_user_concurrency=settings.LLM_PER_USER_CONCURRENCY,
+        max_retries=settings.LLM_MAX_RETRIES,
+        hedge_after_seconds=settings.LLM_HEDGE_AFTER_SECONDS,
+        interactive_reserve=settings.LLM_INTERACTIVE_RESERVE,
+    )
@@ -2,99 +2,129 @@
 
 # --- Core Imports ---
 import os
-import io
 import json
 import re 
 import shutil
 import subprocess
 import sys
+import time
+import threading
 from contextlib import asynccontextmanager
-from typing import List, Optional, Dict, Any, AsyncGenerator
+from typing import List, Optional, Dict, Any, AsyncGenerator, TYPE_CHECKING
 import asyncio
 
 # --- Library Imports ---
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, BackgroundTasks, Body
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, BackgroundTasks, Body, Query
 # --- REVERTED: Removed StreamingResponse ---
 from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.requests import Request
 from sqlalchemy.ext.asyncio import AsyncSession
-from sentence_transformers import SentenceTransformer
 
 # --- AI & DB Imports ---
-import google.generativeai as genai
-from google.generativeai.types import GenerationConfig
-import chromadb
-from chromadb.utils import embedding_functions
-import pypdf
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+# sentence-transformers, chromadb, langchain and the Gemini SDK are imported on
+# first use through the `startup` accessors so importing this module stays fast.
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 # --- Local Module Imports ---
-import models, schemas, crud, auth
+import models, schemas, crud, auth, stats, metrics, uploads, storage, precedent_context, startup, llm_client, structured_output, retrieval_settings, global_corpus, legal_chunker, analysis_results, feedback_adapter, admission, profiler, vector_maintenance
+from retrieval_settings import RetrievalParams, DEFAULT_PARAMS
+from chat_sessions import chat_sessions, SYSTEM_INSTRUCTION as CHAT_SYSTEM_INSTRUCTION
+from intent_router import intent_router
 from config import settings
-from database import engine as main_engine, Base, get_db
+from database import engine as main_engine, Base, SessionLocal, get_db
 
 # --- Global Variables & Path Definitions ---
-gemini_model = None
-chat_model = None
+# Shared LLM client (rate limiting, retries, concurrency caps); see llm_client.py.
+llm: Optional[llm_client.LLMClient] = None
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
-DOCUMENTS_PATH = os.path.join(BACKEND_DIR, "case_documents")
+DOCUMENTS_PATH = storage.DOCUMENTS_PATH
 USER_CHROMA_PATH = os.path.join(BACKEND_DIR, "user_chroma_dbs")
 BASE_MODEL_NAME = "all-MiniLM-L6-v2"
+CHAT_CONTEXT_TOP_K = 5
+_warmup_task: Optional[asyncio.Task] = None
 
 # --- Helper Functions ---
 
-def get_user_collection(user_id: int):
-    user_db_path = os.path.join(USER_CHROMA_PATH, f"user_{user_id}")
-    embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=BASE_MODEL_NAME)
-    client = chromadb.PersistentClient(path=user_db_path)
-    return client.get_or_create_collection(name=f"precedents_user_{user_id}", embedding_function=embedding_function)
+_user_collections: Dict[int, Any] = {}
+# Store generation each cached handle was opened at; a maintenance swap bumps it (see vector_maintenance.py).
+_user_collection_generations: Dict[int, int] = {}
+_user_collections_lock = threading.Lock()
+
+def get_user_collection(user_id: int, params: Optional[RetrievalParams] = None):
+    """
+    Opens a user's Chroma collection once per process and reuses it afterwards.
+    `params` only matter when the collection is created (HNSW settings are fixed at creation).
+    """
+    generation = vector_maintenance.generation(user_id)
+    collection = _user_collections.get(user_id)
+    if collection is not None and _user_collection_generations.get(user_id) == generation:
+        return collection
+    with _user_collections_lock:
+        if user_id not in _user_collections or _user_collection_generations.get(user_id) != generation:
+            user_db_path = os.path.join(USER_CHROMA_PATH, f"user_{user_id}")
+            embedding_function = user_embedding_function()
+            client = startup.chromadb().PersistentClient(path=user_db_path)
+            name = f"precedents_user_{user_id}"
+            try:
+                collection = client.get_collection(name=name, embedding_function=embedding_function)
+            except Exception:
+                collection = vector_maintenance.recover_collection(client, name, embedding_function)
+            if collection is None:
+                metadata = (params or DEFAULT_PARAMS).collection_metadata()
+                collection = client.create_collection(name=name, embedding_function=embedding_function, metadata=metadata)
+            _user_collections[user_id] = collection
+            _user_collection_generations[user_id] = generation
+        return _user_collections[user_id]
+
+def user_embedding_function():
+    return startup.embedding_functions().SentenceTransformerEmbeddingFunction(model_name=BASE_MODEL_NAME)
+
+def replace_user_collection(user_id: int, collection) -> None:
+    """Points this process at a rebuilt collection (see vector_maintenance.py)."""
+    with _user_collections_lock:
+        _user_collections[user_id] = collection
+        _user_collection_generations[user_id] = vector_maintenance.generation(user_id)
 
 def get_user_specific_paths(user_id: int):
     user_model_dir = os.path.join(BACKEND_DIR, "user_models", str(user_id))
     return {"path": user_model_dir, "exists": os.path.exists(user_model_dir)}
 
-def load_model_for_user(user_id: int) -> SentenceTransformer:
+_base_model: Optional["SentenceTransformer"] = None
+_base_model_lock = threading.Lock()
+
+def get_base_model() -> "SentenceTransformer":
+    """Loads the shared base embedding model once per process."""
+    global _base_model
+    with _base_model_lock:
+        if _base_model is None:
+            print(f"Loading base embedding model: {BASE_MODEL_NAME}")
+            _base_model = startup.sentence_transformer_cls()(BASE_MODEL_NAME)
+            startup.state.base_model_loaded = True
+        return _base_model
+
+def get_loaded_base_model() -> Optional["SentenceTransformer"]:
+    """Returns the base model only if it is already in memory (never triggers a load)."""
+    return _base_model
+
+def load_model_for_user(user_id: int) -> "SentenceTransformer":
     user_paths = get_user_specific_paths(user_id)
     if user_paths["exists"]:
         print(f"Loading personalized model for user {user_id}.")
         model_path_to_load = user_paths["path"]
     else:
         print(f"No personalized model found for user {user_id}. Using base model.")
-        model_path_to_load = BASE_MODEL_NAME
+        return get_base_model()
     print(f"Loading embedding model from: {model_path_to_load}")
-    return SentenceTransformer(model_path_to_load)
+    return startup.sentence_transformer_cls()(model_path_to_load)
 
-async def read_upload_file_content(upload_file: UploadFile) -> bytes:
-    """Asynchronously reads the content of an UploadFile."""
-    return await upload_file.read()
-
-def save_file_content(file_content: bytes, destination: str) -> None:
-    """Saves bytes content to a destination file."""
-    try:
-        os.makedirs(os.path.dirname(destination), exist_ok=True)
-        with open(destination, "wb") as buffer:
-            buffer.write(file_content)
-    except Exception as e:
-        print(f"Error saving file to {destination}: {e}")
-        raise HTTPException(status_code=500, detail="Could not save file.")
-
-def get_text_from_upload(file_content: bytes, content_type: Optional[str]) -> str:
-    text = ""
-    if content_type == 'application/pdf':
-        try:
-            pdf_reader = pypdf.PdfReader(io.BytesIO(file_content))
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-        except Exception as e:
-            print(f"Error reading PDF content: {e}")
-            return ""
-    elif content_type and 'text' in content_type:
-        try:
-            text = file_content.decode('utf-8')
-        except UnicodeDecodeError:
-            text = file_content.decode('latin-1')
-    return text
+def require_llm() -> llm_client.LLMClient:
+    if llm is None:
+        raise HTTPException(status_code=500, detail="Gemini API not configured.")
+    return llm
 
 def find_entity_in_text(full_text: str, entity: str) -> List[str]:
     sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?|!)\s', full_text)
@@ -105,7 +135,7 @@ def find_entity_in_text(full_text: str, entity: str) -> List[str]:
             found_sentences.append(sentence.strip())
     return found_sentences
 
-async def get_semantic_queries_from_gemini(text: str) -> List[str]:
+async def get_semantic_queries_from_gemini(text: str, user_id: Optional[int] = None) -> List[str]:
     print("Generating semantic queries with Gemini...")
     prompt = f"""
     You are a legal research expert. Based on the following legal document text, generate a JSON object containing a single key "queries".
@@ -120,18 +150,14 @@ async def get_semantic_queries_from_gemini(text: str) -> List[str]:
 
     **IMPORTANT: Respond ONLY with the raw JSON object.**
     """
-    response = None # [FIX] Define response here
     try:
-        response = await gemini_model.generate_content_async(prompt)
-        cleaned_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        data = json.loads(cleaned_text)
-        queries = data.get("queries", [])
-        print(f"Generated {len(queries)} semantic queries.")
-        return queries
-    # [FIX] More specific exception handling
-    except (json.JSONDecodeError, KeyError, AttributeError) as e:
+        output = await structured_output.generate_structured(
+            require_llm(), "semantic_queries", prompt, schemas.SemanticQueriesOutput, user_id=user_id
+        )
+        print(f"Generated {len(output.queries)} semantic queries.")
+        return output.queries
+    except structured_output.StructuredOutputError as e:
         print(f"Error parsing JSON for semantic queries: {e}")
-        print(f"[RAW LLM RESPONSE]: {response.text if response else 'No response'}")
         return [] # Return empty list on failure, don't crash
     except Exception as e:
         print(f"Error generating semantic queries from Gemini: {e}")
@@ -149,21 +175,50 @@ def reciprocal_rank_fusion(search_results_lists: List[List[str]], k: int = 60) -
     print(f"Fused {len(reranked_results)} unique documents.")
     return reranked_results
 
-def add_document_to_vector_store(user_id: int, text: str, filename: str):
+def add_document_to_vector_store(user_id: int, text: str, filename: str, params: RetrievalParams = DEFAULT_PARAMS,
+                                  sha256: Optional[str] = None):
     if not text.strip():
         print(f"Skipping empty document: {filename}")
         return
+    # Documents already in the shared corpus are searched there, not copied into the user's overlay.
+    corpus = global_corpus.get_global_corpus()
+    global_name = corpus.filename_for_sha256(sha256) if corpus else None
+    if global_name is not None:
+        print(f"Document {filename} is in the global corpus as {global_name}. Not indexing it per user.")
+        return
     print(f"Processing and chunking document: {filename}")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=200, length_function=len)
-    chunks = text_splitter.split_text(text)
+    chunks = legal_chunker.get_chunker(params.chunk_size, params.chunk_overlap).split(text)
+    if not chunks:
+        print(f"Skipping empty document: {filename}")
+        return
     chunk_ids = [f"{filename}-chunk-{i}" for i, _ in enumerate(chunks)]
-    metadatas = [{"filename": filename} for _ in chunks]
-    collection = get_user_collection(user_id)
-    if not collection.get(ids=[chunk_ids[0]])['ids']:
-        collection.add(documents=chunks, metadatas=metadatas, ids=chunk_ids)
+    # The content hash lets a re-upload with new content replace the old chunks.
+    version = {"sha256": sha256} if sha256 else {}
+    metadatas = [{"filename": filename, **chunk.metadata(), **version} for chunk in chunks]
+    collection = get_user_collection(user_id, params)
+    with vector_maintenance.user_lock(user_id):
+        existing = collection.get(ids=[chunk_ids[0]], include=["metadatas"])
+        if existing['ids']:
+            indexed_sha256 = (existing['metadatas'][0] or {}).get("sha256")
+            if sha256 is None or indexed_sha256 in (None, sha256):
+                print(f"Document {filename} already exists in the vector store. Skipping.")
+                return
+            print(f"Document {filename} changed since it was indexed. Replacing its chunks.")
+            collection.delete(where={"filename": filename})
+        collection.add(documents=[chunk.text for chunk in chunks], metadatas=metadatas, ids=chunk_ids)
         print(f"Added {len(chunks)} chunks for {filename} to the vector store.")
-    else:
-        print(f"Document {filename} already exists in the vector store. Skipping.")
+
+def retrieve_case_file_chunks(user_id: int, filename: str, question: str, k: int = CHAT_CONTEXT_TOP_K,
+                              sha256: Optional[str] = None) -> List[str]:
+    """Returns the k chunks of one stored document most relevant to a chat question."""
+    corpus = global_corpus.get_global_corpus()
+    global_name = corpus.filename_for_sha256(sha256) if corpus else None
+    if global_name is not None:
+        return corpus.query_document(global_name, get_base_model().encode(question), k)[1]
+    collection = get_user_collection(user_id)
+    results = collection.query(query_texts=[question], n_results=k, where={"filename": filename})
+    documents = results.get("documents") or [[]]
+    return documents[0]
 
 def run_fine_tuning_script(user_id: int):
     script_path = os.path.join(BACKEND_DIR, "fine_tune_model.py")
@@ -178,10 +233,83 @@ def run_fine_tuning_script(user_id: int):
     except Exception as e:
         print(f"An error occurred while running fine-tuning for user {user_id}: {e}")
 
+async def run_admitted_fine_tuning(user_id: int):
+    """Runs the retrain once admitted; it queues without a time limit since nobody is waiting on it."""
+    try:
+        ticket = await admission.controller.acquire(user_id, "retrain", bounded_wait=False)
+    except HTTPException as e:
+        print(f"Fine-tuning for user {user_id} was not admitted: {e.detail}")
+        return
+    try:
+        await run_in_threadpool(run_fine_tuning_script, user_id)
+    finally:
+        admission.controller.release(ticket)
+
+async def analyze_document(text: str, user_id: Optional[int] = None, need_queries: bool = True) -> schemas.DocumentAnalysisOutput:
+    """
+    Brief, entities, search queries and suggested questions for one document.
+    By default this is one structured call carrying a single copy of the text;
+    with COMBINED_DOCUMENT_ANALYSIS off, each part is requested separately and
+    suggested questions are left for /generate-suggested-questions.
+    """
+    if not settings.COMBINED_DOCUMENT_ANALYSIS:
+        brief = await generate_intelligent_brief(text, user_id)
+        entities = await generate_ner_analysis(text, user_id)
+        queries = await get_semantic_queries_from_gemini(text, user_id) if need_queries else []
+        return schemas.DocumentAnalysisOutput(brief=brief, entities=entities, search_queries=queries)
+
+    prompt = f"""
+    You are an expert legal analyst. Analyze the following legal document and complete ALL of the tasks below in one JSON object.
+
+    **LEGAL DOCUMENT TEXT:**
+    ---
+    {text}
+    ---
+
+    **YOUR TASKS:**
+    1. "brief": an object with
+       - "one_sentence_summary": A single, concise sentence.
+       - "detailed_summary": A comprehensive paragraph.
+       - "key_arguments": A JSON array of strings for key legal arguments.
+       - "involved_parties": A JSON array of strings for involved parties.
+    2. "entities": an object whose keys are JSON arrays of unique strings found in the document:
+       - "people": Names of individuals (e.g., "John Doe").
+       - "dates": Specific dates (e.g., "July 5th, 2023").
+       - "locations": Cities, states, or specific courts (e.g., "High Court of Delhi").
+       - "organizations": Companies, firms, or government bodies (e.g., "U.P. State Agro Industries Corporation").
+       - "laws_articles": Specific laws, sections, or articles cited (e.g., "Article 311 of the Constitution").
+    3. "search_queries": a JSON array of 3 to 5 alternative search queries that capture the core legal concepts,
+       principles, and factual patterns of the document, rephrasing the core dispute in different legal terms.
+    4. "suggested_questions": a JSON array of 3 insightful, concise follow-up questions a user might ask about
+       this document, directly related to its key entities and arguments.
+
+    **IMPORTANT: Respond ONLY with the raw JSON object.**
+    """
+    try:
+        return await structured_output.generate_structured(
+            require_llm(), "document_analysis", prompt, schemas.DocumentAnalysisOutput, user_id=user_id
+        )
+    except structured_output.StructuredOutputError as e:
+        print(f"[CRITICAL JSON PARSE ERROR - DOCUMENT ANALYSIS]: {e}")
+        raise HTTPException(status_code=422, detail="AI model returned an invalid format for the document analysis.")
+    except llm_client.LLMRateLimitedError as e:
+        raise HTTPException(status_code=429, detail=f"API Quota Exceeded: {e}")
+    except Exception as e:
+        print(f"Unknown error in analyze_document: {e}")
+        raise HTTPException(status_code=500, detail="An error occurred while analyzing the document.")
+
 # [FIX] This is the main function that was causing your 500 error
-def generate_intelligent_brief(text: str) -> Dict[str, Any]:
-    if not gemini_model:
-        raise HTTPException(status_code=500, detail="Gemini API not configured.")
+async def analyze_stored_upload(db: AsyncSession, user_id: int, filename: str, text: str,
+                                need_queries: bool = True) -> schemas.DocumentAnalysisOutput:
+    """analyze_document for a just-stored upload; if it fails, the upload is dropped again unless a case file uses it."""
+    try:
+        return await analyze_document(text, user_id, need_queries=need_queries)
+    except Exception:
+        await storage.release_unowned_document(db, user_id, filename)
+        raise
+
+async def generate_intelligent_brief(text: str, user_id: Optional[int] = None) -> Dict[str, Any]:
+    client = require_llm()
     prompt = f"""
     You are an expert legal analyst. Analyze the following document...
     **LEGAL DOCUMENT TEXT:**
@@ -196,30 +324,25 @@ def generate_intelligent_brief(text: str) -> Dict[str, Any]:
     - "involved_parties": A JSON array of strings for involved parties.
     **IMPORTANT: Respond ONLY with the raw JSON object.**
     """
-    response = None # [FIX] Define response here
     try:
-        response = gemini_model.generate_content(prompt)
-        json_string = response.text.strip().replace("```json", "").replace("```", "").strip()
-        return json.loads(json_string)
+        output = await structured_output.generate_structured(client, "brief", prompt, schemas.BriefOutput, user_id=user_id)
+        return output.model_dump()
 
-    # [FIX] This is the specific fix for your 500 error.
-    # We catch the JSONDecodeError specifically.
-    except json.JSONDecodeError as e:
+    # Only raised once local repair and a single re-ask have both failed.
+    except structured_output.StructuredOutputError as e:
         print(f"[CRITICAL JSON PARSE ERROR - BRIEF]: {e}")
-        print(f"[RAW LLM RESPONSE]: {response.text if response else 'No response'}")
         # We raise a 422 error (Unprocessable Entity) which is more accurate
         raise HTTPException(status_code=422, detail="AI model returned an invalid format for intelligent brief.")
     
+    except llm_client.LLMRateLimitedError as e:
+        raise HTTPException(status_code=429, detail=f"API Quota Exceeded: {e}")
     except Exception as e:
-        if "429" in str(e):
-            raise HTTPException(status_code=429, detail=f"API Quota Exceeded: {e}")
         # [FIX] We log the unknown error
         print(f"Unknown error in generate_intelligent_brief: {e}")
         raise HTTPException(status_code=500, detail="An error occurred while generating the brief.")
 
-def generate_ner_analysis(text: str) -> Dict[str, Any]:
-    if not gemini_model:
-        raise HTTPException(status_code=500, detail="Gemini API not configured.")
+async def generate_ner_analysis(text: str, user_id: Optional[int] = None) -> Dict[str, Any]:
+    client = require_llm()
     
     prompt = f"""
     You are an expert paralegal. Your task is to perform Named Entity Recognition (NER) on the following legal document.
@@ -236,47 +359,98 @@ def generate_ner_analysis(text: str) -> Dict[str, Any]:
     - "laws_articles": Specific laws, sections, or articles cited (e.g., "Article 311 of the Constitution", "Section 12-AA of the Income Tax Act").
     **IMPORTANT: Respond ONLY with the raw JSON object, without any surrounding text or markdown formatting.**
     """
-    response = None # [FIX] Define response here
     try:
-        response = gemini_model.generate_content(prompt)
-        json_string = response.text.strip().replace("```json", "").replace("```", "").strip()
-        return json.loads(json_string)
+        output = await structured_output.generate_structured(client, "ner", prompt, schemas.EntityOutput, user_id=user_id)
+        return output.model_dump()
 
     # [FIX] More specific exception handling
-    except json.JSONDecodeError as e:
+    except structured_output.StructuredOutputError as e:
         print(f"[JSON PARSE ERROR - NER]: {e}")
-        print(f"[RAW LLM RESPONSE]: {response.text if response else 'No response'}")
         raise HTTPException(status_code=422, detail="The AI model returned an unexpected format for NER.")
     
+    except llm_client.LLMRateLimitedError:
+        raise HTTPException(status_code=429, detail=f"API Quota Exceeded during entity analysis.")
     except Exception as e:
-        if "429" in str(e):
-            raise HTTPException(status_code=429, detail=f"API Quota Exceeded during entity analysis.")
         print(f"Unknown error in generate_ner_analysis: {e}")
         raise HTTPException(status_code=500, detail="The AI model returned a response in an unexpected format for NER.")
 
 # --- Lifespan Manager ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    metrics.configure_logging()
     print("Application startup...")
-    global gemini_model, chat_model
+    global llm, _warmup_task
     os.makedirs(DOCUMENTS_PATH, exist_ok=True)
     os.makedirs(USER_CHROMA_PATH, exist_ok=True)
     try:
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        # [FIX] Changed model name to the correct, stable version
-        gemini_model = genai.GenerativeModel('gemini-flash-latest')
-        chat_model = genai.GenerativeModel('gemini-flash-latest')
-        print("Gemini API configured successfully.")
+        llm = llm_client.create_llm_client(settings, chat_system_instruction=CHAT_SYSTEM_INSTRUCTION)
+        if llm is None:
+            print("WARNING: GEMINI_API_KEY is not set; AI features are disabled.")
+        else:
+            startup.state.llm_configured = True
+            print(f"LLM client configured ({settings.LLM_BACKEND} backend).")
     except Exception as e:
         print(f"CRITICAL ERROR: Failed to configure Gemini API: {e}")
     async with main_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+    startup.state.database_ready = True
     print("Main SQL database tables created/verified.")
+    if settings.ADMIN_USERNAMES:
+        print("WARNING: ADMIN_USERNAMES is ignored; grant admin rights with `python manage_admins.py grant <username>`.")
+
+    # Load the embedding model and open the most recently used vector stores in
+    # the background, so the server accepts requests (and /healthz) immediately.
+    async with SessionLocal() as db:
+        hot_user_ids = await crud.get_recently_active_user_ids(db, limit=settings.WARMUP_CHROMA_STORES)
+    _warmup_task = asyncio.create_task(startup.warm_up(get_base_model, get_user_collection, hot_user_ids))
+    if settings.LOOP_STALL_THRESHOLD_MS > 0:
+        profiler.loop_stalls.start()
     yield
+    profiler.loop_stalls.stop()
+    if not _warmup_task.done():
+        _warmup_task.cancel()
+    auth.shutdown_hash_executor()
     print("Application shutdown.")
 
 # --- FastAPI App & Middleware ---
 app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def reject_oversized_bodies(request: Request, call_next):
+    """Answers 413 from Content-Length, before Starlette reads and spools the body."""
+    if request.method in ("POST", "PUT", "PATCH") and uploads.body_too_large(request.headers.get("content-length")):
+        return JSONResponse(
+            status_code=uploads.HTTP_413_CONTENT_TOO_LARGE,
+            content={"detail": f"File is larger than the {settings.MAX_UPLOAD_MB} MB limit."},
+            headers={"Connection": "close"},
+        )
+    return await call_next(request)
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Tags each request with an id and records its latency per endpoint."""
+    request_id = request.headers.get("X-Request-ID") or metrics.new_request_id()
+    token = metrics.request_id_var.set(request_id)
+    profile_id = profiler.slow_requests.request_started(request_id)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        metrics.HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method, endpoint=endpoint)
+        metrics.HTTP_REQUESTS.inc(method=request.method, endpoint=endpoint, status=status_code)
+        profiler.slow_requests.request_finished(profile_id, f"{request.method} {endpoint}", elapsed, status_code)
+        metrics.log_event("request finished", method=request.method, endpoint=endpoint,
+                          status=status_code, duration_ms=round(elapsed * 1000, 2))
+        metrics.request_id_var.reset(token)
+
+# Added last so it is the outermost middleware: early responses (e.g. the 413 above) get CORS headers too.
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
 
 # --- API ENDPOINTS ---
@@ -285,6 +459,112 @@ app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True,
 def read_root():
     return {"message": "Nyay AI Backend is running!"}
 
+@app.get("/healthz")
+def liveness():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+def readiness():
+    """Readiness: the database is initialised and the warm-up has finished."""
+    snapshot = {**startup.state.snapshot(), "admission": admission.controller.snapshot()}
+    return JSONResponse(snapshot, status_code=200 if startup.state.ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
+# --- Admin: Profiling ---
+@app.post("/admin/profiling/sample", response_class=PlainTextResponse)
+async def sample_profile(
+    seconds: float = Query(10, gt=0, le=profiler.MAX_SAMPLE_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    admin: models.User = Depends(auth.get_current_admin)
+):
+    """Samples every thread for `seconds` and returns folded stacks (flamegraph.pl / speedscope input)."""
+    stacks = await run_in_threadpool(profiler.sample_for, seconds, interval_ms / 1000)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail="A profile is already being recorded.")
+    return PlainTextResponse(profiler.folded(stacks))
+
+@app.get("/admin/profiling/stalls")
+async def read_loop_stalls(admin: models.User = Depends(auth.get_current_admin)):
+    """Recent event-loop stalls over LOOP_STALL_THRESHOLD_MS, with the stack that was blocking."""
+    return {"threshold_ms": settings.LOOP_STALL_THRESHOLD_MS, "stalls": profiler.loop_stalls.snapshot()}
+
+@app.get("/admin/profiling/slow-requests")
+async def read_slow_requests(admin: models.User = Depends(auth.get_current_admin)):
+    """The slowest recent requests per endpoint; fetch a profile by its profile_id."""
+    return profiler.slow_requests.summary()
+
+@app.get("/admin/profiling/slow-requests/{profile_id}", response_class=PlainTextResponse)
+async def read_slow_request_profile(profile_id: int, admin: models.User = Depends(auth.get_current_admin)):
+    stacks = profiler.slow_requests.profile(profile_id)
+    if stacks is None:
+        raise HTTPException(status_code=404, detail="No profile kept for this request.")
+    return PlainTextResponse(profiler.folded(stacks))
+
+# --- Admin: Vector Store Maintenance ---
+@app.post("/admin/vector-store/{user_id}/maintenance")
+async def maintain_vector_store(
+    user_id: int,
+    compact: bool = True,
+    snapshot: bool = False,
+    dry_run: bool = False,
+    db: AsyncSession = Depends(get_db),
+    admin: models.User = Depends(auth.get_current_admin)
+):
+    """Reconciles a user's collection with their case files, compacts it and reports size/latency before and after."""
+    keep, expected = await vector_maintenance.load_expected(db, user_id)
+    params = await retrieval_settings.get_params(db, user_id)
+
+    def reindex(filename: str) -> None:
+        sha256 = expected[filename]
+        text = uploads.extract_text_from_path(storage.blob_path(sha256), uploads.content_type_for(filename))
+        add_document_to_vector_store(user_id, text, filename, params, sha256)
+
+    def maintain() -> dict:
+        return vector_maintenance.run(
+            user_id, vector_maintenance.open_client(user_id), get_user_collection(user_id, params),
+            keep, expected, user_embedding_function(), compact=compact, take_snapshot=snapshot, dry_run=dry_run,
+            reindex=reindex, on_swap=lambda collection: replace_user_collection(user_id, collection),
+        )
+
+    ticket = await admission.controller.acquire(user_id, "vector_maintenance")
+    try:
+        return await run_in_threadpool(maintain)
+    finally:
+        admission.controller.release(ticket)
+
+@app.get("/admin/vector-store/{user_id}/snapshots")
+async def list_vector_snapshots(user_id: int, admin: models.User = Depends(auth.get_current_admin)):
+    return {"user_id": user_id, "snapshots": vector_maintenance.list_snapshots(user_id)}
+
+@app.post("/admin/vector-store/{user_id}/snapshots")
+async def create_vector_snapshot(user_id: int, admin: models.User = Depends(auth.get_current_admin)):
+    def take():
+        with vector_maintenance.user_lock(user_id):
+            return vector_maintenance.snapshot(get_user_collection(user_id), user_id)
+    return {"user_id": user_id, "snapshot": await run_in_threadpool(take)}
+
+@app.post("/admin/vector-store/{user_id}/restore")
+async def restore_vector_snapshot(user_id: int, name: str = Body(..., embed=True), admin: models.User = Depends(auth.get_current_admin)):
+    """Replaces a user's collection with a snapshot (no re-embedding)."""
+    def restore() -> dict:
+        return vector_maintenance.restore(
+            vector_maintenance.open_client(user_id), get_user_collection(user_id), user_id, name,
+            user_embedding_function(), lambda collection: replace_user_collection(user_id, collection),
+        )
+
+    ticket = await admission.controller.acquire(user_id, "vector_maintenance")
+    try:
+        return await run_in_threadpool(restore)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    finally:
+        admission.controller.release(ticket)
+
 # --- Auth Endpoints ---
 # ... (No changes to auth endpoints) ...
 @app.post("/signup", response_model=schemas.User)
@@ -292,15 +572,20 @@ async def signup(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
     db_user = await crud.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = auth.get_password_hash(user.password)
+    hashed_password = await auth.get_password_hash_async(user.password)
     return await crud.create_user(db=db, user=user, hashed_password=hashed_password)
 
 @app.post("/login", response_model=schemas.Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     user = await crud.get_user_by_username(db, username=form_data.username)
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    if not user or not await auth.verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
-    access_token = auth.create_access_token(data={"sub": user.username})
+    username = user.username
+    # Transparently upgrade hashes made with an old work factor.
+    if auth.needs_rehash(user.hashed_password):
+        hashed_password = await auth.get_password_hash_async(form_data.password)
+        await crud.update_user_password(db=db, user=user, hashed_password=hashed_password)
+    access_token = auth.create_access_token(data={"sub": username})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.get("/users/me", response_model=schemas.User)
@@ -321,76 +606,129 @@ async def change_password(
     db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    if not auth.verify_password(password_data.current_password, current_user.hashed_password):
+    if not await auth.verify_password_async(password_data.current_password, current_user.hashed_password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect current password")
     
-    hashed_password = auth.get_password_hash(password_data.new_password)
-    current_user.hashed_password = hashed_password
-    db.add(current_user)
-    await db.commit()
+    hashed_password = await auth.get_password_hash_async(password_data.new_password)
+    await crud.update_user_password(db=db, user=current_user, hashed_password=hashed_password)
     return {"message": "Password changed successfully"}
 
 # --- Dashboard Endpoints ---
 # ... (No changes to dashboard endpoints) ...
-@app.get("/users/me/files", response_model=List[schemas.CaseFile])
-async def read_user_files(db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    files = await crud.get_user_files(db=db, user_id=current_user.id)
-    return files
+@app.get("/users/me/files", response_model=schemas.CaseFilePage)
+async def read_user_files(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, max_length=255),
+    fields: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    selected_fields = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    if selected_fields:
+        unknown = set(selected_fields) - set(crud.CASE_FILE_FIELDS)
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    try:
+        items, next_cursor = await crud.get_user_files_page(
+            db=db, user_id=current_user.id, limit=limit, cursor=cursor, search=q, fields=selected_fields
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.delete("/users/me/files/{case_file_id}")
+async def delete_case_file(
+    case_file_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Deletes a case file; its document and chunks go too unless another case file uses them."""
+    user_id = current_user.id
+    case_file = await crud.get_user_case_file(db, case_file_id, user_id)
+    if case_file is None:
+        raise HTTPException(status_code=404, detail="Case file not found.")
+    filename = case_file.filename
+    still_used = await crud.delete_user_case_file(db, case_file, user_id)
+    if not still_used:
+        await storage.delete_document(db, user_id, filename)
+        await run_in_threadpool(lambda: vector_maintenance.delete_document_chunks(get_user_collection(user_id), user_id, filename))
+        feedback_adapter.forget_document(user_id, filename)
+    return {"deleted": case_file_id, "document_removed": not still_used}
+
+@app.get("/users/me/files/{case_file_id}/analysis")
+async def read_case_file_analysis(
+    case_file_id: int,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """The stored result of a case file's analysis; 304 if the client's ETag is current."""
+    stored = await analysis_results.get_current_result(db, case_file_id, current_user.id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="No stored analysis for this case file with the current pipeline.")
+    return analysis_results.result_response(stored, request.headers)
 
 @app.get("/users/me/stats")
 async def read_user_stats(db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    num_cases = len(await crud.get_user_files(db=db, user_id=current_user.id))
-    num_feedback = await crud.count_user_feedback(db=db, user_id=current_user.id)
-    num_contradictions = await crud.count_user_contradictions(db=db, user_id=current_user.id)
-    return {"casesAnalyzed": num_cases, "precedentsFound": num_feedback, "contradictionsFlagged": num_contradictions}
+    return await stats.get_user_stats(db=db, user_id=current_user.id)
 
 # --- User & Admin Endpoints ---
 @app.post("/users/me/retrain-model")
 async def retrain_user_model(background_tasks: BackgroundTasks, current_user: models.User = Depends(auth.get_current_user)):
-    background_tasks.add_task(run_fine_tuning_script, current_user.id)
+    # Refused now (429) rather than after the response if the queues are full or a retrain is already pending.
+    admission.controller.check(current_user.id, "retrain")
+    background_tasks.add_task(run_admitted_fine_tuning, current_user.id)
     return {"message": "Your personalized model is being updated."}
 
 # --- Feature Endpoints ---
 @app.post("/summarize")
-async def summarize_case(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    file_content = await read_upload_file_content(file)
-    file_path = os.path.join(DOCUMENTS_PATH, file.filename)
-    save_file_content(file_content, file_path)
-
-    text = get_text_from_upload(file_content, file.content_type)
-    if not text.strip() or len(text.strip()) < 100:
-        raise HTTPException(status_code=400, detail="File content is too short.")
+async def summarize_case(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user),
+                         _admission: admission.Ticket = Depends(admission.admit("summarize"))):
+    # Captured up front: commits below expire the session-bound user object.
+    user_id = current_user.id
+    staged = await uploads.stage_upload(file, DOCUMENTS_PATH)
+    try:
+        text = await run_in_threadpool(uploads.extract_text_from_path, staged.temp_path, file.content_type)
+        if not text.strip() or len(text.strip()) < 100:
+            raise HTTPException(status_code=400, detail="File content is too short.")
+        await storage.store_upload(db, user_id, staged)
+    finally:
+        staged.discard()
     
-    # [FIX] These functions will now raise a 422 error if they fail
+    # [FIX] This raises a 422 error if it fails
     # which FastAPI will automatically send to the client.
-    summary_data = generate_intelligent_brief(text)
-    entity_data = generate_ner_analysis(text)
+    analysis = await analyze_stored_upload(db, user_id, staged.filename, text, need_queries=False)
     
-    db_case_file = await crud.create_user_case_file(db=db, filename=file.filename, user_id=current_user.id)
-    add_document_to_vector_store(current_user.id, text, file.filename)
+    db_case_file = await crud.create_user_case_file(db=db, filename=staged.filename, user_id=user_id, analysis=analysis)
+    params = await retrieval_settings.get_params(db, user_id)
+    await run_in_threadpool(add_document_to_vector_store, user_id, text, staged.filename, params, staged.sha256)
     
-    return {
-        "filename": file.filename, 
-        "summary_data": summary_data,
-        "entity_data": entity_data,
+    payload = {
+        "filename": staged.filename, 
+        "summary_data": analysis.brief.model_dump(),
+        "entity_data": analysis.entities.model_dump(),
+        "suggested_questions": analysis.suggested_questions,
         "case_file_id": db_case_file.id # --- NEW: Return case_file_id
     }
+    # Kept so the case can be reopened later from GET /users/me/files/{id}/analysis.
+    with metrics.span("result_save"):
+        await analysis_results.save_result(db, payload["case_file_id"], user_id, staged.sha256, "summary", payload)
+    return payload
     
 @app.post("/documents/{filename}/find-entity", response_model=List[str])
 async def find_entity_in_document(
 # ... (No changes to this endpoint) ...
     filename: str, 
     request: schemas.EntitySearchRequest,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
-    file_path = os.path.join(DOCUMENTS_PATH, filename)
-    if not os.path.exists(file_path):
+    file_path = await storage.resolve_document_path(db, current_user.id, filename)
+    if file_path is None:
         raise HTTPException(status_code=404, detail="File not found")
     try:
-        with open(file_path, "rb") as f:
-            file_content = f.read()
-        content_type = 'application/pdf' if filename.lower().endswith('.pdf') else 'text/plain'
-        full_text = get_text_from_upload(file_content, content_type)
+        full_text = await run_in_threadpool(uploads.extract_text_from_path, file_path, uploads.content_type_for(filename))
         if not full_text:
             return []
         contexts = find_entity_in_text(full_text, request.entity_text)
@@ -400,65 +738,112 @@ async def find_entity_in_document(
 
 
 @app.post("/find_precedents")
-async def find_precedents_unified(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    
-    # 1. Read file content ONCE and get text
-    file_content = await read_upload_file_content(file)
-    raw_text = get_text_from_upload(file_content, file.content_type)
+async def find_precedents_unified(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user),
+                                  _admission: admission.Ticket = Depends(admission.admit("find_precedents"))):
+    # Captured up front: commits below expire the session-bound user object.
+    user_id = current_user.id
     
-    if not raw_text.strip():
-        raise HTTPException(status_code=400, detail="Could not extract text from file.")
-
-    # 2. Save the file and add it to the database/vector store
-    file_path = os.path.join(DOCUMENTS_PATH, file.filename)
-    save_file_content(file_content, file_path)
-    db_case_file = await crud.create_user_case_file(db=db, filename=file.filename, user_id=current_user.id)
-    add_document_to_vector_store(current_user.id, raw_text, file.filename)
-
-    # 3. Perform Summarization and Entity Analysis (logic from /summarize)
-    # [FIX] These functions will now raise 422 errors if they fail
-    summary_data = generate_intelligent_brief(raw_text)
-    entity_data = generate_ner_analysis(raw_text)
+    # 1. Stream the upload to disk ONCE and extract text from the file
+    with metrics.span("upload_read"):
+        staged = await uploads.stage_upload(file, DOCUMENTS_PATH)
+    try:
+        with metrics.span("text_extract", content_type=file.content_type):
+            raw_text = await run_in_threadpool(uploads.extract_text_from_path, staged.temp_path, file.content_type)
+        
+        if not raw_text.strip():
+            raise HTTPException(status_code=400, detail="Could not extract text from file.")
+
+        # 2. Save the file and add it to the database/vector store
+        with metrics.span("file_save"):
+            await storage.store_upload(db, user_id, staged)
+    finally:
+        staged.discard()
+    query_filename = staged.filename
+
+    # 3. Brief, entities, search queries and suggested questions in one call
+    # [FIX] This raises 422 errors if it fails
+    analysis = await analyze_stored_upload(db, user_id, query_filename, raw_text)
+
+    with metrics.span("db_insert"):
+        db_case_file = await crud.create_user_case_file(db=db, filename=query_filename, user_id=user_id, analysis=analysis)
+    # Tuned per collection by evaluate_retrieval.py; defaults otherwise.
+    params = await retrieval_settings.get_params(db, user_id)
+    with metrics.span("vector_store_add"):
+        await run_in_threadpool(add_document_to_vector_store, user_id, raw_text, query_filename, params, staged.sha256)
 
     # 4. Perform Precedent Search (existing logic)
-    st_model = await run_in_threadpool(load_model_for_user, current_user.id)
-    collection = get_user_collection(current_user.id)
+    with metrics.span("model_load"):
+        st_model = await run_in_threadpool(load_model_for_user, user_id)
+    with metrics.span("collection_open"):
+        collection = get_user_collection(user_id, params)
     
-    query_embedding = await run_in_threadpool(st_model.encode, raw_text)
-    standard_results = collection.query(query_embeddings=[query_embedding.tolist()], n_results=10)
-    standard_doc_list = [meta['filename'] for meta in standard_results.get('metadatas', [[]])[0]]
+    with metrics.span("embed_query"):
+        query_embedding = await run_in_threadpool(st_model.encode, raw_text)
+    # The user's overlay collection can be empty when all their uploads are in the global corpus.
+    overlay_has_chunks = collection.count() > 0
+    corpus = global_corpus.get_global_corpus()
+    # Personalizes retrieval from the user's feedback immediately, without a retrain.
+    adapter = None
+    if settings.FEEDBACK_RERANKING:
+        with metrics.span("feedback_adapter"):
+            adapter = await feedback_adapter.get_adapter(db, user_id, collection, corpus)
+    search_embedding = adapter.adjust(query_embedding) if adapter else query_embedding
+    standard_doc_list, global_standard_list = [], []
+    if overlay_has_chunks:
+        with metrics.span("chroma_query", kind="standard"):
+            standard_results = collection.query(query_embeddings=[search_embedding.tolist()], n_results=10)
+        standard_doc_list = [meta['filename'] for meta in standard_results.get('metadatas', [[]])[0]]
+    if corpus is not None:
+        with metrics.span("global_query", kind="standard"):
+            global_standard_list = await run_in_threadpool(lambda: corpus.search(search_embedding, 10)[0])
     
-    semantic_queries = await get_semantic_queries_from_gemini(raw_text)
+    semantic_queries = analysis.search_queries
+    semantic_doc_list, global_semantic_list = [], []
     if semantic_queries:
-        semantic_embeddings = await run_in_threadpool(st_model.encode, semantic_queries)
-        semantic_results = collection.query(query_embeddings=semantic_embeddings.tolist(), n_results=5)
-        semantic_doc_list = [meta['filename'] for meta_list in semantic_results.get('metadatas', []) for meta in meta_list]
-    else:
-        semantic_doc_list = []
+        with metrics.span("embed_query", kind="semantic"):
+            semantic_embeddings = await run_in_threadpool(st_model.encode, semantic_queries)
+        if adapter:
+            semantic_embeddings = adapter.adjust(semantic_embeddings)
+        if overlay_has_chunks:
+            with metrics.span("chroma_query", kind="semantic"):
+                semantic_results = collection.query(query_embeddings=semantic_embeddings.tolist(), n_results=5)
+            semantic_doc_list = [meta['filename'] for meta_list in semantic_results.get('metadatas', []) for meta in meta_list]
+        if corpus is not None:
+            with metrics.span("global_query", kind="semantic"):
+                global_semantic_list = [name for names in await run_in_threadpool(corpus.search, semantic_embeddings, 5) for name in names]
         
-    fused_results = reciprocal_rank_fusion([standard_doc_list, semantic_doc_list])
+    with metrics.span("rrf"):
+        fused_results = reciprocal_rank_fusion(
+            [standard_doc_list, global_standard_list, semantic_doc_list, global_semantic_list], k=params.rrf_k
+        )
+    if adapter:
+        fused_results = adapter.rerank(query_filename, fused_results)
     
+    # The query document itself may come back under its own name or its global-corpus name.
+    excluded = {query_filename, corpus.filename_for_sha256(staged.sha256) if corpus else None}
     top_unique_filenames = []
     seen_filenames = set()
     for filename in fused_results:
-        if filename not in seen_filenames and filename != file.filename:
+        if filename not in seen_filenames and filename not in excluded:
             seen_filenames.add(filename)
             top_unique_filenames.append(filename)
             if len(top_unique_filenames) >= 3:
                 break
     
     # 5. Generate Final AI Analysis on Precedents
-    context = ""
-    for filename in top_unique_filenames:
-        precedent_path = os.path.join(DOCUMENTS_PATH, filename)
-        if os.path.exists(precedent_path):
-            with open(precedent_path, "r", encoding='utf-8', errors='ignore') as f:
-                precedent_text = f.read()
-            context += f"--- PRECEDENT CASE: {filename} ---\n{precedent_text}\n\n"
+    # Only the query-relevant, budgeted excerpt of each precedent is sent.
+    with metrics.span("precedent_context_load"):
+        precedent_excerpts = await precedent_context.load_precedent_excerpts(
+            db, user_id, collection, query_embedding.tolist(),
+            precedent_context.query_digest(raw_text), top_unique_filenames, corpus
+        )
+    context = "".join(
+        f"--- PRECEDENT CASE: {filename} ---\n{excerpt}\n\n" for filename, excerpt in precedent_excerpts.items()
+    )
             
     if not context.strip():
         precedent_analysis_data = {
-            "query_filename": file.filename, 
+            "query_filename": query_filename, 
             "analysis": {"precedents": {}}, 
             "overall_relevance": "No relevant precedents were found in your personal database."
         }
@@ -471,7 +856,7 @@ async def find_precedents_unified(file: UploadFile = File(...), db: AsyncSession
         {raw_text}
         ---
 
-        **RETRIEVED PRECEDENT TEXTS:**
+        **RETRIEVED PRECEDENT EXCERPTS:**
         ---
         {context}
         ---
@@ -485,61 +870,71 @@ async def find_precedents_unified(file: UploadFile = File(...), db: AsyncSession
         
         **IMPORTANT: Respond ONLY with the raw JSON object.**
         """
-        response = None # [FIX] Define response here
         try:
-            response = await gemini_model.generate_content_async(prompt)
-            raw_analysis = json.loads(response.text.strip().replace("```json", "").replace("```", ""))
-            
-            analysis_list = raw_analysis.get("precedent_analyses", [])
+            output = await structured_output.generate_structured(
+                require_llm(), "precedent_analysis", prompt, schemas.PrecedentAnalysisOutput, user_id=user_id
+            )
+            analysis_list = [item.model_dump() for item in output.precedent_analyses]
             
             combined_precedents = {}
-            for i, filename in enumerate(top_unique_filenames):
+            for i, filename in enumerate(precedent_excerpts):
                 if i < len(analysis_list):
                     combined_precedents[filename] = analysis_list[i]
 
             precedent_analysis_data = {
-                "query_filename": file.filename,
+                "query_filename": query_filename,
                 "analysis": {
                     "precedents": combined_precedents
                 },
-                "overall_relevance": raw_analysis.get("overall_relevance", "No summary provided.")
+                "overall_relevance": output.overall_relevance
             }
-        # [FIX] Add logging for raw response text
-        except (json.JSONDecodeError, IndexError) as e:
+        except structured_output.StructuredOutputError as e:
             print(f"Error processing AI response for precedent analysis: {e}")
-            print(f"[RAW LLM RESPONSE]: {response.text if response else 'No response'}")
             raise HTTPException(status_code=500, detail="AI model returned an invalid format for precedent analysis.")
-
-    # 6. Return the combined payload
-    return {
-        "filename": file.filename,
-        "summary_data": summary_data,
-        "entity_data": entity_data,
+        except llm_client.LLMRateLimitedError:
+            raise HTTPException(status_code=429, detail="API Quota Exceeded during precedent analysis.")
+        except llm_client.LLMError as e:
+            print(f"Error during precedent analysis: {e}")
+            raise HTTPException(status_code=500, detail="Failed to get a response from the AI.")
+
+    # 6. Persist and return the combined payload
+    payload = {
+        "filename": query_filename,
+        "summary_data": analysis.brief.model_dump(),
+        "entity_data": analysis.entities.model_dump(),
+        "suggested_questions": analysis.suggested_questions,
         "precedent_data": precedent_analysis_data,
         "case_file_id": db_case_file.id # --- NEW: Return case_file_id
     }
+    with metrics.span("result_save"):
+        await analysis_results.save_result(db, payload["case_file_id"], user_id, staged.sha256, "precedents", payload)
+    return payload
 
 
 @app.post("/analyze_contradictions")
-async def analyze_contradictions(filenames: List[str] = Body(..., embed=True), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    if not gemini_model:
-        raise HTTPException(status_code=500, detail="Gemini API not configured.")
+async def analyze_contradictions(filenames: List[str] = Body(..., embed=True), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user),
+                                 _admission: admission.Ticket = Depends(admission.admit("analyze_contradictions"))):
+    # Captured up front: create_contradiction commits, which expires the session-bound user object.
+    user_id = current_user.id
+    client = require_llm()
     if len(filenames) < 2:
         raise HTTPException(status_code=400, detail="At least two files must be selected for comparison.")
     all_entities_context = ""
     for filename in filenames:
-        file_path = os.path.join(DOCUMENTS_PATH, filename)
-        if not os.path.exists(file_path):
+        file_path = await storage.resolve_document_path(db, user_id, filename)
+        if file_path is None:
             continue
         try:
-            with open(file_path, "rb") as f:
-                content_type = 'application/pdf' if filename.lower().endswith('.pdf') else 'text/plain'
-                file_content = f.read()
-            text = get_text_from_upload(file_content, content_type)
-            if not text.strip():
-                continue
-            # [FIX] This function will now raise a 422 error if it fails
-            entities = generate_ner_analysis(text)
+            # Entities extracted at upload time are reused; older files are analyzed now.
+            stored = await crud.get_latest_analysis_for_filename(db, user_id, filename)
+            if stored is not None:
+                entities = stored.entities.model_dump()
+            else:
+                text = await run_in_threadpool(uploads.extract_text_from_path, file_path, uploads.content_type_for(filename))
+                if not text.strip():
+                    continue
+                # [FIX] This function will now raise a 422 error if it fails
+                entities = await generate_ner_analysis(text, user_id)
             all_entities_context += f"--- ENTITIES FROM: {filename} ---\n{json.dumps(entities, indent=2)}\n\n"
         except HTTPException as e:
             raise HTTPException(status_code=e.status_code, detail=f"Error analyzing '{filename}': {e.detail}")
@@ -563,110 +958,150 @@ async def analyze_contradictions(filenames: List[str] = Body(..., embed=True), d
 
     **IMPORTANT: Respond ONLY with the raw JSON object.**
     """
-    response = None # [FIX] Define response here
     try:
-        response = gemini_model.generate_content(prompt)
-        json_string = response.text.strip().replace("```json", "").replace("```", "").strip()
-        analysis_data = json.loads(json_string)
-        report_items = analysis_data.get("contradiction_report", [])
+        output = await structured_output.generate_structured(
+            client, "contradictions", prompt, schemas.ContradictionOutput, user_id=user_id
+        )
+        analysis_data = output.model_dump()
+        report_items = output.contradiction_report
         if report_items and report_items[0] != "No direct contradictions were found.":
             contradiction_to_save = schemas.ContradictionCreate(
                 compared_files=", ".join(filenames),
                 report="\n".join(report_items)
             )
-            await crud.create_contradiction(db=db, contradiction=contradiction_to_save, user_id=current_user.id)
-            print(f"Contradiction report saved for user {current_user.id}")
+            await crud.create_contradiction(db=db, contradiction=contradiction_to_save, user_id=user_id)
+            print(f"Contradiction report saved for user {user_id}")
         return analysis_data
     # [FIX] More specific exception handling
-    except (json.JSONDecodeError, KeyError) as e:
+    except structured_output.StructuredOutputError as e:
         print(f"Error during Gemini API call for contradiction analysis: {e}")
-        print(f"[RAW LLM RESPONSE]: {response.text if response else 'No response'}")
         raise HTTPException(status_code=500, detail="The AI model returned an invalid format or an error occurred.")
 
+    except llm_client.LLMRateLimitedError:
+        raise HTTPException(status_code=429, detail="API Quota Exceeded during contradiction analysis.")
     except Exception as e:
         print(f"Error during Gemini API call for contradiction analysis: {e}")
         raise HTTPException(status_code=500, detail="The AI model returned an invalid format or an error occurred.")
 
 @app.post("/feedback", response_model=schemas.Feedback)
 async def handle_feedback(feedback: schemas.FeedbackCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return await crud.create_feedback(db=db, feedback=feedback, user_id=current_user.id)
-
-@app.post("/chat", response_model=schemas.ChatResponse)
-async def chat_with_ai(request: schemas.ChatRequest, current_user: models.User = Depends(auth.get_current_user)):
-    if not chat_model:
-        raise HTTPException(status_code=500, detail="Chat model not initialized.")
-
-    system_instruction = """
-    You are Nyay AI, an expert legal assistant. Your primary goal is to determine the user's intent and respond in a specific JSON format.
-    When providing answers, use Markdown formatting (like lists, bolding with **, italics with *) to improve readability.
-
-    1. If the user's intent is to **"navigate"** to a feature, you MUST identify the correct page from the list below.
-       Match the user's request (even with typos) to the closest feature.
-       - User wants to summarize, get a brief, or an overview -> "page": "/summarize"
-       - User wants to find precedents, similar cases, or historical cases -> "page": "/precedents"
-       - User wants to analyze evidence, find contradictions, or see conflicts -> "page": "/evidence"
-       - User wants to personalize, retrain, or update the AI -> "page": "/personalize"
-       - User wants to see their dashboard or home page -> "page": "/"
+    user_id = current_user.id
+    db_feedback = await crud.create_feedback(db=db, feedback=feedback, user_id=user_id)
+    if settings.FEEDBACK_RERANKING:
+        await feedback_adapter.record_feedback(user_id, feedback, lambda: get_user_collection(user_id), global_corpus.get_global_corpus())
+    return db_feedback
+
+async def summarize_chat_history(previous_summary: str, messages: List[Dict[str, Any]], user_id: Optional[int] = None) -> str:
+    """Folds older chat turns into the session's rolling summary."""
+    transcript = "\n".join(f"{msg['role'].upper()}: {' '.join(msg['parts'])}" for msg in messages)
+    prompt = f"""
+    You maintain a running summary of a conversation between a lawyer and a legal assistant.
+    Update the summary with the new turns below. Keep facts, names, dates and open questions; drop pleasantries.
 
-       Your JSON response for navigation MUST be:
-       {"response_type": "navigate", "page": "/path/to/page", "answer": "A helpful confirmation message."}
-       Example: {"response_type": "navigate", "page": "/precedents", "answer": "Certainly, I'll take you to the Precedent Analysis page."}
+    **CURRENT SUMMARY:**
+    {previous_summary or "None yet."}
 
-    2. If the user's intent is to **"answer"** a general question or a question about the provided document context, provide a direct answer.
-       Your JSON response for answering MUST be:
-       {"response_type": "answer", "answer": "Your detailed answer goes here."}
+    **NEW TURNS:**
+    {transcript}
 
-    **IMPORTANT**: If the user's request is ambiguous or does not clearly match a navigation feature, you MUST default to the "answer" intent. Do not guess a page.
-    Always respond with a single, raw JSON object and nothing else.
+    Respond with the updated summary as plain text, in at most 200 words.
     """
-    
-    full_history = [
-        {'role': 'user', 'parts': [{'text': system_instruction}]},
-        {'role': 'model', 'parts': [{'text': '{"response_type": "answer", "answer": "Understood. I will act as an intelligent navigator and expert assistant, adhering to the specified JSON format and using Markdown for clarity."}'}]},
-    ]
-    full_history.extend([{'role': msg.role, 'parts': [part['text'] for part in msg.parts]} for msg in request.history])
-
-    chat_session = chat_model.start_chat(history=full_history)
-
-    full_prompt = request.question
-    if request.context:
-        full_prompt = f"""
-        **DOCUMENT CONTEXT:**
-        ---
-        {request.context}
-        ---
-        **QUESTION:**
-        {request.question}
-        """
-    
-    # [FIX] This endpoint already has good error handling, but we'll add the
-    # response definition for consistency
-    response = None 
-    try:
-        response = await chat_session.send_message_async(full_prompt)
-        cleaned_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        response_data = json.loads(cleaned_text)
+    response = await require_llm().generate("chat_summary", prompt, user_id=user_id)
+    return response.text.strip()
+
+@app.post("/chat", response_model=schemas.ChatResponse)
+async def chat_with_ai(request: schemas.ChatRequest, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+    if llm is None:
+        raise HTTPException(status_code=500, detail="Chat model not initialized.")
+    user_id = current_user.id
+
+    session = chat_sessions.get_or_create(user_id, request.session_id, request.case_file_id)
+
+    # Plain navigation requests are answered locally, without a Gemini round trip.
+    with metrics.span("intent_router"):
+        intent = await run_in_threadpool(intent_router.route, request.question, get_loaded_base_model())
+    metrics.INTENT_ROUTER.inc(outcome="local" if intent else "llm")
+    if intent:
+        async with session.lock:
+            session.add_turn(request.question, json.dumps({"response_type": "navigate", "page": intent.page, "answer": intent.answer}))
+            chat_sessions.touch(session)
+        return schemas.ChatResponse(response_type="navigate", answer=intent.answer, page=intent.page, session_id=session.session_id)
+
+    async with session.lock:
+        # Older clients send their own history; only use it to seed a fresh session.
+        if not session.messages and not session.summary and request.history:
+            session.messages = [{'role': msg.role, 'parts': [part['text'] for part in msg.parts]} for msg in request.history]
+        with metrics.span("chat_compaction"):
+            await session.compact(lambda summary, older: summarize_chat_history(summary, older, user_id))
+
+        # Ground the answer in the few chunks of the bound case file that match the
+        # question, instead of the whole document on every turn.
+        document_context = request.context
+        if request.case_file_id is not None:
+            case_file = await crud.get_user_case_file(db=db, case_file_id=request.case_file_id, user_id=user_id)
+            if case_file is None:
+                raise HTTPException(status_code=404, detail="Case file not found.")
+            sha256 = await storage.document_sha256(db, user_id, case_file.filename)
+            with metrics.span("chat_retrieval"):
+                chunks = await run_in_threadpool(retrieve_case_file_chunks, user_id, case_file.filename, request.question, CHAT_CONTEXT_TOP_K, sha256)
+            document_context = "\n\n---\n\n".join(chunks)
+
+        # The system instruction is configured once on the chat model (see
+        # llm_client.GeminiBackend), so only the session's own (bounded) history is sent here.
+        history = list(session.messages)
+
+        prompt_sections = []
+        if session.summary:
+            prompt_sections.append(f"**SUMMARY OF THE EARLIER CONVERSATION:**\n{session.summary}")
+        if document_context:
+            prompt_sections.append(f"**DOCUMENT CONTEXT:**\n---\n{document_context}\n---")
+        full_prompt = request.question
+        if prompt_sections:
+            full_prompt = "\n\n".join(prompt_sections + [f"**QUESTION:**\n{request.question}"])
         
-        return schemas.ChatResponse(
-            response_type=response_data.get("response_type", "answer"),
-            answer=response_data.get("answer", "I'm sorry, I couldn't process that request."),
-            page=response_data.get("page")
-        )
+        try:
+            output = await structured_output.generate_structured(
+                llm, "chat", full_prompt, schemas.ChatOutput, user_id=user_id, history=history
+            )
+            session.add_turn(request.question, output.model_dump_json())
+            chat_sessions.touch(session)
+            return schemas.ChatResponse(
+                response_type=output.response_type,
+                answer=output.answer,
+                page=output.page,
+                session_id=session.session_id
+            )
 
-    except (json.JSONDecodeError, KeyError) as e:
-        print(f"Error parsing AI's JSON response: {e}. Raw response: {response.text}")
-        # [FIX] Return the raw text if it's not JSON, so the user still sees a response
-        return schemas.ChatResponse(response_type="answer", answer=response.text if response else "Sorry, an error occurred.")
-    except Exception as e:
-        print(f"Error during chat generation: {e}")
-        raise HTTPException(status_code=500, detail="Failed to get a response from the AI.")
+        except structured_output.StructuredOutputError as e:
+            print(f"Error parsing AI's JSON response: {e}")
+            # [FIX] Return the raw text if it's not JSON, so the user still sees a response
+            answer = e.raw_text or "Sorry, an error occurred."
+            session.add_turn(request.question, answer)
+            chat_sessions.touch(session)
+            return schemas.ChatResponse(response_type="answer", answer=answer, session_id=session.session_id)
+        except llm_client.LLMRateLimitedError:
+            raise HTTPException(status_code=429, detail="API Quota Exceeded. Please try again shortly.")
+        except Exception as e:
+            print(f"Error during chat generation: {e}")
+            raise HTTPException(status_code=500, detail="Failed to get a response from the AI.")
+
+@app.delete("/chat/sessions/{session_id}")
+async def delete_chat_session(session_id: str, current_user: models.User = Depends(auth.get_current_user)):
+    chat_sessions.delete(current_user.id, session_id)
+    return {"message": "Chat session cleared."}
 
 
 @app.post("/generate-suggested-questions", response_model=schemas.SuggestedQuestionsResponse)
 async def generate_suggested_questions(
     request: schemas.SummarizeResponse,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
+    # Questions are produced with the document analysis at upload time.
+    if request.case_file_id is not None:
+        stored = await crud.get_case_file_analysis(db, request.case_file_id, current_user.id)
+        if stored is not None and stored.suggested_questions:
+            return schemas.SuggestedQuestionsResponse(questions=stored.suggested_questions)
     prompt = f"""
     Based on the following summary of a legal document, generate a JSON object with a single key "questions".
 This key should have a value of a JSON array of 3 insightful follow-up questions a user might ask.
@@ -682,17 +1117,15 @@ This key should have a value of a JSON array of 3 insightful follow-up questions
     {', '.join(request.summary_data.get('involved_parties', []))}
 
     **IMPORTANT: Respond ONLY with the raw JSON object.** """
-    response = None # [FIX] Define response here
     try:
-        response = await gemini_model.generate_content_async(prompt)
-        cleaned_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        data = json.loads(cleaned_text)
-        return schemas.SuggestedQuestionsResponse(questions=data.get("questions", []))
+        output = await structured_output.generate_structured(
+            require_llm(), "suggested_questions", prompt, schemas.SuggestedQuestionsOutput, user_id=current_user.id
+        )
+        return schemas.SuggestedQuestionsResponse(questions=output.questions)
     
     # [FIX] More specific exception handling
-    except (json.JSONDecodeError, KeyError) as e:
+    except structured_output.StructuredOutputError as e:
         print(f"Error generating suggested questions: {e}")
-        print(f"[RAW LLM RESPONSE]: {response.text if response else 'No response'}")
         return schemas.SuggestedQuestionsResponse(questions=[])
     except Exception as e:
         print(f"Error generating suggested questions: {e}")
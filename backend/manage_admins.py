@@ -0,0 +1,78 @@
+# backend/manage_admins.py
+#
+# Grants and revokes admin rights (the /admin/... endpoints). Admin status is
+# an AdminGrant row for an existing user, so it can only be given by someone
+# with access to the server's database, never by registering a username.
+#
+# Usage: python manage_admins.py grant <username>
+#        python manage_admins.py revoke <username>
+#        python manage_admins.py list
+
+import argparse
+import asyncio
+
+from sqlalchemy.future import select
+
+import crud, models
+from database import SessionLocal, engine
+
+
+async def _ensure_table() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: models.AdminGrant.__table__.create(sync_conn, checkfirst=True))
+
+
+async def _user_or_exit(db, username: str) -> models.User:
+    user = await crud.get_user_by_username(db, username=username)
+    if user is None:
+        raise SystemExit(f"No user named '{username}'.")
+    return user
+
+
+async def grant(username: str) -> None:
+    async with SessionLocal() as db:
+        user = await _user_or_exit(db, username)
+        if await db.get(models.AdminGrant, user.id) is None:
+            db.add(models.AdminGrant(user_id=user.id))
+            await db.commit()
+    print(f"'{username}' is an admin.")
+
+
+async def revoke(username: str) -> None:
+    async with SessionLocal() as db:
+        user = await _user_or_exit(db, username)
+        existing = await db.get(models.AdminGrant, user.id)
+        if existing is not None:
+            await db.delete(existing)
+            await db.commit()
+    print(f"'{username}' is no longer an admin.")
+
+
+async def list_admins() -> None:
+    async with SessionLocal() as db:
+        result = await db.execute(
+            select(models.User.username, models.AdminGrant.granted_at)
+            .join(models.AdminGrant, models.AdminGrant.user_id == models.User.id)
+            .order_by(models.User.username)
+        )
+        for username, granted_at in result.all():
+            print(f"{username}\t{granted_at}")
+
+
+async def _main(args) -> None:
+    await _ensure_table()
+    if args.command == "grant":
+        await grant(args.username)
+    elif args.command == "revoke":
+        await revoke(args.username)
+    else:
+        await list_admins()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Admin rights management.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    for command in ("grant", "revoke"):
+        subcommands.add_parser(command, help=f"{command.capitalize()} admin rights.").add_argument("username")
+    subcommands.add_parser("list", help="List admins.")
+    asyncio.run(_main(parser.parse_args()))
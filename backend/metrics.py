@@ -0,0 +1,212 @@
+# backend/metrics.py
+#
+# Lightweight, dependency-free instrumentation: Prometheus-style counters and
+# histograms, timing spans for pipeline stages, and request-scoped structured
+# logging. Everything is exposed in the Prometheus text format via /metrics.
+
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in pairs) + "}"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of observed values (seconds, by convention)."""
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [bucket counts..., sum, count]
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', repr(bound)))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return "\n".join(lines)
+
+
+# --- Registered Metrics ---
+HTTP_REQUEST_SECONDS = Histogram("nyay_http_request_duration_seconds", "HTTP request latency by endpoint.")
+HTTP_REQUESTS = Counter("nyay_http_requests_total", "HTTP requests by endpoint and status code.")
+STAGE_SECONDS = Histogram("nyay_stage_duration_seconds", "Latency of individual pipeline stages.")
+LLM_CALLS = Counter("nyay_llm_calls_total", "LLM calls by operation and outcome.")
+LLM_RATE_LIMITED = Counter("nyay_llm_rate_limited_total", "LLM calls rejected with HTTP 429 / quota errors.")
+LLM_TOKENS = Counter("nyay_llm_tokens_total", "LLM tokens by operation and kind (prompt/completion).")
+CACHE_REQUESTS = Counter("nyay_cache_requests_total", "In-memory cache lookups by cache and result (hit/miss).")
+INTENT_ROUTER = Counter("nyay_intent_router_total", "Chat messages answered by the local intent router vs sent to the LLM.")
+LLM_RETRIES = Counter("nyay_llm_retries_total", "LLM call attempts retried after a 429/5xx, by operation and status.")
+LLM_HEDGES = Counter("nyay_llm_hedged_requests_total", "Hedge requests sent because an LLM call was slow.")
+LLM_QUEUE_SECONDS = Histogram("nyay_llm_queue_seconds", "Time LLM calls waited for a concurrency slot.")
+STRUCTURED_OUTPUT = Counter("nyay_structured_output_total", "Structured LLM replies by operation and outcome (valid/repaired/reasked/failed).")
+ADMISSION_REQUESTS = Counter("nyay_admission_requests_total", "Expensive requests by endpoint and admission outcome (admitted/queue_full/timeout/...).")
+ADMISSION_QUEUE_SECONDS = Histogram("nyay_admission_queue_seconds", "Time expensive requests waited for admission.")
+LOOP_STALLS = Counter("nyay_event_loop_stalls_total", "Event-loop iterations that blocked longer than LOOP_STALL_THRESHOLD_MS.")
+ADMISSION_SLO_MISSES = Counter("nyay_admission_slo_misses_total", "Admitted requests that waited longer than ADMISSION_QUEUE_SLO_SECONDS.")
+
+REGISTRY = [HTTP_REQUEST_SECONDS, HTTP_REQUESTS, STAGE_SECONDS, LLM_CALLS, LLM_RATE_LIMITED, LLM_TOKENS, CACHE_REQUESTS, INTENT_ROUTER,
+            LLM_RETRIES, LLM_HEDGES, LLM_QUEUE_SECONDS, STRUCTURED_OUTPUT, ADMISSION_REQUESTS, ADMISSION_QUEUE_SECONDS,
+            ADMISSION_SLO_MISSES, LOOP_STALLS]
+
+
+def render_metrics() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.expose() for metric in REGISTRY) + "\n"
+
+
+# --- Structured Logging ---
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line, tagged with the request id."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": request_id_var.get(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+logger = logging.getLogger("nyay")
+
+
+def configure_logging(level: int = logging.INFO) -> None:
+    """Attaches a JSON handler to the application logger (idempotent)."""
+    if any(isinstance(h.formatter, JsonFormatter) for h in logger.handlers):
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def log_event(message: str, level: int = logging.INFO, **fields) -> None:
+    logger.log(level, message, extra={"fields": fields})
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+# --- Spans & LLM Instrumentation ---
+@contextmanager
+def span(stage: str, **fields) -> Iterator[None]:
+    """Times a pipeline stage into STAGE_SECONDS and emits a debug log line."""
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        log_event("stage finished", logging.DEBUG, stage=stage, outcome=outcome,
+                  duration_ms=round(elapsed * 1000, 2), **fields)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    status_code = getattr(error, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code == 429
+    return "429" in str(error) or "quota" in str(error).lower()
+
+
+@contextmanager
+def track_llm(operation: str) -> Iterator[None]:
+    """Times an LLM call as the stage `llm.<operation>` and counts its outcome."""
+    with span(f"llm.{operation}"):
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limit_error(e):
+                LLM_RATE_LIMITED.inc(operation=operation)
+                LLM_CALLS.inc(operation=operation, outcome="rate_limited")
+            else:
+                LLM_CALLS.inc(operation=operation, outcome="error")
+            raise
+        LLM_CALLS.inc(operation=operation, outcome="ok")
+
+
+def record_llm_usage(operation: str, response) -> None:
+    """Adds the token counts reported by a Gemini response, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    completion_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    LLM_TOKENS.inc(prompt_tokens, operation=operation, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, operation=operation, kind="completion")
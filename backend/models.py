@@ -1,6 +1,6 @@
 # backend/models.py
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, Index, UniqueConstraint, Float
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -17,6 +17,7 @@ class User(Base):
     feedbacks = relationship("Feedback", back_populates="user")
     # --- NEW: Add relationship to the new Contradiction model ---
     contradictions = relationship("Contradiction", back_populates="user")
+    stats = relationship("UserStats", back_populates="user", uselist=False)
 
 class CaseFile(Base):
     __tablename__ = "case_files"
@@ -25,6 +26,8 @@ class CaseFile(Base):
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="case_files")
+    # Supports keyset pagination of a user's files, newest first.
+    __table_args__ = (Index("ix_case_files_owner_upload_date_id", "owner_id", "upload_date", "id"),)
 
 class Feedback(Base):
     __tablename__ = "feedback"
@@ -47,3 +50,96 @@ class Contradiction(Base):
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     user_id = Column(Integer, ForeignKey("users.id"))
     user = relationship("User", back_populates="contradictions")
+
+# --- NEW: Materialized per-user dashboard counters ---
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    cases_analyzed = Column(Integer, nullable=False, default=0)
+    precedents_found = Column(Integer, nullable=False, default=0)
+    contradictions_flagged = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    user = relationship("User", back_populates="stats")
+
+# --- NEW: Content-addressed document storage ---
+class Blob(Base):
+    """One stored file, keyed by the SHA-256 of its content and shared by every upload of it."""
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(Integer, nullable=False)
+    content_type = Column(String)
+    # Number of StoredDocument rows pointing at this blob; 0 means it can be collected.
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    documents = relationship("StoredDocument", back_populates="blob")
+
+class StoredDocument(Base):
+    """Maps a user's filename to the blob holding its content."""
+    __tablename__ = "stored_documents"
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    blob_sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=False, index=True)
+    uploaded_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    blob = relationship("Blob", back_populates="documents")
+    __table_args__ = (UniqueConstraint("owner_id", "filename", name="uq_stored_documents_owner_filename"),)
+
+# --- NEW: Per-collection retrieval parameters tuned from Feedback labels ---
+class RetrievalSettings(Base):
+    """Tuned index/chunking/fusion parameters for one user's vector collection (see evaluate_retrieval.py)."""
+    __tablename__ = "retrieval_settings"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    collection_name = Column(String, nullable=False)
+    hnsw_m = Column(Integer, nullable=False)
+    hnsw_construction_ef = Column(Integer, nullable=False)
+    hnsw_search_ef = Column(Integer, nullable=False)
+    # Embedding-model tokens (legal_chunker), not characters.
+    chunk_size = Column(Integer, nullable=False)
+    chunk_overlap = Column(Integer, nullable=False)
+    rrf_k = Column(Integer, nullable=False)
+    # Evaluation results the parameters were chosen on.
+    eval_k = Column(Integer)
+    recall_at_k = Column(Float)
+    mrr = Column(Float)
+    p50_ms = Column(Float)
+    labeled_queries = Column(Integer)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+# --- NEW: Combined document analysis stored per case file ---
+class CaseFileAnalysis(Base):
+    """Brief, entities, search queries and suggested questions from one multi-task LLM call."""
+    __tablename__ = "case_file_analyses"
+    case_file_id = Column(Integer, ForeignKey("case_files.id"), primary_key=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    filename = Column(String, nullable=False)
+    # schemas.DocumentAnalysisOutput as JSON
+    result = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Looked up by (owner, filename) when comparing stored documents.
+    __table_args__ = (Index("ix_case_file_analyses_owner_filename", "owner_id", "filename"),)
+
+# --- NEW: Persisted endpoint results, versioned by document and pipeline ---
+class AnalysisResult(Base):
+    """The /summarize or /find_precedents payload for a case file (see analysis_results.py)."""
+    __tablename__ = "analysis_results"
+    id = Column(Integer, primary_key=True, index=True)
+    case_file_id = Column(Integer, ForeignKey("case_files.id"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    kind = Column(String, nullable=False)
+    document_sha256 = Column(String(64), nullable=False)
+    pipeline_version = Column(String, nullable=False)
+    etag = Column(String, nullable=False)
+    # The payload as JSON, served verbatim.
+    result = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    __table_args__ = (
+        Index("ix_analysis_results_case_file_owner_version", "case_file_id", "owner_id", "pipeline_version"),
+    )
+
+# --- NEW: Admin grants, made out-of-band (see manage_admins.py) ---
+class AdminGrant(Base):
+    """Marks a user as an admin. Never created through the API, so signing up with a name grants nothing."""
+    __tablename__ = "admin_grants"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    granted_at = Column(DateTime(timezone=True), server_default=func.now())
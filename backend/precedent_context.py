@@ -0,0 +1,115 @@
+# backend/precedent_context.py
+#
+# Builds the precedent section of the precedent-analysis prompt. Instead of
+# sending every retrieved precedent in full, each one contributes only the
+# chunks closest to the query case (ranked with the chunk embeddings already
+# stored in the user's Chroma collection or the global corpus), up to a fixed
+# token budget.
+
+import hashlib
+import re
+from typing import Dict, List, Optional, Sequence
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import metrics, storage, uploads
+from cache import TTLCache
+from legal_chunker import estimate_tokens, truncate_to_tokens
+
+PRECEDENT_TOKEN_BUDGET = 1500
+MAX_CANDIDATE_CHUNKS = 8
+EXCERPT_CACHE_TTL_SECONDS = 600
+CHUNK_SEPARATOR = "\n[...]\n"
+
+_excerpt_cache = TTLCache(maxsize=2048, ttl=EXCERPT_CACHE_TTL_SECONDS, name="precedent_excerpts")
+_CHUNK_INDEX = re.compile(r"-chunk-(\d+)$")
+
+
+def query_digest(text: str) -> str:
+    """Stable cache key component for a query document."""
+    return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def _chunk_position(chunk_id: str) -> int:
+    match = _CHUNK_INDEX.search(chunk_id)
+    return int(match.group(1)) if match else 0
+
+
+def _select_chunks(ids: Sequence[str], documents: Sequence[str], budget: int) -> str:
+    """Takes chunks in relevance order until the budget is spent, then restores document order."""
+    selected, used = [], 0
+    for chunk_id, chunk in zip(ids, documents):
+        cost = estimate_tokens(chunk)
+        if used + cost > budget:
+            if not selected:
+                selected.append((chunk_id, truncate_to_tokens(chunk, budget)))
+            break
+        selected.append((chunk_id, chunk))
+        used += cost
+    selected.sort(key=lambda item: _chunk_position(item[0]))
+    return CHUNK_SEPARATOR.join(chunk for _, chunk in selected)
+
+
+def _query_chunks(collection, query_embedding: List[float], filename: str) -> Optional[str]:
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=MAX_CANDIDATE_CHUNKS,
+        where={"filename": filename},
+        include=["documents"],
+    )
+    ids = (results.get("ids") or [[]])[0]
+    documents = (results.get("documents") or [[]])[0]
+    if not ids:
+        return None
+    return _select_chunks(ids, documents, PRECEDENT_TOKEN_BUDGET)
+
+
+def _query_global_chunks(corpus, query_embedding: List[float], filename: str) -> Optional[str]:
+    ids, documents = corpus.query_document(filename, query_embedding, MAX_CANDIDATE_CHUNKS)
+    if not ids:
+        return None
+    return _select_chunks(ids, documents, PRECEDENT_TOKEN_BUDGET)
+
+
+async def _excerpt_from_file(db: AsyncSession, user_id: int, filename: str) -> Optional[str]:
+    """Fallback for precedents that have no chunks indexed: read the file properly and trim it."""
+    path = await storage.resolve_document_path(db, user_id, filename)
+    if path is None:
+        return None
+    text = await run_in_threadpool(uploads.extract_text_from_path, path, uploads.content_type_for(filename))
+    return truncate_to_tokens(text.strip(), PRECEDENT_TOKEN_BUDGET) if text.strip() else None
+
+
+async def load_precedent_excerpts(
+    db: AsyncSession,
+    user_id: int,
+    collection,
+    query_embedding: List[float],
+    digest: str,
+    filenames: List[str],
+    corpus=None,
+) -> Dict[str, str]:
+    """
+    Returns {filename: excerpt} for each precedent that could be loaded, in the
+    order given. The user's own chunks win over the global corpus (`corpus`).
+    Excerpts are cached per (user, query document, precedent).
+    """
+    excerpts: Dict[str, str] = {}
+    for filename in filenames:
+        key = (user_id, digest, filename)
+        excerpt = _excerpt_cache.get(key)
+        if excerpt is None:
+            with metrics.span("precedent_excerpt", source="chunks"):
+                excerpt = await run_in_threadpool(_query_chunks, collection, query_embedding, filename)
+            if excerpt is None and corpus is not None:
+                with metrics.span("precedent_excerpt", source="global"):
+                    excerpt = await run_in_threadpool(_query_global_chunks, corpus, query_embedding, filename)
+            if excerpt is None:
+                with metrics.span("precedent_excerpt", source="file"):
+                    excerpt = await _excerpt_from_file(db, user_id, filename)
+            if excerpt is None:
+                continue
+            _excerpt_cache.set(key, excerpt)
+        excerpts[filename] = excerpt
+    return excerpts
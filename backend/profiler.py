@@ -0,0 +1,244 @@
+# backend/profiler.py
+#
+# Production profiling, exposed on the admin-only /admin/profiling endpoints:
+#   - sample_for(): an on-demand sampling profiler that walks every thread's
+#     stack at a fixed interval and returns folded stacks ("a;b;c 42"), the
+#     input format of flamegraph.pl, speedscope and inferno;
+#   - LoopStallMonitor: a watchdog thread that notices when the event loop has
+#     not run its heartbeat for longer than a threshold and captures the stack
+#     that is blocking it;
+#   - SlowRequestProfiler: a low-rate sampler that runs while requests are in
+#     flight and keeps the folded profiles of the slowest few requests per
+#     endpoint. Samples cover every thread, so a profile also shows work done
+#     in the threadpool (PDF parsing, embedding, Chroma) on the request's behalf
+#     and, under load, the work of requests running at the same time.
+# Everything uses sys._current_frames(), so there is nothing to install.
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import metrics
+from config import settings
+
+MAX_STACK_DEPTH = 64
+MAX_SAMPLE_SECONDS = 60
+# Leaf frames of threads that are parked rather than working; they would dominate every profile.
+IDLE_LEAVES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("selectors.py", "select"), ("thread.py", "_worker"),
+    # This module's own samplers, between samples.
+    ("profiler.py", "sample_for"), ("profiler.py", "_sample"),
+}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collect_stacks(skip_thread_ids=()) -> Counter:
+    """One sample: a folded stack per busy thread, rooted at the thread's name."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = Counter()
+    for thread_id, frame in sys._current_frames().items():
+        if thread_id in skip_thread_ids:
+            continue
+        code = frame.f_code
+        if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+            continue
+        labels = []
+        while frame is not None and len(labels) < MAX_STACK_DEPTH:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        labels.append(names.get(thread_id, f"thread-{thread_id}"))
+        stacks[";".join(reversed(labels))] += 1
+    return stacks
+
+
+def folded(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# --- On-demand Sampling ---
+_sampling_lock = threading.Lock()
+
+
+def sample_for(seconds: float, interval: float) -> Optional[Counter]:
+    """Samples all threads for `seconds`; None if another profile is already running. Blocking."""
+    if not _sampling_lock.acquire(blocking=False):
+        return None
+    try:
+        stacks = Counter()
+        me = threading.get_ident()
+        deadline = time.monotonic() + min(seconds, MAX_SAMPLE_SECONDS)
+        while time.monotonic() < deadline:
+            stacks.update(collect_stacks({me}))
+            time.sleep(interval)
+        return stacks
+    finally:
+        _sampling_lock.release()
+
+
+# --- Event-loop Stall Detection ---
+class LoopStallMonitor:
+    """Flags event-loop iterations that block for longer than `threshold` seconds."""
+
+    def __init__(self, threshold: float, history: int = 50):
+        self.threshold = threshold
+        self.stalls = deque(maxlen=history)
+        self._beat_interval = max(threshold / 4, 0.01)
+        self._last_beat = time.monotonic()
+        self._current: Optional[dict] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        """Call from the event loop's thread."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._beat()
+        threading.Thread(target=self._watch, name="loop-stall-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        stall = self._current
+        if stall is not None:
+            stall["duration_ms"] = round((now - stall["_since"]) * 1000, 1)
+            metrics.log_event("event loop stall", level=logging.WARNING, duration_ms=stall["duration_ms"],
+                              frame=stall["stack"][-1] if stall["stack"] else None)
+            self._current = None
+        self._last_beat = now
+        if not self._stopped.is_set():
+            self._loop.call_later(self._beat_interval, self._beat)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self._beat_interval):
+            since = self._last_beat
+            if self._current is None and time.monotonic() - since > self.threshold + self._beat_interval:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                stack = [f"{f.filename}:{f.lineno} {f.name}" for f in traceback.extract_stack(frame)] if frame else []
+                self._current = {
+                    "started_at": datetime.now(timezone.utc).isoformat(),
+                    "duration_ms": None,  # Filled in when the loop runs again.
+                    "stack": stack,
+                    "_since": since + self._beat_interval,
+                }
+                self.stalls.append(self._current)
+                metrics.LOOP_STALLS.inc()
+
+    def snapshot(self) -> List[dict]:
+        return [{k: v for k, v in stall.items() if not k.startswith("_")} for stall in self.stalls]
+
+
+# --- Slowest Requests ---
+class _InFlight:
+    __slots__ = ("request_id", "started_at", "stacks")
+
+    def __init__(self, request_id: str):
+        # X-Request-ID (possibly client-supplied), kept as a label only.
+        self.request_id = request_id
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.stacks = Counter()
+
+
+class SlowRequestProfiler:
+    """Keeps the folded profiles of the `keep` slowest requests per endpoint."""
+
+    def __init__(self, keep: int, interval: float):
+        self.keep = keep
+        self.interval = interval
+        self._lock = threading.Lock()
+        # Keyed by a profile id generated here: client request ids need not be unique.
+        self._in_flight: Dict[int, _InFlight] = {}
+        self._profile_ids = itertools.count(1)
+        # Per endpoint, a min-heap of (duration, seq, profile): the fastest kept profile is evicted first.
+        self._slowest: Dict[str, list] = defaultdict(list)
+        self._seq = itertools.count()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.keep > 0
+
+    def request_started(self, request_id: str) -> Optional[int]:
+        """Starts profiling a request; returns the profile id to pass to request_finished."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            profile_id = next(self._profile_ids)
+            self._in_flight[profile_id] = _InFlight(request_id)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name="slow-request-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return profile_id
+
+    def request_finished(self, profile_id: Optional[int], endpoint: str, duration: float, status_code: int) -> None:
+        if profile_id is None:
+            return
+        with self._lock:
+            entry = self._in_flight.pop(profile_id, None)
+            if entry is None:
+                return
+            kept = self._slowest[endpoint]
+            if len(kept) >= self.keep and duration <= kept[0][0]:
+                return
+            profile = {
+                "profile_id": profile_id, "request_id": entry.request_id, "endpoint": endpoint, "started_at": entry.started_at,
+                "duration_ms": round(duration * 1000, 1), "status": status_code,
+                "samples": sum(entry.stacks.values()), "stacks": entry.stacks,
+            }
+            item = (duration, next(self._seq), profile)
+            if len(kept) < self.keep:
+                heapq.heappush(kept, item)
+            else:
+                heapq.heapreplace(kept, item)
+
+    def _sample(self) -> None:
+        me = threading.get_ident()
+        while True:
+            self._wake.clear()
+            if not self._in_flight:
+                self._wake.wait()
+                continue
+            stacks = collect_stacks({me})
+            with self._lock:
+                for entry in self._in_flight.values():
+                    entry.stacks.update(stacks)
+            time.sleep(self.interval)
+
+    def summary(self) -> Dict[str, List[dict]]:
+        with self._lock:
+            return {
+                endpoint: [{k: v for k, v in p.items() if k != "stacks"}
+                           for _, _, p in sorted(kept, key=lambda item: -item[0])]
+                for endpoint, kept in self._slowest.items()
+            }
+
+    def profile(self, profile_id: int) -> Optional[Counter]:
+        with self._lock:
+            for kept in self._slowest.values():
+                for _, _, p in kept:
+                    if p["profile_id"] == profile_id:
+                        return p["stacks"]
+        return None
+
+
+loop_stalls = LoopStallMonitor(settings.LOOP_STALL_THRESHOLD_MS / 1000)
+slow_requests = SlowRequestProfiler(settings.SLOW_REQUEST_PROFILES, settings.SLOW_REQUEST_SAMPLE_MS / 1000)
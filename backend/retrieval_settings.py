@@ -0,0 +1,91 @@
+# backend/retrieval_settings.py
+#
+# Retrieval parameters per user collection: HNSW index settings, chunk size
+# and overlap (in embedding-model tokens, see legal_chunker.py), and the RRF
+# constant. evaluate_retrieval.py replaces the defaults with values tuned on
+# the user's Feedback labels.
+
+from dataclasses import asdict, dataclass, fields
+from typing import Any, Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from cache import TTLCache
+from legal_chunker import DEFAULT_MAX_TOKENS
+
+SETTINGS_CACHE_TTL_SECONDS = 300
+# Rows saved before chunking moved to tokens hold character counts (the old
+# sweeps started at 500); a size above the model's token limit can only be one.
+LEGACY_CHARS_PER_TOKEN = 4
+
+
+@dataclass(frozen=True)
+class RetrievalParams:
+    hnsw_m: int = 16
+    hnsw_construction_ef: int = 100
+    hnsw_search_ef: int = 100
+    chunk_size: int = 250
+    chunk_overlap: int = 40
+    rrf_k: int = 60
+
+    def collection_metadata(self) -> Dict[str, Any]:
+        """Chroma collection metadata; HNSW settings only take effect when a collection is created."""
+        return {
+            "hnsw:M": self.hnsw_m,
+            "hnsw:construction_ef": self.hnsw_construction_ef,
+            "hnsw:search_ef": self.hnsw_search_ef,
+        }
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+DEFAULT_PARAMS = RetrievalParams()
+_params_cache = TTLCache(maxsize=10000, ttl=SETTINGS_CACHE_TTL_SECONDS, name="retrieval_settings")
+
+
+def _from_row(row: models.RetrievalSettings) -> RetrievalParams:
+    values = {f.name: getattr(row, f.name) for f in fields(RetrievalParams)}
+    if values["chunk_size"] > DEFAULT_MAX_TOKENS:
+        size = min(DEFAULT_MAX_TOKENS, values["chunk_size"] // LEGACY_CHARS_PER_TOKEN)
+        overlap = min(values["chunk_overlap"] // LEGACY_CHARS_PER_TOKEN, size // 2)
+        print(f"Retrieval settings for user {row.user_id} are in characters "
+              f"({values['chunk_size']}/{values['chunk_overlap']}); using {size}/{overlap} tokens.")
+        values.update(chunk_size=size, chunk_overlap=overlap)
+    return RetrievalParams(**values)
+
+
+async def get_params(db: AsyncSession, user_id: int) -> RetrievalParams:
+    """The user's tuned parameters, or the defaults if none were saved."""
+    params = _params_cache.get(user_id)
+    if params is None:
+        row = await db.get(models.RetrievalSettings, user_id)
+        params = _from_row(row) if row else DEFAULT_PARAMS
+        _params_cache.set(user_id, params)
+    return params
+
+
+async def save_params(
+    db: AsyncSession,
+    user_id: int,
+    collection_name: str,
+    params: RetrievalParams,
+    evaluation: Optional[Dict[str, float]] = None,
+) -> None:
+    """Stores tuned parameters (and the scores they were chosen on) for a user's collection."""
+    evaluation = evaluation or {}
+    row = await db.get(models.RetrievalSettings, user_id)
+    if row is None:
+        row = models.RetrievalSettings(user_id=user_id)
+        db.add(row)
+    row.collection_name = collection_name
+    for name, value in params.as_dict().items():
+        setattr(row, name, value)
+    row.eval_k = evaluation.get("k")
+    row.recall_at_k = evaluation.get("recall_at_k")
+    row.mrr = evaluation.get("mrr")
+    row.p50_ms = evaluation.get("p50_ms")
+    row.labeled_queries = evaluation.get("labeled_queries")
+    await db.commit()
+    _params_cache.pop(user_id)
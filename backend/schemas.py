@@ -1,7 +1,7 @@
 # backend/schemas.py
 
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 
 class Token(BaseModel):
@@ -24,6 +24,10 @@ class CaseFile(CaseFileBase):
     
     model_config = ConfigDict(from_attributes=True)
 
+class CaseFilePage(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
 class FeedbackBase(BaseModel):
     query_case_filename: str
     precedent_case_filename: str
@@ -85,8 +89,13 @@ class ChatMessage(BaseModel):
     parts: List[Dict[str, str]]
 
 class ChatRequest(BaseModel):
-    history: List[ChatMessage]
+    # Deprecated: history is kept server-side per session; only used to seed a new session.
+    history: List[ChatMessage] = []
     question: str
+    session_id: Optional[str] = None
+    # The case file the conversation is about; relevant chunks are retrieved server-side.
+    case_file_id: Optional[int] = None
+    # Deprecated: raw document text sent by older clients.
     context: Optional[str] = None
     # --- NEW: Add the stream flag to the request model ---
     stream: bool = False
@@ -96,11 +105,61 @@ class ChatResponse(BaseModel):
     response_type: str  # "answer" or "navigate"
     answer: str
     page: Optional[str] = None
+    session_id: Optional[str] = None
 
 class SummarizeResponse(BaseModel):
     filename: str
     summary_data: Dict[str, Any]
     entity_data: Dict[str, Any]
+    # When set, stored suggested questions for this case file are returned without an LLM call.
+    case_file_id: Optional[int] = None
 
 class SuggestedQuestionsResponse(BaseModel):
-    questions: List[str]
\ No newline at end of file
+    questions: List[str]
+
+# --- Structured LLM Outputs ---
+# Shapes the model is asked to return (see structured_output.py). Lists default
+# to empty so an output truncated mid-way still validates after repair.
+
+class BriefOutput(BaseModel):
+    one_sentence_summary: str
+    detailed_summary: str
+    key_arguments: List[str] = []
+    involved_parties: List[str] = []
+
+class EntityOutput(BaseModel):
+    people: List[str] = []
+    dates: List[str] = []
+    locations: List[str] = []
+    organizations: List[str] = []
+    laws_articles: List[str] = []
+
+class SemanticQueriesOutput(BaseModel):
+    queries: List[str]
+
+class PrecedentAnalysisItem(BaseModel):
+    facts: str = ""
+    holding: str = ""
+    relevance: str = ""
+
+class PrecedentAnalysisOutput(BaseModel):
+    precedent_analyses: List[PrecedentAnalysisItem]
+    overall_relevance: str = "No summary provided."
+
+class ContradictionOutput(BaseModel):
+    contradiction_report: List[str]
+
+class ChatOutput(BaseModel):
+    response_type: Literal["answer", "navigate"] = "answer"
+    answer: str
+    page: Optional[str] = None
+
+class SuggestedQuestionsOutput(BaseModel):
+    questions: List[str] = []
+
+class DocumentAnalysisOutput(BaseModel):
+    """Everything derived from one uploaded document, produced by a single call."""
+    brief: BriefOutput
+    entities: EntityOutput = EntityOutput()
+    search_queries: List[str] = []
+    suggested_questions: List[str] = []
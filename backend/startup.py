@@ -0,0 +1,120 @@
+# backend/startup.py
+#
+# Keeps worker startup fast. Heavy third-party libraries (torch via
+# sentence-transformers, chromadb, langchain, pypdf, the Gemini SDK) are
+# imported on first use through the accessors below instead of when main.py
+# is imported. After the server starts, a background warm-up loads the base
+# embedding model and opens recently used Chroma stores; /readyz reports
+# when that has finished.
+
+import importlib
+import threading
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Optional, Type
+
+from fastapi.concurrency import run_in_threadpool
+
+import metrics
+
+if TYPE_CHECKING:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from sentence_transformers import SentenceTransformer
+
+# Modules that must not be imported by `import main` (see check_import_time.py).
+HEAVY_MODULES = ("sentence_transformers", "torch", "chromadb", "langchain", "pypdf", "google.generativeai")
+
+_import_lock = threading.Lock()
+_imported: Dict[str, ModuleType] = {}
+
+
+def _import(name: str) -> ModuleType:
+    """Imports a module once, recording how long the first import took."""
+    module = _imported.get(name)
+    if module is not None:
+        return module
+    with _import_lock:
+        if name not in _imported:
+            start = time.perf_counter()
+            _imported[name] = importlib.import_module(name)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - start, stage=f"import.{name}")
+        return _imported[name]
+
+
+# --- Typed Accessors ---
+def genai() -> ModuleType:
+    """The `google.generativeai` module."""
+    return _import("google.generativeai")
+
+
+def chromadb() -> ModuleType:
+    return _import("chromadb")
+
+
+def embedding_functions() -> ModuleType:
+    """The `chromadb.utils.embedding_functions` module."""
+    return _import("chromadb.utils.embedding_functions")
+
+
+def pypdf() -> ModuleType:
+    return _import("pypdf")
+
+
+def sentence_transformer_cls() -> Type["SentenceTransformer"]:
+    return _import("sentence_transformers").SentenceTransformer
+
+
+def text_splitter_cls() -> Type["RecursiveCharacterTextSplitter"]:
+    return _import("langchain.text_splitter").RecursiveCharacterTextSplitter
+
+
+# --- Readiness ---
+class StartupState:
+    """What has been initialised so far; drives the /healthz and /readyz endpoints."""
+    def __init__(self):
+        self.started_at = time.time()
+        self.database_ready = False
+        self.llm_configured = False
+        self.base_model_loaded = False
+        self.warm_collections = 0
+        self.warmup_finished = False
+        self.warmup_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        # A failed warm-up still counts as finished: models then load on first use.
+        return self.database_ready and self.warmup_finished
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "database_ready": self.database_ready,
+            "llm_configured": self.llm_configured,
+            "base_model_loaded": self.base_model_loaded,
+            "warm_collections": self.warm_collections,
+            "warmup_finished": self.warmup_finished,
+            "warmup_error": self.warmup_error,
+        }
+
+
+state = StartupState()
+
+
+async def warm_up(load_base_model: Callable[[], Any], open_collection: Callable[[int], Any], hot_user_ids: Iterable[int]) -> None:
+    """Loads the base embedding model, then opens the given users' Chroma stores."""
+    start = time.perf_counter()
+    try:
+        with metrics.span("warmup.base_model"):
+            await run_in_threadpool(load_base_model)
+        for user_id in hot_user_ids:
+            with metrics.span("warmup.collection"):
+                await run_in_threadpool(open_collection, user_id)
+            state.warm_collections += 1
+    except Exception as e:
+        state.warmup_error = str(e)
+        print(f"Warm-up failed; models will load on first use instead: {e}")
+    finally:
+        state.warmup_finished = True
+        print(f"Warm-up finished in {time.perf_counter() - start:.2f}s "
+              f"(base model loaded: {state.base_model_loaded}, collections opened: {state.warm_collections}).")
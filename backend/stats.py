@@ -0,0 +1,120 @@
+# backend/stats.py
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy import func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import Dict, Optional
+import models
+from cache import TTLCache
+
+# Dashboard numbers change only when a user uploads a file, leaves feedback or
+# saves a contradiction report, so a short TTL is plenty.
+STATS_CACHE_TTL_SECONDS = 15
+STATS_COUNTERS = ("cases_analyzed", "precedents_found", "contradictions_flagged")
+
+_stats_cache = TTLCache(maxsize=4096, ttl=STATS_CACHE_TTL_SECONDS, name="user_stats")
+
+
+def _to_response(cases: int, feedback: int, contradictions: int) -> Dict[str, int]:
+    """Maps the counters onto the keys the dashboard expects."""
+    return {
+        "casesAnalyzed": cases or 0,
+        "precedentsFound": feedback or 0,
+        "contradictionsFlagged": contradictions or 0,
+    }
+
+
+async def aggregate_user_stats(db: AsyncSession, user_id: int) -> Dict[str, int]:
+    """
+    Computes all dashboard numbers for a user in a single aggregate query.
+    Used to seed (or repair) the materialized counters.
+    """
+    cases = (
+        select(func.count(models.CaseFile.id))
+        .filter(models.CaseFile.owner_id == user_id)
+        .scalar_subquery()
+    )
+    feedback = (
+        select(func.count(models.Feedback.id))
+        .filter(models.Feedback.user_id == user_id)
+        .scalar_subquery()
+    )
+    contradictions = (
+        select(func.count(models.Contradiction.id))
+        .filter(models.Contradiction.user_id == user_id)
+        .scalar_subquery()
+    )
+    result = await db.execute(select(cases, feedback, contradictions))
+    row = result.one()
+    return _to_response(row[0], row[1], row[2])
+
+
+async def _seed_user_stats(db: AsyncSession, user_id: int, counter: Optional[str] = None, amount: int = 0) -> None:
+    """
+    Creates the counters row for a user from the current table contents.
+    A concurrent first-time writer may have created it meanwhile: the insert
+    then becomes a no-op, or applies `amount` to `counter` when given, instead
+    of failing on the primary key.
+    """
+    totals = await aggregate_user_stats(db, user_id)
+    statement = sqlite_insert(models.UserStats).values(
+        user_id=user_id,
+        cases_analyzed=totals["casesAnalyzed"],
+        precedents_found=totals["precedentsFound"],
+        contradictions_flagged=totals["contradictionsFlagged"],
+    )
+    if counter is None:
+        statement = statement.on_conflict_do_nothing(index_elements=[models.UserStats.user_id])
+    else:
+        column = getattr(models.UserStats, counter)
+        statement = statement.on_conflict_do_update(
+            index_elements=[models.UserStats.user_id],
+            set_={column.name: column + amount, "updated_at": func.now()},
+        )
+    await db.execute(statement)
+
+
+async def increment_counter(db: AsyncSession, user_id: int, counter: str, amount: int = 1) -> None:
+    """
+    Bumps one of the user's counters (by a negative amount on deletes) inside
+    the caller's transaction. The change must already be flushed so a
+    first-time seed counts it.
+    """
+    if counter not in STATS_COUNTERS:
+        raise ValueError(f"Unknown stats counter: {counter}")
+    column = getattr(models.UserStats, counter)
+    result = await db.execute(
+        update(models.UserStats)
+        .where(models.UserStats.user_id == user_id)
+        .values({column: column + amount})
+    )
+    if result.rowcount == 0:
+        await _seed_user_stats(db, user_id, counter, amount)
+
+
+def invalidate(user_id: int) -> None:
+    """Drops the cached dashboard numbers for a user. Call after commit."""
+    _stats_cache.pop(user_id)
+
+
+async def get_user_stats(db: AsyncSession, user_id: int) -> Dict[str, int]:
+    """
+    Returns the dashboard numbers for a user: from the in-memory cache,
+    else from the materialized counters row, else seeded by one aggregate query.
+    """
+    cached = _stats_cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    db_stats = await db.get(models.UserStats, user_id)
+    seeded = db_stats is None
+    if seeded:
+        await _seed_user_stats(db, user_id)
+        db_stats = await db.get(models.UserStats, user_id)
+
+    stats = _to_response(db_stats.cases_analyzed, db_stats.precedents_found, db_stats.contradictions_flagged)
+    if seeded:
+        await db.commit()
+    _stats_cache.set(user_id, stats)
+    return stats
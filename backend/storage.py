@@ -0,0 +1,190 @@
+# backend/storage.py
+#
+# Content-addressed document storage. Each distinct file is stored once under
+# case_documents/blobs/<aa>/<bb>/<sha256>; the database maps (user, filename)
+# to a blob and reference-counts blobs so unreferenced ones can be collected.
+#
+# Usage: python storage.py gc [--min-age-minutes 60]
+
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+import models
+import uploads
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DOCUMENTS_PATH = os.path.join(BACKEND_DIR, "case_documents")
+BLOBS_PATH = os.path.join(DOCUMENTS_PATH, "blobs")
+# Blobs must have been unreferenced for this long before GC removes them, so a
+# concurrent re-upload of the same content cannot lose its file.
+GC_MIN_AGE_MINUTES = 60
+
+
+def blob_path(sha256: str) -> str:
+    """Sharded on-disk location of a blob."""
+    return os.path.join(BLOBS_PATH, sha256[:2], sha256[2:4], sha256)
+
+
+def legacy_document_path(filename: str) -> str:
+    """Location used before content-addressed storage (one flat directory)."""
+    return os.path.join(DOCUMENTS_PATH, uploads.safe_filename(filename))
+
+
+async def _get_document(db: AsyncSession, user_id: int, filename: str) -> Optional[models.StoredDocument]:
+    result = await db.execute(
+        select(models.StoredDocument)
+        .filter(models.StoredDocument.owner_id == user_id, models.StoredDocument.filename == filename)
+    )
+    return result.scalars().first()
+
+
+async def _change_ref_count(db: AsyncSession, sha256: str, delta: int) -> None:
+    await db.execute(
+        update(models.Blob)
+        .where(models.Blob.sha256 == sha256)
+        .values(ref_count=models.Blob.ref_count + delta)
+    )
+
+
+async def _link_document(db: AsyncSession, user_id: int, staged: uploads.StagedUpload) -> None:
+    """Creates the blob row if needed and points (user, filename) at it, in one transaction."""
+    if await db.get(models.Blob, staged.sha256) is None:
+        db.add(models.Blob(sha256=staged.sha256, size=staged.size, content_type=staged.content_type, ref_count=0))
+        await db.flush()
+
+    document = await _get_document(db, user_id, staged.filename)
+    if document is not None and document.blob_sha256 == staged.sha256:
+        return
+    if document is not None:
+        await _change_ref_count(db, document.blob_sha256, -1)
+        document.blob_sha256 = staged.sha256
+    else:
+        db.add(models.StoredDocument(owner_id=user_id, filename=staged.filename, blob_sha256=staged.sha256))
+    await _change_ref_count(db, staged.sha256, +1)
+    await db.flush()
+
+
+async def store_upload(db: AsyncSession, user_id: int, staged: uploads.StagedUpload) -> str:
+    """
+    Stores a staged upload for a user and returns the blob's path.
+    Identical content is kept once; re-uploading a filename repoints it.
+    """
+    for attempt in range(2):
+        try:
+            await _link_document(db, user_id, staged)
+            await db.commit()
+            break
+        except IntegrityError:
+            # Another request inserted the same blob or (user, filename) first.
+            await db.rollback()
+            if attempt == 1:
+                staged.discard()
+                raise
+    # The rename is atomic, so concurrent writers of identical content are safe.
+    return uploads.commit_upload(staged, blob_path(staged.sha256))
+
+
+async def _owns_case_file(db: AsyncSession, user_id: int, filename: str) -> bool:
+    result = await db.execute(
+        select(models.CaseFile.id)
+        .filter(models.CaseFile.owner_id == user_id, models.CaseFile.filename == filename)
+        .limit(1)
+    )
+    return result.first() is not None
+
+
+async def resolve_document_path(db: AsyncSession, user_id: int, filename: str) -> Optional[str]:
+    """
+    Finds the file behind a user's filename. The legacy flat directory is shared
+    by all users, so it is only consulted for filenames the user has a CaseFile for.
+    """
+    document = await _get_document(db, user_id, filename)
+    if document is not None:
+        path = blob_path(document.blob_sha256)
+        if os.path.exists(path):
+            return path
+    if not await _owns_case_file(db, user_id, filename):
+        return None
+    try:
+        path = legacy_document_path(filename)
+    except Exception:
+        return None
+    return path if os.path.exists(path) else None
+
+
+async def document_sha256(db: AsyncSession, user_id: int, filename: str) -> Optional[str]:
+    """Content hash of a user's stored file (None for legacy or unknown files)."""
+    document = await _get_document(db, user_id, filename)
+    return document.blob_sha256 if document is not None else None
+
+
+async def delete_document(db: AsyncSession, user_id: int, filename: str) -> bool:
+    """Removes a user's (user, filename) mapping and releases its blob reference."""
+    document = await _get_document(db, user_id, filename)
+    if document is None:
+        return False
+    await _change_ref_count(db, document.blob_sha256, -1)
+    await db.delete(document)
+    await db.commit()
+    return True
+
+
+async def release_unowned_document(db: AsyncSession, user_id: int, filename: str) -> bool:
+    """
+    Drops a stored document that no CaseFile refers to, e.g. after its analysis
+    failed; the user would otherwise have no way to see or delete it.
+    """
+    if await _owns_case_file(db, user_id, filename):
+        return False
+    return await delete_document(db, user_id, filename)
+
+
+async def collect_garbage(db: AsyncSession, min_age_minutes: int = GC_MIN_AGE_MINUTES) -> Dict[str, int]:
+    """Deletes blobs that have had no references for at least `min_age_minutes`."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(minutes=min_age_minutes)).replace(tzinfo=None)
+    result = await db.execute(
+        select(models.Blob.sha256, models.Blob.size)
+        .where(models.Blob.ref_count <= 0, models.Blob.updated_at < cutoff)
+    )
+    candidates = result.all()
+
+    deleted, freed = 0, 0
+    for sha256, size in candidates:
+        # Re-check inside the DELETE so a blob re-referenced meanwhile survives.
+        outcome = await db.execute(
+            delete(models.Blob).where(models.Blob.sha256 == sha256, models.Blob.ref_count <= 0)
+        )
+        await db.commit()
+        if outcome.rowcount:
+            try:
+                os.remove(blob_path(sha256))
+            except FileNotFoundError:
+                pass
+            deleted += 1
+            freed += size or 0
+    return {"blobs_deleted": deleted, "bytes_freed": freed}
+
+
+async def _gc_main(min_age_minutes: int):
+    from database import SessionLocal
+    async with SessionLocal() as db:
+        report = await collect_garbage(db, min_age_minutes=min_age_minutes)
+    print(f"Garbage collection finished: {report['blobs_deleted']} blobs deleted, {report['bytes_freed']} bytes freed.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Document storage maintenance.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    gc_parser = subcommands.add_parser("gc", help="Delete unreferenced blobs.")
+    gc_parser.add_argument("--min-age-minutes", type=int, default=GC_MIN_AGE_MINUTES)
+    args = parser.parse_args()
+    if args.command == "gc":
+        asyncio.run(_gc_main(args.min_age_minutes))
@@ -0,0 +1,195 @@
+# backend/structured_output.py
+#
+# Structured (JSON) LLM output. Calls ask the model for JSON mode with a
+# response schema derived from a Pydantic model, then parse and validate the
+# reply. Almost-valid output (code fences, trailing prose, trailing commas,
+# a reply truncated mid-object) is repaired locally; only when that fails is
+# the model re-asked once, with the validation errors, to fix its own reply.
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+import metrics
+
+T = TypeVar("T", bound=BaseModel)
+
+MAX_REASK_ECHO_CHARS = 4000
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PARTIAL_LITERAL = re.compile(r"([\[:,])\s*(?:t|tr|tru|f|fa|fal|fals|n|nu|nul|-|\d+\.|-?\d*\.?\d*[eE][+-]?)$")
+_DANGLING_KEY = re.compile(r'([{,])\s*"(?:[^"\\]|\\.)*"\s*:?$')
+
+
+class StructuredOutputError(Exception):
+    """The model's reply could not be parsed into the expected shape, even after a re-ask."""
+    def __init__(self, operation: str, detail: str, raw_text: Optional[str] = None):
+        super().__init__(f"Invalid structured output for '{operation}': {detail}")
+        self.raw_text = raw_text
+
+
+# --- Local Repair ---
+def _strip_fences(text: str) -> str:
+    return _FENCE.sub("", text.strip()).strip()
+
+
+def _open_containers(text: str) -> Tuple[List[str], bool, bool]:
+    """Scans JSON text; returns (closers still needed, inside a string?, ends mid-escape?)."""
+    stack: List[str] = []
+    in_string = escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack and stack[-1] == ch:
+            stack.pop()
+    return stack, in_string, escape
+
+
+def close_truncated_json(text: str) -> str:
+    """Completes JSON cut off mid-way: closes the open string, drops dangling keys and commas, closes containers."""
+    stack, in_string, escape = _open_containers(text)
+    if in_string:
+        text = (text[:-1] if escape else text) + '"'
+    while True:
+        trimmed = text.rstrip()
+        if trimmed.endswith(","):
+            trimmed = trimmed[:-1]
+        trimmed = _PARTIAL_LITERAL.sub(r"\1", trimmed)
+        if stack and stack[-1] == "}":
+            # A key with no value yet ('{"a": 1, "b"' or '..., "b":') is dropped.
+            trimmed = _DANGLING_KEY.sub(lambda m: m.group(1) if m.group(1) == "{" else "", trimmed)
+        if trimmed == text:
+            break
+        text = trimmed
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack))
+
+
+def parse_json_lenient(text: str) -> Tuple[Any, bool]:
+    """Parses a model reply as JSON. Returns (value, was_repaired); raises ValueError if hopeless."""
+    cleaned = _strip_fences(text)
+    try:
+        return json.loads(cleaned), False
+    except json.JSONDecodeError:
+        pass
+    start = min((i for i in (cleaned.find("{"), cleaned.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise ValueError("no JSON object found in the reply")
+    candidate = cleaned[start:]
+    try:
+        # Valid JSON followed by prose.
+        value, _ = json.JSONDecoder().raw_decode(candidate)
+        return value, True
+    except json.JSONDecodeError:
+        pass
+    repaired = close_truncated_json(_TRAILING_COMMA.sub(r"\1", candidate))
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", repaired)), True
+    except json.JSONDecodeError as e:
+        raise ValueError(f"JSON could not be repaired: {e}")
+
+
+def parse_structured(text: str, output_model: Type[T]) -> Tuple[T, bool]:
+    """Parses and validates a reply against `output_model`; raises ValueError with the reason."""
+    value, repaired = parse_json_lenient(text)
+    try:
+        return output_model.model_validate(value), repaired
+    except ValidationError as e:
+        raise ValueError(f"schema validation failed: {e.errors(include_url=False)}")
+
+
+# --- Response Schemas ---
+def response_schema(output_model: Type[BaseModel]) -> Dict[str, Any]:
+    """Converts a Pydantic model's JSON schema into the OpenAPI subset Gemini accepts."""
+    schema = output_model.model_json_schema()
+    definitions = schema.get("$defs", {})
+
+    def convert(node: Dict[str, Any]) -> Dict[str, Any]:
+        if "$ref" in node:
+            return convert(definitions[node["$ref"].rsplit("/", 1)[-1]])
+        if "anyOf" in node:
+            options = [option for option in node["anyOf"] if option.get("type") != "null"]
+            converted = convert(options[0])
+            converted["nullable"] = True
+            return converted
+        converted: Dict[str, Any] = {"type": node.get("type", "string")}
+        if "enum" in node:
+            converted["enum"] = node["enum"]
+        if converted["type"] == "object":
+            converted["properties"] = {name: convert(prop) for name, prop in node.get("properties", {}).items()}
+            if node.get("required"):
+                converted["required"] = node["required"]
+        elif converted["type"] == "array":
+            converted["items"] = convert(node.get("items", {}))
+        return converted
+
+    return convert(schema)
+
+
+def json_generation_config(output_model: Type[BaseModel]) -> Dict[str, Any]:
+    return {"response_mime_type": "application/json", "response_schema": response_schema(output_model)}
+
+
+# --- Generation ---
+def _reask_prompt(output_model: Type[BaseModel], raw_text: str, problem: str) -> str:
+    return f"""
+    Your previous reply could not be used because it was not valid JSON for the required schema.
+
+    **PROBLEM:** {problem}
+
+    **YOUR PREVIOUS REPLY:**
+    ---
+    {raw_text[:MAX_REASK_ECHO_CHARS]}
+    ---
+
+    **REQUIRED JSON SCHEMA:**
+    {json.dumps(response_schema(output_model))}
+
+    Return ONLY the corrected JSON object, keeping the content of your previous reply.
+    """
+
+
+async def generate_structured(
+    client,
+    operation: str,
+    prompt: str,
+    output_model: Type[T],
+    user_id: Optional[int] = None,
+    history: Optional[List[Dict]] = None,
+) -> T:
+    """
+    Asks `client` (an llm_client.LLMClient) for JSON matching `output_model` and
+    returns the validated model. Repairs locally first and re-asks at most once.
+    """
+    config = json_generation_config(output_model)
+    response = await client.generate(operation, prompt, user_id=user_id, history=history, generation_config=config)
+    try:
+        result, repaired = parse_structured(response.text, output_model)
+        metrics.STRUCTURED_OUTPUT.inc(operation=operation, outcome="repaired" if repaired else "valid")
+        return result
+    except ValueError as e:
+        problem = str(e)
+        print(f"[STRUCTURED OUTPUT - {operation}] {problem}; re-asking once.")
+
+    retry = await client.generate(f"{operation}_reask", _reask_prompt(output_model, response.text, problem),
+                                  user_id=user_id, generation_config=config)
+    try:
+        result, _ = parse_structured(retry.text, output_model)
+    except ValueError as e:
+        metrics.STRUCTURED_OUTPUT.inc(operation=operation, outcome="failed")
+        print(f"[RAW LLM RESPONSE - {operation}]: {retry.text}")
+        raise StructuredOutputError(operation, str(e), raw_text=retry.text)
+    metrics.STRUCTURED_OUTPUT.inc(operation=operation, outcome="reasked")
+    return result
@@ -0,0 +1,189 @@
+# backend/synthetic_corpus.py
+#
+# Deterministic synthetic legal documents for benchmarks and evaluations.
+# Each case looks like an Indian judgment (court header, parties, JUDGMENT
+# heading, numbered paragraphs citing statute sections, a HELD paragraph)
+# and belongs to one topic, so cases sharing a topic are "relevant" to
+# each other. Cases can also be rendered as simple multi-page PDFs.
+
+import random
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+COURTS = ["DELHI", "BOMBAY", "MADRAS", "CALCUTTA", "KARNATAKA", "ALLAHABAD", "GUJARAT", "KERALA"]
+FIRST_NAMES = ["Rajesh", "Priya", "Anil", "Sunita", "Vikram", "Meena", "Arjun", "Kavita", "Suresh", "Lakshmi", "Ramesh", "Deepa"]
+LAST_NAMES = ["Kumar", "Sharma", "Iyer", "Reddy", "Patel", "Singh", "Nair", "Gupta", "Das", "Menon", "Rao", "Joshi"]
+CITIES = ["Bengaluru", "Delhi", "Mumbai", "Chennai", "Kolkata", "Lucknow", "Ahmedabad", "Kochi"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"]
+
+TOPICS: Dict[str, Dict[str, List[str]]] = {
+    "murder": {
+        "sections": ["Section 302 of the Indian Penal Code", "Section 304 of the Indian Penal Code", "Section 27 of the Indian Evidence Act"],
+        "facts": [
+            "the deceased was last seen in the company of the accused near the railway crossing",
+            "the post-mortem report recorded multiple incised wounds caused by a sharp weapon",
+            "the weapon was recovered at the instance of the accused from a well behind his house",
+            "the eyewitness turned hostile during cross-examination",
+        ],
+        "issues": ["whether the chain of circumstantial evidence was complete", "whether the offence fell under the exception of grave and sudden provocation"],
+    },
+    "cheating": {
+        "sections": ["Section 420 of the Indian Penal Code", "Section 406 of the Indian Penal Code", "Section 138 of the Negotiable Instruments Act"],
+        "facts": [
+            "the complainant paid an advance for a plot that was never registered in his name",
+            "the cheque issued towards repayment was dishonoured for insufficient funds",
+            "the accused represented that the land was free of all encumbrances",
+            "the agreement of sale was executed on stamp paper purchased a day earlier",
+        ],
+        "issues": ["whether dishonest intention existed at the inception of the transaction", "whether the dispute was purely civil in nature"],
+    },
+    "dowry": {
+        "sections": ["Section 498A of the Indian Penal Code", "Section 304B of the Indian Penal Code", "Section 113B of the Indian Evidence Act"],
+        "facts": [
+            "the deceased died within seven years of marriage in the matrimonial home",
+            "letters written by the deceased to her parents described repeated demands for money",
+            "the in-laws demanded a car and cash soon after the wedding",
+            "neighbours deposed to hearing quarrels on the night of the incident",
+        ],
+        "issues": ["whether the presumption of dowry death was rightly drawn", "whether cruelty soon before death was proved"],
+    },
+    "service": {
+        "sections": ["Article 311 of the Constitution", "Article 14 of the Constitution", "Rule 14 of the Central Civil Services Rules"],
+        "facts": [
+            "the petitioner was dismissed from service without a departmental inquiry",
+            "the charge-sheet was served after the petitioner had attained the age of superannuation",
+            "the inquiry officer relied on documents not supplied to the delinquent employee",
+            "the disciplinary authority differed from the findings without recording reasons",
+        ],
+        "issues": ["whether the principles of natural justice were violated", "whether the penalty was disproportionate to the charge"],
+    },
+    "tax": {
+        "sections": ["Section 12AA of the Income Tax Act", "Section 80G of the Income Tax Act", "Section 148 of the Income Tax Act"],
+        "facts": [
+            "the registration of the trust was cancelled on the ground that its activities were not genuine",
+            "the assessing officer reopened the assessment after four years",
+            "the assessee claimed exemption for donations received from overseas",
+            "the reasons recorded for reopening were based on a change of opinion",
+        ],
+        "issues": ["whether the reopening of the assessment was valid", "whether the trust's objects were charitable"],
+    },
+    "property": {
+        "sections": ["Section 53A of the Transfer of Property Act", "Section 34 of the Specific Relief Act", "Order XXXIX Rule 1 of the Code of Civil Procedure"],
+        "facts": [
+            "the plaintiff claimed title under an unregistered sale deed",
+            "the defendant had been in continuous possession for over twelve years",
+            "the revenue records showed mutation in favour of the defendant's father",
+            "a temporary injunction restraining construction was granted by the trial court",
+        ],
+        "issues": ["whether the plaintiff proved lawful possession", "whether the suit was barred by limitation"],
+    },
+}
+
+FILLER = [
+    "Learned counsel for the appellant submitted that the findings of the trial court were perverse.",
+    "Learned counsel for the State supported the judgment under appeal.",
+    "We have heard the learned counsel for the parties and perused the record.",
+    "The trial court, after appreciating the evidence on record, recorded a finding of guilt.",
+    "It is well settled that the appellate court must be slow to interfere with findings of fact.",
+    "The High Court, in revision, declined to interfere with the concurrent findings.",
+]
+
+
+@dataclass
+class SyntheticCase:
+    filename: str
+    topic: str
+    text: str
+
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+
+def _date(rng: random.Random) -> str:
+    return f"{rng.randint(1, 28)} {rng.choice(MONTHS)} {rng.randint(2005, 2024)}"
+
+
+def generate_case(rng: random.Random, index: int, topic: Optional[str] = None, paragraphs: int = 12) -> SyntheticCase:
+    """One judgment-like document about `topic` (random if not given)."""
+    topic = topic or rng.choice(sorted(TOPICS))
+    spec = TOPICS[topic]
+    petitioner, respondent = _name(rng), _name(rng)
+    lines = [
+        f"IN THE HIGH COURT OF {rng.choice(COURTS)}",
+        f"Criminal Appeal No. {rng.randint(100, 9999)} of {rng.randint(2005, 2024)}",
+        "",
+        f"{petitioner} ... Appellant",
+        "versus",
+        f"{respondent} ... Respondent",
+        "",
+        "JUDGMENT",
+        "",
+    ]
+    for number in range(1, paragraphs + 1):
+        sentences = [
+            f"On {_date(rng)} at {rng.choice(CITIES)}, {rng.choice(spec['facts'])}.",
+            f"The case of the prosecution rests on {rng.choice(spec['sections'])}.",
+            rng.choice(FILLER),
+            f"The question for consideration is {rng.choice(spec['issues'])}.",
+        ]
+        rng.shuffle(sentences)
+        lines.append(f"{number}. " + " ".join(sentences[: rng.randint(2, 4)]))
+        lines.append("")
+    lines.append("HELD")
+    lines.append("")
+    lines.append(
+        f"{paragraphs + 1}. In view of {rng.choice(spec['sections'])}, we hold that {rng.choice(spec['issues'])} "
+        f"must be answered in favour of the {rng.choice(['appellant', 'respondent'])}. The appeal is accordingly disposed of."
+    )
+    return SyntheticCase(filename=f"synthetic_{topic}_{index:05d}.txt", topic=topic, text="\n".join(lines))
+
+
+def generate_corpus(count: int, seed: int = 7, paragraphs: int = 12) -> List[SyntheticCase]:
+    rng = random.Random(seed)
+    return [generate_case(rng, i, paragraphs=paragraphs) for i in range(count)]
+
+
+# --- PDF Rendering ---
+def _pdf_escape(line: str) -> str:
+    return line.encode("latin-1", errors="replace").decode("latin-1").replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def render_pdf(text: str, lines_per_page: int = 45, wrap: int = 95) -> bytes:
+    """Renders plain text as a minimal multi-page PDF (Helvetica, no dependencies)."""
+    wrapped: List[str] = []
+    for line in text.splitlines() or [""]:
+        while len(line) > wrap:
+            cut = line.rfind(" ", 0, wrap)
+            cut = cut if cut > 0 else wrap
+            wrapped.append(line[:cut])
+            line = line[cut:].lstrip()
+        wrapped.append(line)
+    pages = [wrapped[i:i + lines_per_page] for i in range(0, len(wrapped), lines_per_page)]
+
+    objects: List[bytes] = []
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i, page_lines in enumerate(pages):
+        content_id = page_ids[i] + 1
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        body = "BT /F1 10 Tf 14 TL 50 750 Td " + " ".join(f"({_pdf_escape(l)}) '" for l in page_lines) + " ET"
+        stream = body.encode("latin-1")
+        objects.append(b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + obj + b"\nendobj\n"
+    xref_at = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_at}\n%%EOF\n".encode()
+    return bytes(out)
@@ -0,0 +1,144 @@
+# backend/uploads.py
+#
+# Upload handling: the uploaded file is copied to a temp file in fixed-size
+# chunks while it is hashed and size-checked, then atomically renamed into
+# place. Text is extracted straight from the file on disk.
+#
+# Starlette parses (and spools) the whole multipart body before a handler
+# runs, so the check here only bounds what gets staged. Oversized requests
+# are refused before their body is read by main.reject_oversized_bodies,
+# from Content-Length; MULTIPART_OVERHEAD_BYTES is the slack allowed for the
+# multipart framing and other form fields.
+
+import hashlib
+import mmap
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+
+import startup
+from config import settings
+
+CHUNK_SIZE = 1024 * 1024
+TEMP_PREFIX = ".upload-"
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# Starlette 0.48 renamed the constant after RFC 9110 and deprecated the old
+# name; requirements.txt still pins 0.47, which only has the old one.
+HTTP_413_CONTENT_TOO_LARGE = getattr(status, "HTTP_413_CONTENT_TOO_LARGE", 413)
+
+
+def max_upload_bytes() -> int:
+    return settings.MAX_UPLOAD_MB * 1024 * 1024
+
+
+def body_too_large(content_length: Optional[str]) -> bool:
+    """True if a declared Content-Length cannot fit an upload under the size cap."""
+    try:
+        return int(content_length) > max_upload_bytes() + MULTIPART_OVERHEAD_BYTES
+    except (TypeError, ValueError):
+        return False  # Absent or chunked: stage_upload still enforces the cap.
+
+
+@dataclass
+class StagedUpload:
+    """An upload written to a temp file next to its final destination."""
+    temp_path: str
+    filename: str
+    content_type: Optional[str]
+    sha256: str
+    size: int
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Strips any directory components a client may have sent."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if not name or name in (".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid filename.")
+    return name
+
+
+async def stage_upload(upload_file: UploadFile, directory: str, max_bytes: Optional[int] = None) -> StagedUpload:
+    """
+    Copies an UploadFile to a temp file in `directory` in CHUNK_SIZE pieces,
+    hashing it on the fly. Raises 413 as soon as the size cap is exceeded;
+    by then the body has already been received and spooled by Starlette
+    (see the module comment for the early Content-Length check).
+    """
+    max_bytes = max_bytes if max_bytes is not None else max_upload_bytes()
+    filename = safe_filename(upload_file.filename)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=directory)
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = await upload_file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=HTTP_413_CONTENT_TOO_LARGE,
+                        detail=f"File is larger than the {max_bytes // (1024 * 1024)} MB limit.",
+                    )
+                hasher.update(chunk)
+                await run_in_threadpool(out.write, chunk)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return StagedUpload(temp_path, filename, upload_file.content_type, hasher.hexdigest(), size)
+
+
+def commit_upload(staged: StagedUpload, destination: str) -> str:
+    """Atomically moves a staged upload to its final path (same filesystem)."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.replace(staged.temp_path, destination)
+    except OSError as e:
+        staged.discard()
+        print(f"Error saving file to {destination}: {e}")
+        raise HTTPException(status_code=500, detail="Could not save file.")
+    return destination
+
+
+def content_type_for(filename: str) -> str:
+    return 'application/pdf' if filename.lower().endswith('.pdf') else 'text/plain'
+
+
+def extract_text_from_path(path: str, content_type: Optional[str]) -> str:
+    """Extracts text from a stored PDF (memory-mapped, not copied) or text file."""
+    text = ""
+    if content_type == 'application/pdf':
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return ""
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    pdf_reader = startup.pypdf().PdfReader(mapped)
+                    # Form feeds mark page boundaries (legal_chunker reports page numbers from them).
+                    text = "\f".join(page.extract_text() or "" for page in pdf_reader.pages)
+        except Exception as e:
+            print(f"Error reading PDF content from {path}: {e}")
+            return ""
+    elif content_type and 'text' in content_type:
+        with open(path, "rb") as f:
+            file_content = f.read()
+        try:
+            text = file_content.decode('utf-8')
+        except UnicodeDecodeError:
+            text = file_content.decode('latin-1')
+    return text
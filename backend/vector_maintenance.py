@@ -0,0 +1,453 @@
+# backend/vector_maintenance.py
+#
+# Maintenance for the per-user Chroma stores under user_chroma_dbs/, which
+# otherwise only grow:
+#   - reconcile: chunks of documents that no longer have a CaseFile row are
+#     deleted in batches, and chunks indexed from an older version of a file
+#     (their sha256 no longer matches the stored document) are re-indexed;
+#   - compact: the collection is copied, embeddings included, into a fresh one
+#     that takes its place, leaving deleted HNSW entries behind; the old
+#     collection's segment directory is removed and SQLite is vacuumed;
+#   - snapshot/restore: a consistent export of the collection (ids, texts and
+#     metadata as JSON lines, embeddings as .npy) that restores without
+#     re-embedding anything.
+# Every run reports store size and query latency before and after.
+#
+# Usage: python vector_maintenance.py run --user-id 3 [--no-compact] [--snapshot] [--dry-run]
+#        python vector_maintenance.py snapshot --user-id 3
+#        python vector_maintenance.py restore --user-id 3 --name 20250101T000000000000Z
+#        python vector_maintenance.py list --user-id 3
+# The CLI opens the store files directly, so run it with the server stopped;
+# while the server is up, use /admin/vector-store/..., which swaps the live
+# collection in place.
+#
+# A swap bumps the store's generation marker; main.get_user_collection checks
+# it on every call, so other workers reopen the new collection on their next
+# request. A request that already holds the old handle when it is dropped
+# (in this worker or another) fails once with a collection-not-found error.
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+import models, startup
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+USER_CHROMA_PATH = os.path.join(BACKEND_DIR, "user_chroma_dbs")
+SNAPSHOTS_PATH = os.path.join(BACKEND_DIR, "vector_snapshots")
+DELETE_BATCH_SIZE = 500
+COPY_BATCH_SIZE = 1000
+LATENCY_PROBES = 20
+RECORD_FIELDS = ["embeddings", "documents", "metadatas"]
+
+# Held while a user's collection is written, so snapshots are consistent and
+# a rebuild cannot lose a concurrent upload.
+_user_locks: Dict[int, threading.Lock] = {}
+_user_locks_guard = threading.Lock()
+
+
+def user_lock(user_id: int) -> threading.Lock:
+    with _user_locks_guard:
+        return _user_locks.setdefault(user_id, threading.Lock())
+
+
+def user_store_path(user_id: int) -> str:
+    return os.path.join(USER_CHROMA_PATH, f"user_{user_id}")
+
+
+def _generation_path(user_id: int) -> str:
+    return os.path.join(user_store_path(user_id), "generation")
+
+
+def generation(user_id: int) -> int:
+    """Changes whenever the user's collection is replaced; 0 before the first replacement."""
+    try:
+        return os.stat(_generation_path(user_id)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def _bump_generation(user_id: int) -> None:
+    path = _generation_path(user_id)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(datetime.now(timezone.utc).isoformat())
+    os.replace(path + ".tmp", path)
+
+
+def open_client(user_id: int):
+    """A client on the user's store; Chroma shares one system per path within a process."""
+    return startup.chromadb().PersistentClient(path=user_store_path(user_id))
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _iter_records(collection, include: List[str], batch_size: int = COPY_BATCH_SIZE) -> Iterator[dict]:
+    offset = 0
+    while True:
+        page = collection.get(include=include, limit=batch_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+# --- Reconcile ---
+async def load_expected(db: AsyncSession, user_id: int) -> Tuple[Set[str], Dict[str, str]]:
+    """Filenames that should be indexed (the user's CaseFile rows) and their stored content hashes."""
+    case_files = await db.execute(
+        select(models.CaseFile.filename).filter(models.CaseFile.owner_id == user_id).distinct()
+    )
+    documents = await db.execute(
+        select(models.StoredDocument.filename, models.StoredDocument.blob_sha256)
+        .filter(models.StoredDocument.owner_id == user_id)
+    )
+    return set(case_files.scalars().all()), dict(documents.all())
+
+
+def indexed_documents(collection) -> Dict[str, dict]:
+    """{filename: {"ids": [...], "sha256": {...}}} for every document in the collection."""
+    documents = defaultdict(lambda: {"ids": [], "sha256": set()})
+    for page in _iter_records(collection, ["metadatas"]):
+        for chunk_id, meta in zip(page["ids"], page["metadatas"]):
+            entry = documents[(meta or {}).get("filename")]
+            entry["ids"].append(chunk_id)
+            if (meta or {}).get("sha256"):
+                entry["sha256"].add(meta["sha256"])
+    return dict(documents)
+
+
+def _delete_ids(collection, ids: List[str]) -> None:
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        collection.delete(ids=ids[start:start + DELETE_BATCH_SIZE])
+
+
+def delete_document_chunks(collection, user_id: int, filename: str) -> None:
+    """Drops one document's chunks, e.g. when its case file is deleted."""
+    with user_lock(user_id):
+        if collection.count():
+            collection.delete(where={"filename": filename})
+
+
+def reconcile(collection, keep: Set[str], expected_sha256: Dict[str, str], dry_run: bool = False) -> dict:
+    """Deletes chunks of documents outside `keep` and of outdated versions of kept ones."""
+    documents = indexed_documents(collection)
+    orphans = sorted(f for f in documents if f not in keep)
+    # Chunks indexed before hashes were recorded carry no sha256 and are left alone.
+    stale = sorted(
+        f for f, doc in documents.items()
+        if f in keep and doc["sha256"] and expected_sha256.get(f) and doc["sha256"] != {expected_sha256[f]}
+    )
+    doomed = [chunk_id for f in orphans + stale for chunk_id in documents[f]["ids"]]
+    if not dry_run:
+        _delete_ids(collection, doomed)
+    return {
+        "orphaned_documents": len(orphans),
+        "orphaned_chunks": sum(len(documents[f]["ids"]) for f in orphans),
+        "stale_documents": stale,
+        "stale_chunks": sum(len(documents[f]["ids"]) for f in stale),
+    }
+
+
+# --- Compaction ---
+REBUILD_SUFFIX = "__rebuild"
+RETIRED_SUFFIX = "__retired"
+
+
+def _get_collection(client, name: str, embedding_function):
+    try:
+        return client.get_collection(name=name, embedding_function=embedding_function)
+    except Exception:
+        return None
+
+
+def _drop_collection(client, name: str) -> None:
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+
+
+def _replace_collection(client, old, user_id: int, embedding_function, fill: Callable, on_swap: Optional[Callable]):
+    """
+    Builds a new collection with `fill`, then swaps names: the old collection is
+    renamed aside, the new one takes its name, and only then is the old one
+    dropped. At every step the vectors exist complete under some name, and
+    recover_collection() finishes a swap a crash interrupted.
+    """
+    name = old.name
+    temp_name, retired_name = f"{name}{REBUILD_SUFFIX}", f"{name}{RETIRED_SUFFIX}"
+    # Left over from an interrupted run; the live collection still holds the data.
+    _drop_collection(client, temp_name)
+    _drop_collection(client, retired_name)
+    new = client.create_collection(name=temp_name, embedding_function=embedding_function, metadata=old.metadata or None)
+    fill(new)
+    old.modify(name=retired_name)  # Open handles keep working: they address the collection by id.
+    new.modify(name=name)
+    if on_swap is not None:
+        on_swap(new)
+    _bump_generation(user_id)
+    client.delete_collection(retired_name)
+    prune_segment_dirs(user_id)
+    return new
+
+
+def recover_collection(client, name: str, embedding_function):
+    """
+    After a crash mid-swap the live name can be missing. The rebuilt collection
+    is complete once the old one was renamed aside, so it wins; failing that
+    the retired one is put back. Returns the collection, or None if neither exists.
+    """
+    for suffix in (REBUILD_SUFFIX, RETIRED_SUFFIX):
+        survivor = _get_collection(client, f"{name}{suffix}", embedding_function)
+        if survivor is not None:
+            survivor.modify(name=name)
+            _drop_collection(client, f"{name}{RETIRED_SUFFIX}")
+            print(f"Recovered collection {name} from {name}{suffix} after an interrupted swap.")
+            return survivor
+    return None
+
+
+def prune_segment_dirs(user_id: int) -> List[str]:
+    """Removes HNSW segment directories that chroma.sqlite3 no longer references.
+
+    Chroma drops a deleted collection's rows but leaves its segment directory
+    on disk, so without this every compaction or restore grows the store.
+    """
+    store = user_store_path(user_id)
+    try:
+        with contextlib.closing(sqlite3.connect(os.path.join(store, "chroma.sqlite3"), timeout=5)) as conn:
+            live = {row[0] for row in conn.execute("SELECT id FROM segments")}
+    except sqlite3.Error as e:
+        print(f"Segment cleanup of {store} skipped: {e}")
+        return []
+    removed = []
+    for name in os.listdir(store):
+        path = os.path.join(store, name)
+        try:
+            uuid.UUID(name)
+        except ValueError:
+            continue  # chroma.sqlite3, the generation marker, anything not a segment.
+        if name in live or not os.path.isdir(path):
+            continue
+        try:
+            shutil.rmtree(path)
+            removed.append(name)
+        except OSError as e:
+            print(f"Could not remove segment directory {path}: {e}")
+    return removed
+
+
+def _copy_into(source, target) -> None:
+    for page in _iter_records(source, RECORD_FIELDS):
+        target.add(ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"])
+
+
+def vacuum(user_id: int) -> bool:
+    """Returns free SQLite pages to the filesystem; False if the database was busy."""
+    path = os.path.join(user_store_path(user_id), "chroma.sqlite3")
+    if not os.path.exists(path):
+        return False
+    try:
+        with contextlib.closing(sqlite3.connect(path, timeout=5)) as conn:
+            conn.execute("VACUUM")
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"VACUUM of {path} skipped: {e}")
+        return False
+
+
+def measure(collection, user_id: int) -> dict:
+    """Store size on disk and query latency, probing with embeddings already in the collection."""
+    count = collection.count()
+    report = {"chunks": count, "size_bytes": _dir_size(user_store_path(user_id)), "query_p50_ms": None, "query_p95_ms": None}
+    if count:
+        probes = collection.get(include=["embeddings"], limit=LATENCY_PROBES)["embeddings"]
+        timings = []
+        for embedding in probes:
+            start = time.perf_counter()
+            collection.query(query_embeddings=[list(map(float, embedding))], n_results=min(10, count))
+            timings.append((time.perf_counter() - start) * 1000)
+        report["query_p50_ms"] = round(float(np.percentile(timings, 50)), 2)
+        report["query_p95_ms"] = round(float(np.percentile(timings, 95)), 2)
+    return report
+
+
+# --- Snapshots ---
+def _snapshot_dir(user_id: int, name: str = "") -> str:
+    return os.path.join(SNAPSHOTS_PATH, f"user_{user_id}", name)
+
+
+def snapshot(collection, user_id: int) -> dict:
+    """Exports the collection; take user_lock(user_id) around it for a consistent copy."""
+    name = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    target = _snapshot_dir(user_id, name)
+    temp = target + ".tmp"
+    os.makedirs(temp)
+    blocks, chunks = [], 0
+    with open(os.path.join(temp, "records.jsonl"), "w", encoding="utf-8") as f:
+        for page in _iter_records(collection, RECORD_FIELDS):
+            for chunk_id, document, meta in zip(page["ids"], page["documents"], page["metadatas"]):
+                f.write(json.dumps({"id": chunk_id, "document": document, "metadata": meta}, ensure_ascii=False) + "\n")
+            blocks.append(np.asarray(page["embeddings"], dtype=np.float32))
+            chunks += len(page["ids"])
+    np.save(os.path.join(temp, "embeddings.npy"), np.concatenate(blocks) if blocks else np.zeros((0, 0), np.float32))
+    manifest = {"user_id": user_id, "collection": collection.name, "metadata": collection.metadata,
+                "chunks": chunks, "created_at": datetime.now(timezone.utc).isoformat()}
+    with open(os.path.join(temp, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(temp, target)
+    return {"name": name, "chunks": chunks, "size_bytes": _dir_size(target)}
+
+
+def list_snapshots(user_id: int) -> List[dict]:
+    root = _snapshot_dir(user_id)
+    if not os.path.isdir(root):
+        return []
+    snapshots = []
+    for name in sorted(os.listdir(root), reverse=True):
+        manifest_path = os.path.join(root, name, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            snapshots.append({"name": name, "chunks": manifest["chunks"], "created_at": manifest["created_at"],
+                              "size_bytes": _dir_size(os.path.join(root, name))})
+    return snapshots
+
+
+def _fill_from_snapshot(path: str) -> Callable:
+    def fill(target) -> None:
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        with open(os.path.join(path, "records.jsonl"), encoding="utf-8") as f:
+            batch, row = [], 0
+            for line in f:
+                batch.append(json.loads(line))
+                if len(batch) == COPY_BATCH_SIZE:
+                    _add_records(target, batch, embeddings[row:row + len(batch)])
+                    row += len(batch)
+                    batch = []
+            if batch:
+                _add_records(target, batch, embeddings[row:row + len(batch)])
+    return fill
+
+
+def _add_records(target, records: List[dict], embeddings: np.ndarray) -> None:
+    target.add(ids=[r["id"] for r in records], documents=[r["document"] for r in records],
+               metadatas=[r["metadata"] for r in records], embeddings=np.asarray(embeddings))
+
+
+def restore(client, collection, user_id: int, name: str, embedding_function, on_swap: Optional[Callable] = None) -> dict:
+    """Replaces the user's collection with a snapshot's contents."""
+    path = _snapshot_dir(user_id, name)
+    if not name or os.path.basename(os.path.normpath(path)) != name or not os.path.exists(os.path.join(path, "manifest.json")):
+        raise FileNotFoundError(f"No snapshot '{name}' for user {user_id}.")
+    with user_lock(user_id):
+        before = measure(collection, user_id)
+        collection = _replace_collection(client, collection, user_id, embedding_function, _fill_from_snapshot(path), on_swap)
+        vacuumed = vacuum(user_id)
+    return {"user_id": user_id, "snapshot": name, "before": before, "after": measure(collection, user_id), "vacuumed": vacuumed}
+
+
+# --- Full Run ---
+def run(
+    user_id: int,
+    client,
+    collection,
+    keep: Set[str],
+    expected_sha256: Dict[str, str],
+    embedding_function,
+    compact: bool = True,
+    take_snapshot: bool = False,
+    dry_run: bool = False,
+    reindex: Optional[Callable[[str], None]] = None,
+    on_swap: Optional[Callable] = None,
+) -> dict:
+    """Snapshot (optional, taken first as a rollback point), reconcile, compact, re-index stale documents."""
+    report = {"user_id": user_id, "dry_run": dry_run, "before": measure(collection, user_id)}
+    with user_lock(user_id):
+        if take_snapshot and not dry_run:
+            report["snapshot"] = snapshot(collection, user_id)
+        report["reconcile"] = reconcile(collection, keep, expected_sha256, dry_run)
+        if compact and not dry_run:
+            source = collection
+            collection = _replace_collection(client, source, user_id, embedding_function, lambda new: _copy_into(source, new), on_swap)
+            report["vacuumed"] = vacuum(user_id)
+    if reindex is not None and not dry_run:
+        for filename in report["reconcile"]["stale_documents"]:
+            reindex(filename)
+    report["after"] = measure(collection, user_id)
+    return report
+
+
+# --- CLI ---
+async def _cli(args) -> dict:
+    # The server's helpers open collections with the right embedding function and chunking.
+    import main, retrieval_settings, storage, uploads
+    from database import SessionLocal
+
+    user_id = args.user_id
+    if args.command == "list":
+        return {"user_id": user_id, "snapshots": list_snapshots(user_id)}
+    collection = main.get_user_collection(user_id)
+    if args.command == "snapshot":
+        with user_lock(user_id):
+            return {"user_id": user_id, "snapshot": snapshot(collection, user_id)}
+    swap = lambda new: main.replace_user_collection(user_id, new)
+    if args.command == "restore":
+        return restore(open_client(user_id), collection, user_id, args.name, main.user_embedding_function(), swap)
+
+    async with SessionLocal() as db:
+        keep, expected = await load_expected(db, user_id)
+        params = await retrieval_settings.get_params(db, user_id)
+
+    def reindex(filename: str) -> None:
+        sha256 = expected[filename]
+        text = uploads.extract_text_from_path(storage.blob_path(sha256), uploads.content_type_for(filename))
+        main.add_document_to_vector_store(user_id, text, filename, params, sha256)
+
+    return run(user_id, open_client(user_id), collection, keep, expected, main.user_embedding_function(),
+               compact=not args.no_compact, take_snapshot=args.snapshot, dry_run=args.dry_run,
+               reindex=reindex, on_swap=swap)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-user vector store maintenance.")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    run_parser = subcommands.add_parser("run", help="Reconcile against CaseFile rows and compact.")
+    run_parser.add_argument("--no-compact", action="store_true", help="Only reconcile.")
+    run_parser.add_argument("--snapshot", action="store_true", help="Snapshot before changing anything.")
+    run_parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted.")
+    restore_parser = subcommands.add_parser("restore", help="Replace the collection with a snapshot.")
+    restore_parser.add_argument("--name", required=True)
+    subcommands.add_parser("snapshot", help="Export the collection.")
+    subcommands.add_parser("list", help="List snapshots.")
+    for subparser in subcommands.choices.values():
+        subparser.add_argument("--user-id", type=int, required=True)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_cli(args)), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
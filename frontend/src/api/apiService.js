@@ -47,8 +47,39 @@ export const fetchCurrentUser = () => {
 };
 
 // --- Dashboard & File Endpoints ---
-export const fetchUserFiles = () => {
-  return api.get('/users/me/files');
+// Fetches one page of case files, newest first. `cursor` is the `next_cursor`
+// returned by the previous page; `fields` is an optional list of columns.
+export const fetchUserFiles = ({ limit = 20, cursor = null, q = '', fields = null } = {}) => {
+  const params = { limit };
+  if (cursor) params.cursor = cursor;
+  if (q) params.q = q;
+  if (fields && fields.length > 0) params.fields = fields.join(',');
+  return api.get('/users/me/files', { params });
+};
+
+// Incremental loader over the paginated file listing. Each call to
+// `loadMore()` fetches the next page and resolves to its items.
+export const createUserFilesLoader = ({ pageSize = 20, q = '', fields = null } = {}) => {
+  let cursor = null;
+  let done = false;
+  return {
+    get hasMore() {
+      return !done;
+    },
+    async loadMore() {
+      if (done) return [];
+      const response = await fetchUserFiles({ limit: pageSize, cursor, q, fields });
+      cursor = response.data.next_cursor;
+      done = !cursor;
+      return response.data.items;
+    },
+  };
+};
+
+// Stored result of a case file's last analysis. The server sends an ETag, so
+// the browser revalidates repeat visits with a 304 instead of a full body.
+export const fetchCaseFileAnalysis = (caseFileId) => {
+  return api.get(`/users/me/files/${caseFileId}/analysis`);
 };
 
 export const fetchUserStats = () => {
@@ -89,6 +120,10 @@ export const sendChatMessage = (chatPayload) => {
   return api.post('/chat', chatPayload);
 };
 
+export const deleteChatSession = (sessionId) => {
+  return api.delete(`/chat/sessions/${sessionId}`);
+};
+
 export const generateSuggestedQuestions = (summaryData) => {
   return api.post('/generate-suggested-questions', summaryData);
 };
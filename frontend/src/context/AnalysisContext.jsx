@@ -1,7 +1,7 @@
 // frontend/src/context/AnalysisContext.jsx
 
-import React, { createContext, useContext, useState, useMemo, useCallback, useEffect } from 'react';
-import { generateSuggestedQuestions, sendChatMessage } from '../api/apiService';
+import React, { createContext, useContext, useState, useMemo, useCallback, useEffect, useRef } from 'react';
+import { generateSuggestedQuestions, sendChatMessage, deleteChatSession } from '../api/apiService';
 
 export const AnalysisContext = createContext();
 
@@ -48,18 +48,32 @@ export const AnalysisProvider = ({ children }) => {
 
   const [isChatOpen, setIsChatOpen] = useState(false);
   const [chatHistory, setChatHistory] = useState(initialChatState);
-  const [chatContext, setChatContext] = useState(null);
+  // --- UPDATED: The chat is bound to a stored case file; the server retrieves relevant excerpts ---
+  const [chatCaseFileId, setChatCaseFileId] = useStateWithSessionStorage('chatCaseFileId', null);
+  // --- NEW: History is kept server-side; we only hold the session id ---
+  const chatSessionIdRef = useRef(null);
   // --- REVERT: Re-introduce the global loading state ---
   const [isChatLoading, setIsChatLoading] = useState(false);
 
-  const setAnalysisContext = useCallback(async (summaryResult, fullText) => {
+  const resetChatSession = useCallback(() => {
+    const sessionId = chatSessionIdRef.current;
+    chatSessionIdRef.current = null;
+    if (sessionId) {
+      deleteChatSession(sessionId).catch(error => console.error("Failed to clear chat session:", error));
+    }
+  }, []);
+
+  const setAnalysisContext = useCallback(async (summaryResult, caseFileId) => {
     setSummarizeResult(summaryResult);
-    setChatContext(fullText);
+    setChatCaseFileId(caseFileId ?? null);
+    resetChatSession();
     setIsChatOpen(false);
     
     try {
-      const response = await generateSuggestedQuestions(summaryResult);
-      const questions = response.data.questions;
+      // --- UPDATED: Questions come with the upload's analysis; the endpoint serves stored ones otherwise ---
+      const questions = summaryResult?.suggested_questions?.length
+        ? summaryResult.suggested_questions
+        : (await generateSuggestedQuestions(summaryResult)).data.questions;
       
       if (questions && questions.length > 0) {
         const suggestionsMessage = {
@@ -76,13 +90,14 @@ export const AnalysisProvider = ({ children }) => {
       console.error("Failed to fetch suggested questions:", error);
       setChatHistory(initialChatState);
     }
-  }, [setSummarizeResult]);
+  }, [setSummarizeResult, setChatCaseFileId, resetChatSession]);
 
   const startNewSummary = useCallback(() => {
     setSummarizeResult(null);
-    setChatContext(null);
+    setChatCaseFileId(null);
+    resetChatSession();
     setChatHistory(initialChatState);
-  }, [setSummarizeResult]);
+  }, [setSummarizeResult, setChatCaseFileId, resetChatSession]);
 
   const startNewPrecedentSearch = useCallback(() => {
     setPrecedentResult(null);
@@ -101,12 +116,13 @@ export const AnalysisProvider = ({ children }) => {
 
     try {
       const requestPayload = {
-        history: chatHistory, 
         question: question,
-        context: chatContext,
+        case_file_id: chatCaseFileId,
+        session_id: chatSessionIdRef.current,
       };
       const response = await sendChatMessage(requestPayload);
-      const { response_type, answer, page } = response.data;
+      const { response_type, answer, page, session_id } = response.data;
+      chatSessionIdRef.current = session_id ?? null;
 
       const aiMessage = { 
         role: 'model', 
@@ -122,7 +138,7 @@ export const AnalysisProvider = ({ children }) => {
     } finally {
       setIsChatLoading(false);
     }
-  }, [chatHistory, chatContext]);
+  }, [chatCaseFileId]);
 
   const value = useMemo(() => ({
     summarizeResult,
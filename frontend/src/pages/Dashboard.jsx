@@ -1,11 +1,12 @@
 // frontend/src/pages/Dashboard.jsx
 
-import React, { useState, useEffect } from 'react';
-import { Link } from 'react-router-dom';
+import React, { useState, useEffect, useRef } from 'react';
+import { Link, useNavigate } from 'react-router-dom';
 import { LuFileText, LuSearch, LuShieldCheck, LuClock } from 'react-icons/lu';
 import { useAuth } from '../context/AuthContext';
 // --- NEW: Import API service functions ---
-import { fetchUserFiles, fetchUserStats } from '../api/apiService';
+import { createUserFilesLoader, fetchUserStats, fetchCaseFileAnalysis } from '../api/apiService';
+import { useAnalysis } from '../context/AnalysisContext';
 import './Dashboard.css';
 
 function Dashboard() {
@@ -13,19 +14,26 @@ function Dashboard() {
   const [recentFiles, setRecentFiles] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
   const [stats, setStats] = useState({ casesAnalyzed: 0, precedentsFound: 0, contradictionsFlagged: 0 });
+  const [hasMoreFiles, setHasMoreFiles] = useState(false);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const filesLoader = useRef(null);
+  const navigate = useNavigate();
+  const { setAnalysisContext, setPrecedentResult } = useAnalysis();
 
   useEffect(() => {
     const fetchData = async () => {
       if (isAuthenticated) {
         setIsLoading(true);
+        filesLoader.current = createUserFilesLoader({ pageSize: 20, fields: ['id', 'filename', 'upload_date'] });
         try {
-          // --- UPDATED: Use the centralized API service ---
-          const [filesResponse, statsResponse] = await Promise.all([
-            fetchUserFiles(),
+          // --- UPDATED: Load only the first page of files ---
+          const [firstPage, statsResponse] = await Promise.all([
+            filesLoader.current.loadMore(),
             fetchUserStats()
           ]);
 
-          setRecentFiles(filesResponse.data);
+          setRecentFiles(firstPage);
+          setHasMoreFiles(filesLoader.current.hasMore);
           setStats(statsResponse.data);
 
         } catch (error) {
@@ -38,6 +46,38 @@ function Dashboard() {
     fetchData();
   }, [isAuthenticated]);
 
+  const loadMoreFiles = async () => {
+    if (!filesLoader.current || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      const nextPage = await filesLoader.current.loadMore();
+      setRecentFiles(prev => [...prev, ...nextPage]);
+      setHasMoreFiles(filesLoader.current.hasMore);
+    } catch (error) {
+      console.error("Error loading more files:", error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
+  // --- NEW: Reopen a past analysis from its stored result ---
+  const openFile = async (file) => {
+    try {
+      const { data } = await fetchCaseFileAnalysis(file.id);
+      const { precedent_data, ...summaryResult } = data.result;
+      setAnalysisContext(summaryResult, file.id);
+      if (data.kind === 'precedents') {
+        setPrecedentResult(precedent_data);
+        navigate('/precedents');
+      } else {
+        navigate('/summarize');
+      }
+    } catch (error) {
+      // 404: analyzed before results were stored, or by an older pipeline.
+      console.error("Error opening stored analysis:", error);
+    }
+  };
+
   const timeSince = (dateString) => {
     const date = new Date(dateString.replace(' ', 'T') + 'Z');
     const seconds = Math.floor((new Date() - date) / 1000);
@@ -99,21 +139,28 @@ function Dashboard() {
           <div className="recent-activity">
             <h2>Recent Activity</h2>
             {isLoading ? <p>Loading activity...</p> : (
-              <ul>
-                {recentFiles.length > 0 ? (
-                  recentFiles.map(file => (
-                    <li key={file.id}>
-                      <div className="activity-icon"><LuFileText /></div>
-                      <div className="activity-details">
-                        <span className="activity-name">{file.filename}</span>
-                        <span className="activity-time"><LuClock size={12} /> {timeSince(file.upload_date)}</span>
-                      </div>
-                    </li>
-                  ))
-                ) : (
-                  <p className="no-activity">No files analyzed yet. Get started using the Quick Actions.</p>
+              <>
+                <ul>
+                  {recentFiles.length > 0 ? (
+                    recentFiles.map(file => (
+                      <li key={file.id} onClick={() => openFile(file)} style={{ cursor: 'pointer' }}>
+                        <div className="activity-icon"><LuFileText /></div>
+                        <div className="activity-details">
+                          <span className="activity-name">{file.filename}</span>
+                          <span className="activity-time"><LuClock size={12} /> {timeSince(file.upload_date)}</span>
+                        </div>
+                      </li>
+                    ))
+                  ) : (
+                    <p className="no-activity">No files analyzed yet. Get started using the Quick Actions.</p>
+                  )}
+                </ul>
+                {hasMoreFiles && (
+                  <button className="load-more-button" onClick={loadMoreFiles} disabled={isLoadingMore}>
+                    {isLoadingMore ? 'Loading...' : 'Load more'}
+                  </button>
                 )}
-              </ul>
+              </>
             )}
           </div>
           <div className="quick-actions">
@@ -1,8 +1,8 @@
 // frontend/src/pages/EvidenceAnalysis.jsx
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAnalysis } from '../context/AnalysisContext';
-import { fetchUserFiles, analyzeContradictions } from '../api/apiService';
+import { createUserFilesLoader, analyzeContradictions } from '../api/apiService';
 import { LuFileCheck2, LuFlaskConical } from 'react-icons/lu';
 import Loader from '../components/LoadingSpinner';
 import './EvidenceAnalysis.css';
@@ -17,33 +17,62 @@ function EvidenceAnalysis() {
   // --- UPDATED: Get the new, specific context function ---
   const { evidenceResult, startNewEvidenceAnalysis, setEvidenceResult } = useAnalysis();
 
+  const [searchTerm, setSearchTerm] = useState('');
+  const [hasMoreFiles, setHasMoreFiles] = useState(false);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const filesLoader = useRef(null);
+
+  const mergeUniqueFiles = (existing, incoming) => {
+    const seenFilenames = new Set(existing.map(file => file.filename));
+    const merged = [...existing];
+    for (const file of incoming) {
+      if (!seenFilenames.has(file.filename)) {
+        seenFilenames.add(file.filename);
+        merged.push(file);
+      }
+    }
+    return merged;
+  };
+
   useEffect(() => {
     const loadFiles = async () => {
       setIsLoadingFiles(true);
       setError('');
+      // --- UPDATED: Load files page by page, filtered on the server ---
+      const loader = createUserFilesLoader({ pageSize: 50, q: searchTerm, fields: ['id', 'filename'] });
+      filesLoader.current = loader;
       try {
-        const response = await fetchUserFiles();
-        const data = response.data;
-        
-        const uniqueFiles = [];
-        const seenFilenames = new Set();
-        for (const file of data) {
-            if (!seenFilenames.has(file.filename)) {
-                seenFilenames.add(file.filename);
-                uniqueFiles.push(file);
-            }
-        }
-        setAllFiles(uniqueFiles);
-
+        const firstPage = await loader.loadMore();
+        if (filesLoader.current !== loader) return;
+        setAllFiles(mergeUniqueFiles([], firstPage));
+        setHasMoreFiles(loader.hasMore);
       } catch (err) {
         const errorMessage = err.response?.data?.detail || 'Could not fetch your case files.';
         setError(errorMessage);
       } finally {
-        setIsLoadingFiles(false);
+        if (filesLoader.current === loader) setIsLoadingFiles(false);
       }
     };
-    loadFiles();
-  }, []);
+    const timer = setTimeout(loadFiles, 300);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
+
+  const loadMoreFiles = async () => {
+    const loader = filesLoader.current;
+    if (!loader || isLoadingMore) return;
+    setIsLoadingMore(true);
+    try {
+      const nextPage = await loader.loadMore();
+      if (filesLoader.current !== loader) return;
+      setAllFiles(prev => mergeUniqueFiles(prev, nextPage));
+      setHasMoreFiles(loader.hasMore);
+    } catch (err) {
+      const errorMessage = err.response?.data?.detail || 'Could not fetch your case files.';
+      setError(errorMessage);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
 
   const handleFileSelectionChange = (filename) => {
     setSelectedFiles(prevSelected => {
@@ -83,9 +112,20 @@ function EvidenceAnalysis() {
       
       <div className="file-selection-container">
         <h3><LuFileCheck2 /> Select Files to Compare</h3>
+        <input
+          type="search"
+          className="file-search-input"
+          placeholder="Search files by name..."
+          value={searchTerm}
+          onChange={(e) => setSearchTerm(e.target.value)}
+        />
         {isLoadingFiles && <Loader text="Loading your files..." />}
         {!isLoadingFiles && allFiles.length === 0 && (
-          <p className="no-files-message">You haven't uploaded any case files yet. Please upload documents via the "Summarize Case" page first.</p>
+          <p className="no-files-message">
+            {searchTerm
+              ? 'No files match your search.'
+              : 'You haven\'t uploaded any case files yet. Please upload documents via the "Summarize Case" page first.'}
+          </p>
         )}
         {!isLoadingFiles && allFiles.length > 0 && (
           <div className="file-list">
@@ -102,6 +142,11 @@ function EvidenceAnalysis() {
             ))}
           </div>
         )}
+        {!isLoadingFiles && hasMoreFiles && (
+          <button className="load-more-button" onClick={loadMoreFiles} disabled={isLoadingMore}>
+            {isLoadingMore ? 'Loading...' : 'Load more files'}
+          </button>
+        )}
       </div>
 
       <button 
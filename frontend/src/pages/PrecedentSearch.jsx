@@ -8,7 +8,6 @@ import './PrecedentSearch.css';
 
 function PrecedentSearch() {
   const [selectedFile, setSelectedFile] = useState(null);
-  const [fullText, setFullText] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState('');
   const fileInputRef = useRef(null);
@@ -29,12 +28,6 @@ function PrecedentSearch() {
       // --- FIX: Use the new, specific context function ---
       startNewPrecedentSearch();
       setError('');
-      
-      const reader = new FileReader();
-      reader.onload = (e) => {
-        setFullText(e.target.result);
-      };
-      reader.readAsText(file);
 
     } else {
       setError("Please select a valid PDF or TXT file.");
@@ -60,10 +53,12 @@ function PrecedentSearch() {
       const summaryResultForContext = {
         filename: combinedData.filename,
         summary_data: combinedData.summary_data,
-        entity_data: combinedData.entity_data
+        entity_data: combinedData.entity_data,
+        suggested_questions: combinedData.suggested_questions,
+        case_file_id: combinedData.case_file_id
       };
       
-      await setAnalysisContext(summaryResultForContext, fullText);
+      await setAnalysisContext(summaryResultForContext, combinedData.case_file_id);
 
       setPrecedentResult(combinedData.precedent_data);
 
@@ -73,7 +73,6 @@ const KeyEntitiesPanel = ({ entities, onEntityHover, onEntityClick }) => {
 
 function Summarize() {
   const [selectedFile, setSelectedFile] = useState(null);
-  const [fullText, setFullText] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState('');
   const [activeEntity, setActiveEntity] = useState(null);
@@ -91,12 +90,6 @@ function Summarize() {
       // --- FIX: Use the new, specific context function ---
       startNewSummary();
       setError('');
-      
-      const reader = new FileReader();
-      reader.onload = (e) => {
-        setFullText(e.target.result);
-      };
-      reader.readAsText(file);
 
     } else {
       setError("Please select a valid PDF or TXT file.");
@@ -117,7 +110,7 @@ function Summarize() {
 
     try {
       const response = await summarizeFile(selectedFile);
-      setAnalysisContext(response.data, fullText);
+      setAnalysisContext(response.data, response.data.case_file_id);
     } catch (err) {
       const errorMessage = err.response?.data?.detail || "Failed to generate brief.";
       setError(errorMessage);